@@ -1,12 +1,25 @@
-from agno.agent import Agent
-from agno.models.groq import Groq
-from agno.tools.duckduckgo import DuckDuckGoTools
-from agno.tools.yfinance import YFinanceTools
-from textwrap import dedent
-from agno.tools.youtube import YouTubeTools
-from agno.tools.newspaper4k import Newspaper4kTools
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Tuple
+import httpx
+import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from deadlines import DeadlineTransport, tool_timeouts
+from metrics import tool_metrics_hook
+from ratelimit import RateLimitedTransport, RateLimitScheduler
+from registry import AgentRegistry, AgentSpec
+from tool_cache import tool_cache
+
+# Agno, the models and the toolkits (pandas/yfinance, newspaper/nltk, ...) are imported
+# when the first agent is built, not when the app starts
+if TYPE_CHECKING:
+    from agno.agent import Agent
+    from agno.models.groq import Groq
+    from agno.tools import Toolkit
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -18,239 +31,233 @@ if not groq_api_key:
 
 print(f"API Key loaded: {groq_api_key[:10]}..." if groq_api_key else "No API key found")
 
-# Regular general agent
-general_agent = Agent(
-    model=Groq(id="llama-3.1-8b-instant", api_key=groq_api_key),
-    description="General Chat Agent",
-    instructions="You are a helpful AI assistant. Answer questions and help with various tasks.",
-    markdown=True,
-    show_tool_calls=True,
-)
-
-# Vision-enabled general agent for image processing
-# Using Groq's vision model - llama-3.2-11b-vision-preview or llava-v1.5-7b-4096-preview
-vision_agent = Agent(
-    model=Groq(id="meta-llama/llama-4-scout-17b-16e-instruct", api_key=groq_api_key),  # Vision-capable model
-    description="Vision-enabled General Chat Agent",
-    instructions=dedent("""\
-        You are a helpful AI assistant with vision capabilities. You can see and analyze images.
-
-        When users upload images:
-        - Carefully examine the image content
-        - Describe what you see in detail
-        - Answer questions about the image
-        - Identify objects, text, people, scenes, etc.
-        - Provide helpful analysis and insights
-
-        Be thorough and accurate in your visual analysis.
-    """),
-    markdown=True,
-    show_tool_calls=True,
-)
+# Every chat completion is scheduled against the per-key, per-model RPM/TPM limits
+groq_rate_limiter = RateLimitScheduler.from_env(groq_api_key)
 
-web_agent = Agent(
-    model=Groq(id="llama-3.1-8b-instant", api_key=groq_api_key),
-    description="Web Research Agent",
-    tools=[DuckDuckGoTools()],
-    instructions="Always cite sources",
-    markdown=True,
-    show_tool_calls=True,
-)
-
-finance_agent = Agent(
-    model=Groq(id="llama-3.3-70b-versatile", api_key=groq_api_key),
-    tools=[
-        YFinanceTools(
-            stock_price=True,
-            analyst_recommendations=True,
-            stock_fundamentals=True,
-            historical_prices=True,
-            company_info=True,
-            company_news=True,
+# One keep-alive connection pool shared by every Groq client; calls of cancelled or
+# timed-out requests are refused or cut short before they reach the rate limiter
+groq_http_client = httpx.Client(
+    transport=DeadlineTransport(
+        RateLimitedTransport(
+            httpx.HTTPTransport(limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)),
+            groq_rate_limiter,
         )
-    ],
-    instructions=dedent("""\
-        You are a seasoned Wall Street analyst with deep expertise in market analysis! 📊
-
-        Follow these steps for comprehensive financial analysis:
-        1. Market Overview
-           - Latest stock price
-           - 52-week high and low
-        2. Financial Deep Dive
-           - Key metrics (P/E, Market Cap, EPS)
-        3. Professional Insights
-           - Analyst recommendations breakdown
-           - Recent rating changes
-
-        4. Market Context
-           - Industry trends and positioning
-           - Competitive analysis
-           - Market sentiment indicators
-
-        Your reporting style:
-        - Begin with an executive summary
-        - Use tables for data presentation
-        - Include clear section headers
-        - Add emoji indicators for trends (📈 📉)
-        - Highlight key insights with bullet points
-        - Compare metrics to industry averages
-        - Include technical term explanations
-        - End with a forward-looking analysis
-
-        Risk Disclosure:
-        - Always highlight potential risk factors
-        - Note market uncertainties
-        - Mention relevant regulatory concerns
-    """),
-    add_datetime_to_instructions=True,
-    show_tool_calls=True,
-    markdown=True,
+    ),
+    timeout=httpx.Timeout(60.0, connect=10.0),
 )
 
-youtube_agent = Agent(
-    model=Groq(id="llama-3.3-70b-versatile", api_key=groq_api_key),
-    tools=[YouTubeTools(), DuckDuckGoTools()],
-    instructions=dedent("""\
-        You are an expert YouTube content analyst with a keen eye for detail! 🎓
-        Follow these steps for comprehensive video analysis:
-        1. Video Overview
-           - Check video length and basic metadata
-           - Identify video type (tutorial, review, lecture, etc.)
-           - Note the content structure
-        2. Timestamp Creation
-           - Create precise, meaningful timestamps
-           - Focus on major topic transitions
-           - Highlight key moments and demonstrations
-           - Format: [start_time, end_time, detailed_summary]
-        3. Content Organization
-           - Group related segments
-           - Identify main themes
-           - Track topic progression
-
-        Your analysis style:
-        - Begin with a video overview
-        - Use clear, descriptive segment titles
-        - Include relevant emojis for content types:
-          📚 Educational
-          💻 Technical
-          🎮 Gaming
-          📱 Tech Review
-          🎨 Creative
-        - Highlight key learning points
-        - Note practical demonstrations
-        - Mark important references
-
-        Quality Guidelines:
-        - Verify timestamp accuracy
-        - Avoid timestamp hallucination
-        - Ensure comprehensive coverage
-        - Maintain consistent detail level
-        - Focus on valuable content markers
-    """),
-    add_datetime_to_instructions=True,
-    markdown=True,
-)
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+def build_duckduckgo_tools() -> "Toolkit":
+    from agno.tools.duckduckgo import DuckDuckGoTools
+    return DuckDuckGoTools()
+
+def build_yfinance_tools() -> "Toolkit":
+    from agno.tools.yfinance import YFinanceTools
+    return YFinanceTools(
+        stock_price=True,
+        analyst_recommendations=True,
+        stock_fundamentals=True,
+        historical_prices=True,
+        company_info=True,
+        company_news=True,
+    )
+
+def build_youtube_tools() -> "Toolkit":
+    from agno.tools.youtube import YouTubeTools
+    return YouTubeTools()
+
+def build_newspaper_tools() -> "Toolkit":
+    from agno.tools.newspaper4k import Newspaper4kTools
+    return Newspaper4kTools()
+
+# Toolkit builders keyed by name; each toolkit is built once, on first use
+TOOLKIT_BUILDERS: Dict[str, Callable[[], "Toolkit"]] = {
+    "duckduckgo": build_duckduckgo_tools,
+    "yfinance": build_yfinance_tools,
+    "youtube": build_youtube_tools,
+    "newspaper": build_newspaper_tools,
+}
+
+_toolkits: Dict[str, "Toolkit"] = {}
+_toolkits_lock = threading.Lock()
+
+def get_toolkit(name: str) -> "Toolkit":
+    """
+    Return the shared instance of a toolkit, importing and building it on first use.
 
-research_agent = Agent(
-    model=Groq(id="llama-3.3-70b-versatile", api_key=groq_api_key),
-    tools=[DuckDuckGoTools(), Newspaper4kTools()],
-    description=dedent("""\
-        You are an elite investigative journalist with decades of experience at the New York Times.
-        Your expertise encompasses: 📰
-
-        - Deep investigative research and analysis
-        - Meticulous fact-checking and source verification
-        - Compelling narrative construction
-        - Data-driven reporting and visualization
-        - Expert interview synthesis
-        - Trend analysis and future predictions
-        - Complex topic simplification
-        - Ethical journalism practices
-        - Balanced perspective presentation
-        - Global context integration\
-    """),
-    instructions=dedent("""\
-        1. Research Phase 🔍
-           - Search for 10+ authoritative sources on the topic
-           - Prioritize recent publications and expert opinions
-           - Identify key stakeholders and perspectives
-
-        2. Analysis Phase 📊
-           - Extract and verify critical information
-           - Cross-reference facts across multiple sources
-           - Identify emerging patterns and trends
-           - Evaluate conflicting viewpoints
-
-        3. Writing Phase ✍️
-           - Craft an attention-grabbing headline
-           - Structure content in NYT style
-           - Include relevant quotes and statistics
-           - Maintain objectivity and balance
-           - Explain complex concepts clearly
-
-        4. Quality Control ✓
-           - Verify all facts and attributions
-           - Ensure narrative flow and readability
-           - Add context where necessary
-           - Include future implications
-    """),
-    expected_output=dedent("""\
-        # {Compelling Headline} 📰
-
-        ## Executive Summary
-        {Concise overview of key findings and significance}
-
-        ## Background & Context
-        {Historical context and importance}
-        {Current landscape overview}
-
-        ## Key Findings
-        {Main discoveries and analysis}
-        {Expert insights and quotes}
-        {Statistical evidence}
-
-        ## Impact Analysis
-        {Current implications}
-        {Stakeholder perspectives}
-        {Industry/societal effects}
-
-        ## Future Outlook
-        {Emerging trends}
-        {Expert predictions}
-        {Potential challenges and opportunities}
-
-        ## Expert Insights
-        {Notable quotes and analysis from industry leaders}
-        {Contrasting viewpoints}
-
-        ## Sources & Methodology
-        {List of primary sources with key contributions}
-        {Research methodology overview}
-
-        ---
-        Research conducted by AI Investigative Journalist
-        New York Times Style Report
-        Published: {current_date}
-        Last Updated: {current_time}\
-    """),
-    markdown=True,
-    show_tool_calls=True,
-    add_datetime_to_instructions=True,
-)
+    Toolkits are stateless, so a single instance of each is shared by all agents.
+    """
+    with _toolkits_lock:
+        toolkit = _toolkits.get(name)
+        if toolkit is None:
+            start = time.perf_counter()
+            toolkit = TOOLKIT_BUILDERS[name]()
+            # Serve repeated tool calls (same tool, same arguments) from the shared tool cache
+            if TOOL_CACHE_ENABLED:
+                tool_cache.wrap_toolkit(toolkit)
+            _toolkits[name] = toolkit
+            logger.info(f"Loaded {name} toolkit in {time.perf_counter() - start:.2f}s")
+        return toolkit
+
+def groq_model(model_id: str) -> "Groq":
+    """Create a Groq model that uses the shared HTTP connection pool."""
+    from agno.models.groq import Groq
+    return Groq(id=model_id, api_key=groq_api_key, http_client=groq_http_client)
+
+def groq_client(**kwargs):
+    """Create a plain Groq SDK client on the shared connection pool, for calls made outside agents."""
+    from groq import Groq as GroqClient
+    return GroqClient(api_key=groq_api_key, http_client=groq_http_client, **kwargs)
+
+def new_agent(**kwargs) -> "Agent":
+    from agno.agent import Agent
+    return Agent(**kwargs)
+
+def build_agent(spec: AgentSpec) -> "Agent":
+    """Build an agent from its registry spec; toolkits are shared and built on first use."""
+    return new_agent(
+        model=groq_model(spec.model),
+        description=spec.description,
+        instructions=spec.instructions,
+        expected_output=spec.expected_output,
+        tools=[get_toolkit(name) for name in spec.tools] or None,
+        tool_hooks=[tool_metrics_hook, tool_timeouts.hook] if spec.tools else None,
+        markdown=spec.markdown,
+        show_tool_calls=spec.show_tool_calls,
+        add_datetime_to_instructions=spec.add_datetime_to_instructions,
+    )
+
+# Agent definitions live in agents.toml (or AGENT_CONFIG) and can be reloaded at runtime
+agent_registry = AgentRegistry.from_env(known_tools=TOOLKIT_BUILDERS)
+
+class AgentPool:
+    """
+    Pool of agent instances keyed by (agent type, variant).
 
-linkedin_agent = Agent(
-    model=Groq(id="llama-3.3-70b-versatile", api_key=groq_api_key),
-    description="LinkedIn Post Generator Agent",
-    tools=[DuckDuckGoTools()],
-    instructions="Combine research and generate LinkedIn-ready summaries.",
-    markdown=True,
-    show_tool_calls=True,
-)
+    Each checkout gets an agent that no other in-flight run is using, so run state and
+    memory are never shared between concurrent requests. Agents are reset and returned
+    to the pool afterwards, keeping their processed tools, model client and instructions.
+    When the registry is reloaded the pool is invalidated, and agents built from the old
+    definitions are dropped instead of being returned.
+    """
+
+    def __init__(self, registry: AgentRegistry, builder: Callable[[AgentSpec], "Agent"] = build_agent, max_idle: int = 8):
+        self.registry = registry
+        self.builder = builder
+        self.max_idle = max_idle
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str], List["Agent"]] = {}
+        self._in_use: Dict[Tuple[str, str], int] = {}
+        self._created: Dict[Tuple[str, str], int] = {}
+        self._checkouts = 0
+        self._checkout_seconds_total = 0.0
+        self._checkout_seconds_max = 0.0
+
+    @contextmanager
+    def checkout(self, agent_type: str, use_vision: bool = False, fast: bool = False):
+        """Borrow an isolated agent for the duration of a run."""
+        spec = self.registry.resolve(agent_type, use_vision, fast)
+        key = spec.key
+        start = time.perf_counter()
+
+        with self._lock:
+            generation = self._generation
+            idle = self._idle.setdefault(key, [])
+            agent = idle.pop() if idle else None
+
+        if agent is None:
+            agent = self.builder(spec)
+            with self._lock:
+                self._created[key] = self._created.get(key, 0) + 1
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            self._checkouts += 1
+            self._checkout_seconds_total += elapsed
+            self._checkout_seconds_max = max(self._checkout_seconds_max, elapsed)
+
+        try:
+            yield agent
+        finally:
+            self._reset(agent)
+            with self._lock:
+                self._in_use[key] -= 1
+                idle = self._idle.setdefault(key, [])
+                if generation == self._generation and len(idle) < self.max_idle:
+                    idle.append(agent)
+
+    def invalidate(self) -> None:
+        """Drop idle agents and retire checked-out ones so new definitions take effect."""
+        with self._lock:
+            self._generation += 1
+            self._idle.clear()
+
+    def warm_up(self, entries: Iterable[str]) -> None:
+        """
+        Build one agent (and its toolkits) for each entry ahead of the first request.
+
+        Entries are agent types, with a `:vision` or `:fast` suffix for a variant, e.g. `general:vision`.
+        """
+        for entry in entries:
+            agent_type, _, variant = entry.strip().partition(":")
+            if not agent_type:
+                continue
+            start = time.perf_counter()
+            try:
+                with self.checkout(agent_type, variant == "vision", variant == "fast"):
+                    pass
+            except Exception as e:
+                logger.warning(f"Warm-up of {entry} failed: {e}")
+                continue
+            logger.info(f"Warmed up {entry} in {time.perf_counter() - start:.2f}s")
+
+    def model_id(self, agent_type: str, use_vision: bool = False, fast: bool = False) -> str:
+        """Return the model id used for an agent type without building it."""
+        return self.registry.resolve(agent_type, use_vision, fast).model
+
+    @staticmethod
+    def _reset(agent: "Agent") -> None:
+        """Drop per-run and per-session state so the next borrower starts clean."""
+        agent.reset_run_state()
+        agent.reset_session()
+        agent.memory = None
+        agent.session_id = None
+        # Agent.run(stream=True) leaves streaming switched on for later runs of the same instance
+        agent.stream = None
+        agent.stream_intermediate_steps = False
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            keys = set(self._created) | set(self._idle)
+            return {
+                "max_idle": self.max_idle,
+                "generation": self._generation,
+                "checkouts": self._checkouts,
+                "checkout_ms_avg": round(1000 * self._checkout_seconds_total / self._checkouts, 3) if self._checkouts else 0.0,
+                "checkout_ms_max": round(1000 * self._checkout_seconds_max, 3),
+                "agents": {
+                    f"{agent_type}{'' if variant == 'default' else ':' + variant}": {
+                        "idle": len(self._idle.get((agent_type, variant), [])),
+                        "in_use": self._in_use.get((agent_type, variant), 0),
+                        "created": self._created.get((agent_type, variant), 0),
+                    }
+                    for agent_type, variant in sorted(keys)
+                },
+            }
+
+agent_pool = AgentPool(agent_registry, max_idle=int(os.getenv("AGENT_POOL_MAX_IDLE", "8")))
+agent_registry.subscribe(lambda registry: agent_pool.invalidate())
 
 # Agent selection function
 def get_agent(agent_type: str, use_vision: bool = False):
     """
-    Get the appropriate agent based on type and vision requirements.
+    Build a new, unpooled agent based on type and vision requirements.
+
+    Prefer `agent_pool.checkout(...)` for request handling; this is kept for scripts and
+    one-off use.
 
     Args:
         agent_type (str): The type of agent requested
@@ -260,20 +267,4 @@ def get_agent(agent_type: str, use_vision: bool = False):
         Agent: The appropriate agent instance
     """
     print(f"Getting agent: type={agent_type}, use_vision={use_vision}")
-
-    if agent_type == "general":
-        agent = vision_agent if use_vision else general_agent
-        print(f"Selected general agent: {agent.model.id if hasattr(agent.model, 'id') else 'unknown'}")
-        return agent
-    elif agent_type == "web":
-        return web_agent
-    elif agent_type == "youtube":
-        return youtube_agent
-    elif agent_type == "articles":
-        return research_agent
-    elif agent_type == "linkedin":
-        return linkedin_agent
-    elif agent_type == "finance":
-        return finance_agent
-    else:
-        return general_agent  # Default to general agent
\ No newline at end of file
+    return build_agent(agent_registry.resolve(agent_type, use_vision))
@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence
+
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".ico": "image/x-icon",
+}
+COMPRESSIBLE = (".html", ".css", ".js", ".svg")
+
+# Preferred first when the client accepts several
+ENCODINGS = ("br", "gzip")
+
+
+@dataclass
+class Asset:
+    name: str
+    content_type: str
+    digest: str
+    bodies: Dict[str, bytes]  # "identity", "gzip" and (with brotli installed) "br"
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Map each coding in an Accept-Encoding header to its q-value."""
+    accepted: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class StaticAssets:
+    """
+    The web client's files, read and compressed once at startup and served from memory.
+
+    Only the listed files are served. Each is kept as-is, gzipped and (when the `brotli`
+    package is installed) brotli-compressed, and the smallest encoding the client accepts
+    is sent. Responses carry an ETag per encoding, so revalidation returns 304 without a
+    body. The index page refers to the other assets with a `?v=<content hash>` suffix;
+    requests with the current hash are cacheable for `max_age`, while the index itself and
+    unversioned requests are revalidated every time.
+    """
+
+    def __init__(self, directory: str = ".", index: str = "index.html", files: Sequence[str] = ("styles.css",), max_age: int = 31536000):
+        self.directory = directory
+        self.max_age = max_age
+        self._brotli = self._load_brotli()
+        self.assets: Dict[str, Asset] = {name: self._load(name) for name in files}
+
+        with open(os.path.join(directory, index), "rb") as f:
+            html = f.read().decode("utf-8")
+        for asset in self.assets.values():
+            html = html.replace(f'"/static/{asset.name}"', f'"/static/{asset.name}?v={asset.digest}"')
+        self.index = self._build(index, html.encode("utf-8"))
+
+        logger.info(
+            f"Static assets loaded: {', '.join([index, *files])} "
+            f"(encodings: {', '.join(e for e in ENCODINGS if e in self.index.bodies)})"
+        )
+
+    @classmethod
+    def from_env(cls) -> "StaticAssets":
+        return cls(
+            directory=os.getenv("STATIC_DIR", "."),
+            max_age=int(os.getenv("STATIC_MAX_AGE", "31536000")),
+        )
+
+    @staticmethod
+    def _load_brotli():
+        try:
+            import brotli
+
+            return brotli
+        except ImportError:
+            logger.info("brotli is not installed, static assets are served gzipped only")
+            return None
+
+    def _load(self, name: str) -> Asset:
+        with open(os.path.join(self.directory, name), "rb") as f:
+            return self._build(name, f.read())
+
+    def _build(self, name: str, data: bytes) -> Asset:
+        extension = os.path.splitext(name)[1].lower()
+        bodies = {"identity": data}
+        if extension in COMPRESSIBLE:
+            bodies["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+            if self._brotli is not None:
+                bodies["br"] = self._brotli.compress(data, quality=11)
+        return Asset(
+            name=name,
+            content_type=CONTENT_TYPES.get(extension, "application/octet-stream"),
+            digest=hashlib.sha256(data).hexdigest()[:16],
+            bodies=bodies,
+        )
+
+    @staticmethod
+    def negotiate(asset: Asset, accept_encoding: Optional[str]) -> str:
+        accepted = parse_accept_encoding(accept_encoding)
+        candidates = [e for e in ENCODINGS if e in asset.bodies and accepted.get(e, accepted.get("*", 0.0)) > 0]
+        return min(candidates, key=lambda e: len(asset.bodies[e]), default="identity")
+
+    def respond(
+        self,
+        asset: Asset,
+        accept_encoding: Optional[str] = None,
+        if_none_match: Optional[str] = None,
+        version: Optional[str] = None,
+        head: bool = False,
+    ) -> Response:
+        encoding = self.negotiate(asset, accept_encoding)
+        if asset is not self.index and version == asset.digest:
+            cache_control = f"public, max-age={self.max_age}, immutable"
+        else:
+            cache_control = "no-cache"
+        headers = {"ETag": asset.etag(encoding), "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or any(asset.etag(e) in tags for e in asset.bodies):
+                return Response(status_code=304, headers=headers)
+
+        body = asset.bodies[encoding]
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if head:
+            headers["Content-Length"] = str(len(body))
+            return Response(status_code=200, headers=headers, media_type=asset.content_type)
+        return Response(content=body, headers=headers, media_type=asset.content_type)
+
+    def get(self, name: str) -> Optional[Asset]:
+        return self.assets.get(name)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            asset.name: {encoding: len(body) for encoding, body in asset.bodies.items()}
+            for asset in [self.index, *self.assets.values()]
+        }
@@ -0,0 +1,258 @@
+"""
+Offline benchmark for /agent/ask.
+
+Starts the stub Groq server (benchmarks/stub_groq.py) in a subprocess, points the app at
+it with GROQ_BASE_URL, swaps the web/finance/YouTube/article toolkits for stubs and drives
+/agent/ask in-process for every agent type, payload scenario and concurrency level. Real
+agents, tool calling, sessions, caches and image processing all run; only the network
+is replaced. Nothing leaves the machine, so results are comparable between commits.
+
+Scenarios:
+    text      a short question with no history
+    history   a legacy client request carrying 20 prior messages
+    image     a 1600x1200 photo for the vision agent (general only)
+
+Usage:
+    python benchmarks/benchmark.py --output before.json
+    python benchmarks/benchmark.py --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+AGENT_TYPES = ["general", "web", "youtube", "articles", "linkedin", "finance"]
+SCENARIOS = ["text", "history", "image"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_server(args) -> subprocess.Popen:
+    import httpx
+
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "stub_groq.py"),
+        "--port", str(port),
+        "--ttft", str(args.ttft),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--output-tokens", str(args.output_tokens),
+    ])
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{base_url}/health", timeout=0.5).raise_for_status()
+            os.environ["GROQ_BASE_URL"] = base_url
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Stub Groq server did not start")
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def sample_image() -> bytes:
+    from PIL import Image
+
+    # Noise compresses badly, so this is close to a real phone photo in size
+    img = Image.frombytes("RGB", (1600, 1200), os.urandom(1600 * 1200 * 3))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def build_payload(agent_type: str, scenario: str, i: int, image: bytes) -> Dict[str, Any]:
+    query = f"Benchmark question {i} for {agent_type}: what changed this week?"
+    payload = {"agent": agent_type, "query": query, "cache_control": "no-store"}
+
+    if scenario == "history":
+        messages = []
+        for turn in range(20):
+            role = "user" if turn % 2 == 0 else "assistant"
+            messages.append({"role": role, "content": f"Earlier message {turn}. " * 30, "timestamp": "2025-01-01T00:00:00Z"})
+        messages.append({"role": "user", "content": query, "timestamp": "2025-01-01T00:00:00Z"})
+        payload["messages"] = messages
+    elif scenario == "image":
+        # Trailing bytes after the JPEG end marker are ignored by decoders but make every
+        # upload unique, so the image cache does not hide the processing cost
+        data = base64.b64encode(image + f"request-{i}".encode()).decode("ascii")
+        payload["useVisionModel"] = True
+        payload["files"] = [{"type": "image", "name": f"photo-{i}.jpg", "data": data, "mimeType": "image/jpeg"}]
+    return payload
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+async def run_level(client, agent_type: str, scenario: str, concurrency: int, total: int, image: bytes, offset: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+
+    async def one(i: int):
+        payload = build_payload(agent_type, scenario, offset + i, image)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/agent/ask", json=payload)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "agent": agent_type,
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+        "errors": total - statuses.get(200, 0),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    line = (
+        f"{result['agent']:>9} {result['scenario']:>8} {result['concurrency']:>4} "
+        f"{result['throughput_rps']:>8.2f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+        f"{result['p99_ms']:>8.1f} {result['errors']:>6} {result['rss_mb']:>8.1f}"
+    )
+    if baseline:
+        def delta(key):
+            before = baseline[key]
+            return f"{(result[key] - before) / before * 100:+.1f}%" if before else "n/a"
+        line += f"   rps {delta('throughput_rps'):>7}  p95 {delta('p95_ms'):>7}"
+    print(line, flush=True)
+
+
+async def main_async(args) -> Dict[str, Any]:
+    from stub_tools import install_stub_tools
+
+    install_stub_tools(latency=args.tool_latency)
+
+    import httpx
+    import main
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            for result in json.load(f)["results"]:
+                baseline[(result["agent"], result["scenario"], result["concurrency"])] = result
+
+    image = sample_image()
+    results = []
+    offset = 0
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        print(f"{'agent':>9} {'scenario':>8} {'conc':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6} {'rss MB':>8}")
+        for agent_type in args.agents:
+            for scenario in args.scenarios:
+                if scenario == "image" and agent_type != "general":
+                    continue
+                for concurrency in args.concurrency:
+                    result = await run_level(client, agent_type, scenario, concurrency, args.requests, image, offset)
+                    offset += args.requests
+                    results.append(result)
+                    print_result(result, baseline.get((agent_type, scenario, concurrency)))
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {
+                "requests": args.requests,
+                "ttft": args.ttft,
+                "tokens_per_second": args.tokens_per_second,
+                "output_tokens": args.output_tokens,
+                "tool_latency": args.tool_latency,
+            },
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "results": results,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", nargs="+", default=AGENT_TYPES, choices=AGENT_TYPES)
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--requests", type=int, default=16, help="Requests per agent/scenario/concurrency level")
+    parser.add_argument("--ttft", type=float, default=0.1, help="Stub model time to first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=1000.0, help="Stub model output token rate")
+    parser.add_argument("--output-tokens", type=int, default=100, help="Tokens in each stub text answer")
+    parser.add_argument("--tool-latency", type=float, default=0.2, help="Seconds each stub tool call takes")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare against")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import logging
+
+    args = parse_args()
+    os.environ.setdefault("GROQ_API_KEY", "gsk_benchmark_key")
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    logging.disable(logging.WARNING)
+
+    stub_server = start_stub_server(args)
+    try:
+        report = asyncio.run(main_async(args))
+    finally:
+        stub_server.terminate()
+        stub_server.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
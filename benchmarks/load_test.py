@@ -0,0 +1,97 @@
+"""
+Load test for /agent/ask.
+
+Replaces the agents with a stub whose run() blocks for a fixed time (like a slow model
+or DuckDuckGo/YFinance call) and fires requests at rising concurrency. With agent runs
+on the worker pool, throughput should grow with concurrency until the per-agent limit.
+
+Usage:
+    python benchmarks/load_test.py --latency 0.2 --requests 64 --concurrency 1 2 4 8 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GROQ_API_KEY", "gsk_load_test_key")
+
+import httpx
+
+import agents
+import main
+
+
+class StubModel:
+    id = "stub-model"
+
+
+class StubRunResponse:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StubAgent:
+    """Agent stand-in whose run() blocks the calling thread for `latency` seconds."""
+
+    model = StubModel()
+    run_response = None
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def reset_run_state(self):
+        pass
+
+    def reset_session(self):
+        pass
+
+    def run(self, message, **kwargs):
+        time.sleep(self.latency)
+        return StubRunResponse(f"stub answer to: {str(message)[:40]}")
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, total: int, agent_type: str):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def one(i: int):
+        async with semaphore:
+            response = await client.post(
+                "/agent/ask",
+                json={"agent": agent_type, "query": f"question {i}", "messages": []},
+            )
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    return elapsed, statuses
+
+
+async def main_async(args):
+    agents.agent_pool.builder = lambda spec: StubAgent(args.latency)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        print(f"{'concurrency':>11} {'requests':>8} {'seconds':>8} {'req/s':>8}  statuses")
+        for concurrency in args.concurrency:
+            elapsed, statuses = await run_level(client, concurrency, args.requests, args.agent)
+            print(f"{concurrency:>11} {args.requests:>8} {elapsed:>8.2f} {args.requests / elapsed:>8.1f}  {statuses}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agent", default="web", help="Agent type to request")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds each stub agent run blocks for")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import logging
+
+    logging.disable(logging.INFO)
+    asyncio.run(main_async(parse_args()))
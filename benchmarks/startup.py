@@ -0,0 +1,155 @@
+"""
+Cold start benchmark.
+
+Measures, in fresh processes:
+    import    wall time of `import main`, modules loaded and RSS afterwards
+    ready     time from spawning `uvicorn main:app` until /health answers
+    first     time of the first request to each agent type, which pays for building
+              the agent and importing its toolkits (stub Groq server, no network)
+
+Usage:
+    python benchmarks/startup.py --runs 5 --output startup.json
+    AGENT_WARMUP=general,web python benchmarks/startup.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+rss_kb = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+print(json.dumps({"seconds": elapsed, "modules": len(sys.modules), "rss_mb": rss_kb / 1024}))
+"""
+
+FIRST_REQUEST_PROBE = """
+import json, sys, time
+sys.path.insert(0, "benchmarks")
+from stub_tools import install_stub_tools
+install_stub_tools(latency=0.0)
+from fastapi.testclient import TestClient
+import main
+client = TestClient(main.app)
+results = {}
+for agent_type in sys.argv[1:]:
+    start = time.perf_counter()
+    response = client.post("/agent/ask", json={"agent": agent_type, "query": "hello", "cache_control": "no-store"})
+    results[agent_type] = {"seconds": time.perf_counter() - start, "status": response.status_code}
+print(json.dumps(results))
+"""
+
+AGENT_TYPES = ["general", "web", "youtube", "articles", "linkedin", "finance"]
+
+
+def child_env(**extra) -> dict:
+    env = dict(os.environ)
+    env.setdefault("GROQ_API_KEY", "gsk_startup_benchmark")
+    env["VISION_PROBE_ON_STARTUP"] = "false"
+    env.update(extra)
+    return env
+
+
+def run_json(code: str, args=(), env=None) -> dict:
+    output = subprocess.check_output(
+        [sys.executable, "-c", code, *args], cwd=ROOT, env=env or child_env(), stderr=subprocess.DEVNULL, text=True
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_import() -> dict:
+    return run_json(IMPORT_PROBE)
+
+
+def measure_ready(port: int) -> float:
+    import httpx
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while process.poll() is None:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=0.5).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.HTTPError:
+                time.sleep(0.02)
+        raise RuntimeError("uvicorn exited before becoming ready")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def measure_first_requests(agent_types) -> dict:
+    from benchmark import start_stub_server
+
+    args = argparse.Namespace(ttft=0.0, tokens_per_second=100000.0, output_tokens=10)
+    stub_server = start_stub_server(args)
+    try:
+        return run_json(FIRST_REQUEST_PROBE, agent_types, child_env(GROQ_BASE_URL=os.environ["GROQ_BASE_URL"]))
+    finally:
+        stub_server.terminate()
+        stub_server.wait()
+
+
+def summarize(values) -> dict:
+    return {
+        "median": round(statistics.median(values), 3),
+        "min": round(min(values), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def main_cli(args) -> dict:
+    from benchmark import free_port, git_commit
+
+    imports = [measure_import() for _ in range(args.runs)]
+    ready = [measure_ready(free_port()) for _ in range(args.runs)]
+    first = measure_first_requests(args.agents) if args.agents else {}
+
+    report = {
+        "meta": {"commit": git_commit(), "runs": args.runs, "agent_warmup": os.getenv("AGENT_WARMUP", "")},
+        "import_seconds": summarize([r["seconds"] for r in imports]),
+        "import_modules": imports[-1]["modules"],
+        "import_rss_mb": round(imports[-1]["rss_mb"], 1),
+        "ready_seconds": summarize(ready),
+        "first_request_seconds": {k: round(v["seconds"], 3) for k, v in first.items()},
+    }
+
+    print(f"import main     {report['import_seconds']['median']:.3f}s median "
+          f"({report['import_modules']} modules, {report['import_rss_mb']} MB RSS)")
+    print(f"ready (/health) {report['ready_seconds']['median']:.3f}s median")
+    for agent_type, seconds in report["first_request_seconds"].items():
+        print(f"first {agent_type:<9} {seconds:.3f}s")
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--agents", nargs="*", default=AGENT_TYPES, help="Agent types to time the first request of")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = main_cli(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
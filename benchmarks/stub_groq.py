@@ -0,0 +1,216 @@
+"""
+Local stand-in for the Groq chat completions API.
+
+Serves POST /openai/v1/chat/completions in the shape the groq SDK expects, streaming and
+non-streaming, with a configurable time to first token and token rate. When the request
+offers tools and the last message is from the user, it answers with a call to the first
+tool (arguments filled from the tool's JSON schema); after the tool result it answers
+with text. Point the app at it with GROQ_BASE_URL=http://127.0.0.1:<port>.
+
+With --rpm/--tpm it enforces Groq-style per-key, per-model limits over a sliding minute:
+responses carry x-ratelimit-* headers and calls over the limit get 429 with retry-after.
+
+Usage:
+    python benchmarks/stub_groq.py --port 8765 --ttft 0.1 --tokens-per-second 1000 --output-tokens 100
+    python benchmarks/stub_groq.py --port 8765 --rpm 30 --tpm 6000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Stub Groq")
+
+settings = {"ttft": 0.1, "tokens_per_second": 1000.0, "output_tokens": 100, "rpm": 0, "tpm": 0}
+
+# (time, tokens) of recent calls per (API key, model), for the optional rate limits
+usage_log: Dict[Tuple[str, str], Deque[Tuple[float, int]]] = defaultdict(deque)
+rate_limited = {"count": 0}
+
+WORDS = "the quick brown fox jumps over the lazy dog while agents answer benchmark questions".split()
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return str(content)
+
+
+def prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(message_text(m)) for m in messages) // 4 + 1
+
+
+def tool_arguments(tool: Dict[str, Any], text: str) -> Dict[str, Any]:
+    """Fill the required parameters of a tool schema with plausible values."""
+    parameters = tool["function"].get("parameters") or {}
+    properties = parameters.get("properties", {})
+    arguments = {}
+    for name in parameters.get("required", list(properties)):
+        kind = properties.get(name, {}).get("type")
+        if kind == "integer":
+            arguments[name] = 1
+        elif name == "url":
+            arguments[name] = f"https://example.com/{uuid.uuid5(uuid.NAMESPACE_URL, text).hex[:12]}"
+        elif name == "symbol":
+            arguments[name] = "NVDA"
+        else:
+            arguments[name] = text[-80:] or "benchmark"
+    return arguments
+
+
+def usage(prompt: int, completion: int) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "prompt_time": 0.0,
+        "completion_time": completion / settings["tokens_per_second"],
+        "queue_time": 0.0,
+        "total_time": settings["ttft"] + completion / settings["tokens_per_second"],
+    }
+
+
+def check_rate_limit(key: str, model: str, tokens: int) -> Tuple[Dict[str, str], Optional[float]]:
+    """Record a call against the sliding-minute limits; returns headers and a retry-after if refused."""
+    if not settings["rpm"] and not settings["tpm"]:
+        return {}, None
+    now = time.time()
+    log = usage_log[(key, model)]
+    while log and log[0][0] <= now - 60:
+        log.popleft()
+    used_tokens = sum(t for _, t in log)
+    retry_after = None
+    if settings["rpm"] and len(log) + 1 > settings["rpm"]:
+        retry_after = log[0][0] + 60 - now
+    elif settings["tpm"] and used_tokens + tokens > settings["tpm"] and log:
+        retry_after = log[0][0] + 60 - now
+    else:
+        log.append((now, tokens))
+        used_tokens += tokens
+    headers = {}
+    if settings["tpm"]:
+        headers["x-ratelimit-limit-tokens"] = str(settings["tpm"])
+        headers["x-ratelimit-remaining-tokens"] = str(max(0, settings["tpm"] - used_tokens))
+    if retry_after is not None:
+        rate_limited["count"] += 1
+        headers["retry-after"] = str(max(1, round(retry_after)))
+    return headers, retry_after
+
+
+def plan_reply(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Decide between a tool call and a text answer for this turn."""
+    messages = body.get("messages", [])
+    tools = body.get("tools") or []
+    last = messages[-1] if messages else {}
+    if tools and last.get("role") == "user":
+        tool = tools[0]
+        return {
+            "tool_call": {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {
+                    "name": tool["function"]["name"],
+                    "arguments": json.dumps(tool_arguments(tool, message_text(last))),
+                },
+            }
+        }
+    count = settings["output_tokens"]
+    return {"tokens": [WORDS[i % len(WORDS)] + " " for i in range(count)]}
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", **settings, "rate_limited": rate_limited["count"]}
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    prompt = prompt_tokens(body.get("messages", []))
+    reply = plan_reply(body)
+
+    key = request.headers.get("authorization", "")
+    limit_headers, retry_after = check_rate_limit(key, model, prompt + settings["output_tokens"])
+    if retry_after is not None:
+        error = {"message": f"Rate limit reached for model {model}", "type": "tokens", "code": "rate_limit_exceeded"}
+        return JSONResponse({"error": error}, status_code=429, headers=limit_headers)
+
+    if not body.get("stream"):
+        await asyncio.sleep(settings["ttft"] + len(reply.get("tokens", [])) / settings["tokens_per_second"])
+        if "tool_call" in reply:
+            message = {"role": "assistant", "content": None, "tool_calls": [reply["tool_call"]]}
+            finish_reason, completion = "tool_calls", 10
+        else:
+            message = {"role": "assistant", "content": "".join(reply["tokens"])}
+            finish_reason, completion = "stop", len(reply["tokens"])
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}],
+            "usage": usage(prompt, completion),
+        }, headers=limit_headers)
+
+    def chunk(delta: Dict[str, Any], finish_reason=None, x_groq=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+        }
+        if x_groq is not None:
+            payload["x_groq"] = x_groq
+        return f"data: {json.dumps(payload)}\n\n"
+
+    async def events():
+        await asyncio.sleep(settings["ttft"])
+        yield chunk({"role": "assistant", "content": ""})
+        if "tool_call" in reply:
+            yield chunk({"tool_calls": [{"index": 0, **reply["tool_call"]}]})
+            yield chunk({}, "tool_calls", {"id": completion_id, "usage": usage(prompt, 10)})
+        else:
+            delay = 1 / settings["tokens_per_second"]
+            for token in reply["tokens"]:
+                await asyncio.sleep(delay)
+                yield chunk({"content": token})
+            yield chunk({}, "stop", {"id": completion_id, "usage": usage(prompt, len(reply["tokens"]))})
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=limit_headers)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=settings["ttft"], help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=settings["tokens_per_second"])
+    parser.add_argument("--output-tokens", type=int, default=settings["output_tokens"], help="Tokens per text answer")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute per key and model (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute per key and model (0 = unlimited)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    settings.update(
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        rpm=args.rpm,
+        tpm=args.tpm,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,163 @@
+"""
+Offline stand-ins for the DuckDuckGo, YFinance, YouTube and Newspaper4k toolkits.
+
+Each stub exposes the same function names and signatures as the real toolkit, so the
+model sees the same tool schemas, and returns canned text after a fixed delay.
+"""
+import time
+
+from agno.tools import Toolkit
+
+
+class StubToolkit(Toolkit):
+    def __init__(self, name: str, tools, latency: float, result_chars: int):
+        self.latency = latency
+        self.result_chars = result_chars
+        super().__init__(name=name, tools=tools)
+
+    def _result(self, tool_name: str, subject: str) -> str:
+        time.sleep(self.latency)
+        text = f"{tool_name} result for {subject}. "
+        return (text * (self.result_chars // len(text) + 1))[: self.result_chars]
+
+
+class StubDuckDuckGoTools(StubToolkit):
+    def __init__(self, latency: float = 0.2, result_chars: int = 2000):
+        super().__init__("duckduckgo", [self.duckduckgo_search, self.duckduckgo_news], latency, result_chars)
+
+    def duckduckgo_search(self, query: str, max_results: int = 5) -> str:
+        """Use this function to search DuckDuckGo for a query.
+
+        Args:
+            query(str): The query to search for.
+            max_results (optional, default=5): The maximum number of results to return.
+        """
+        return self._result("duckduckgo_search", query)
+
+    def duckduckgo_news(self, query: str, max_results: int = 5) -> str:
+        """Use this function to get the latest news from DuckDuckGo.
+
+        Args:
+            query(str): The query to search for.
+            max_results (optional, default=5): The maximum number of results to return.
+        """
+        return self._result("duckduckgo_news", query)
+
+
+class StubYFinanceTools(StubToolkit):
+    def __init__(self, latency: float = 0.2, result_chars: int = 2000):
+        tools = [
+            self.get_current_stock_price,
+            self.get_company_info,
+            self.get_stock_fundamentals,
+            self.get_analyst_recommendations,
+            self.get_company_news,
+            self.get_historical_stock_prices,
+        ]
+        super().__init__("yfinance_tools", tools, latency, result_chars)
+
+    def get_current_stock_price(self, symbol: str) -> str:
+        """Use this function to get the current stock price for a given symbol.
+
+        Args:
+            symbol (str): The stock symbol.
+        """
+        return self._result("get_current_stock_price", symbol)
+
+    def get_company_info(self, symbol: str) -> str:
+        """Use this function to get company information and overview for a given stock symbol.
+
+        Args:
+            symbol (str): The stock symbol.
+        """
+        return self._result("get_company_info", symbol)
+
+    def get_stock_fundamentals(self, symbol: str) -> str:
+        """Use this function to get fundamental data for a given stock symbol.
+
+        Args:
+            symbol (str): The stock symbol.
+        """
+        return self._result("get_stock_fundamentals", symbol)
+
+    def get_analyst_recommendations(self, symbol: str) -> str:
+        """Use this function to get analyst recommendations for a given stock symbol.
+
+        Args:
+            symbol (str): The stock symbol.
+        """
+        return self._result("get_analyst_recommendations", symbol)
+
+    def get_company_news(self, symbol: str, num_stories: int = 3) -> str:
+        """Use this function to get company news and press releases for a given stock symbol.
+
+        Args:
+            symbol (str): The stock symbol.
+            num_stories (int): The number of news stories to return.
+        """
+        return self._result("get_company_news", symbol)
+
+    def get_historical_stock_prices(self, symbol: str, period: str = "1mo", interval: str = "1d") -> str:
+        """Use this function to get the historical stock price for a given symbol.
+
+        Args:
+            symbol (str): The stock symbol.
+            period (str): The period for which to retrieve historical prices.
+            interval (str): The interval between data points.
+        """
+        return self._result("get_historical_stock_prices", symbol)
+
+
+class StubYouTubeTools(StubToolkit):
+    def __init__(self, latency: float = 0.2, result_chars: int = 8000):
+        tools = [self.get_youtube_video_captions, self.get_youtube_video_data, self.get_video_timestamps]
+        super().__init__("youtube_tools", tools, latency, result_chars)
+
+    def get_youtube_video_captions(self, url: str) -> str:
+        """Use this function to get captions from a YouTube video.
+
+        Args:
+            url: The URL of the YouTube video.
+        """
+        return self._result("get_youtube_video_captions", url)
+
+    def get_youtube_video_data(self, url: str) -> str:
+        """Use this function to get video data for a YouTube URL.
+
+        Args:
+            url: The URL of the YouTube video.
+        """
+        return self._result("get_youtube_video_data", url)
+
+    def get_video_timestamps(self, url: str) -> str:
+        """Generate timestamps for a YouTube video based on captions.
+
+        Args:
+            url: The URL of the YouTube video.
+        """
+        return self._result("get_video_timestamps", url)
+
+
+class StubNewspaper4kTools(StubToolkit):
+    def __init__(self, latency: float = 0.2, result_chars: int = 6000):
+        super().__init__("newspaper4k_tools", [self.read_article], latency, result_chars)
+
+    def read_article(self, url: str) -> str:
+        """Use this function to read an article from a URL.
+
+        Args:
+            url (str): The URL of the article.
+        """
+        return self._result("read_article", url)
+
+
+def install_stub_tools(latency: float = 0.2) -> None:
+    """Replace the toolkit builders in `agents` with stubs; call before any agent is built."""
+    import agents
+
+    agents.TOOLKIT_BUILDERS.update({
+        "duckduckgo": lambda: StubDuckDuckGoTools(latency),
+        "yfinance": lambda: StubYFinanceTools(latency),
+        "youtube": lambda: StubYouTubeTools(latency),
+        "newspaper": lambda: StubNewspaper4kTools(latency),
+    })
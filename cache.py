@@ -0,0 +1,309 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Thread-safe in-memory cache with per-entry TTL and LRU eviction."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class SQLiteCache:
+    """Disk-backed cache with the same interface as TTLCache; values must be JSON-serializable."""
+
+    def __init__(self, path: str = "cache.db", max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            # Evict least recently used entries beyond the size bound
+            evicted = self._conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self.evictions += max(evicted, 0)
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "backend": "sqlite",
+                "path": self.path,
+                "entries": count,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class RedisCache:
+    """
+    Cache in Redis (or a compatible server such as Valkey) with the same interface as
+    TTLCache, shared by every worker process and host; values must be JSON-serializable.
+
+    Entries expire with their TTL and Redis evicts under its own `maxmemory` policy, so
+    there is no entry bound here. An unreachable server is logged and treated as a miss,
+    so a Redis outage costs cache hits, not requests. Hit and miss counts are those of
+    this process.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "agentium:cache"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ValueError("The redis cache backend requires the redis package (pip install redis)") from e
+
+        self.url = url
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            value = self._redis.get(self._key(key))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis cache read failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        try:
+            self._redis.set(self._key(key), json.dumps(value), px=max(1, int(ttl * 1000)))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis cache write failed: {e}")
+
+    def delete(self, key: str) -> None:
+        self._redis.delete(self._key(key))
+
+    def clear(self) -> None:
+        keys = list(self._redis.scan_iter(match=f"{self.prefix}:*", count=1000))
+        for start in range(0, len(keys), 1000):
+            self._redis.delete(*keys[start:start + 1000])
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "prefix": self.prefix,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def redis_url(name: str) -> str:
+    """The Redis URL for one component: <NAME>_REDIS_URL, else REDIS_URL, else a local server."""
+    return os.getenv(f"{name}_REDIS_URL") or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+# Default response TTLs in seconds: market data goes stale fast, transcripts do not
+DEFAULT_RESPONSE_TTLS: Dict[str, float] = {
+    "general": 3600,
+    "web": 600,
+    "youtube": 86400,
+    "articles": 21600,
+    "linkedin": 3600,
+    "finance": 60,
+}
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a prompt for cache keying: trim, lowercase and collapse whitespace."""
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+class ResponseCache:
+    """
+    Opt-in cache of agent answers keyed on agent type, model id and the normalized prompt.
+
+    The prompt already contains the conversation context, so the same question asked in a
+    different conversation gets a different key.
+    """
+
+    def __init__(self, backend, enabled: bool = False, ttls: Optional[Dict[str, float]] = None):
+        self.backend = backend
+        self.enabled = enabled
+        # Explicit TTLs (from RESPONSE_CACHE_TTL_<AGENT>) win over the agent registry
+        self.overrides = dict(ttls or {})
+        self.ttls = {**DEFAULT_RESPONSE_TTLS, **self.overrides}
+
+    def configure_ttls(self, ttls: Dict[str, float]) -> None:
+        """Apply per-agent TTLs from the agent registry."""
+        self.ttls = {**DEFAULT_RESPONSE_TTLS, **ttls, **self.overrides}
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        enabled = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+        backend_name = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+        max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+        if backend_name == "sqlite":
+            backend = SQLiteCache(os.getenv("RESPONSE_CACHE_DB_PATH", "cache.db"), max_entries=max_entries)
+        elif backend_name == "redis":
+            backend = RedisCache(redis_url("RESPONSE_CACHE"), prefix="agentium:responses")
+        elif backend_name == "memory":
+            backend = TTLCache(max_entries=max_entries)
+        else:
+            raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {backend_name}")
+
+        ttls = {}
+        for agent_type in DEFAULT_RESPONSE_TTLS:
+            value = os.getenv(f"RESPONSE_CACHE_TTL_{agent_type.upper()}")
+            if value is not None:
+                ttls[agent_type] = float(value)
+
+        if enabled:
+            logger.info(f"Response cache enabled: backend={backend_name}, max_entries={max_entries}")
+        return cls(backend, enabled=enabled, ttls=ttls)
+
+    def ttl_for(self, agent_type: str) -> float:
+        return self.ttls.get(agent_type, 0)
+
+    def make_key(self, agent_type: str, model_id: str, prompt: str) -> str:
+        payload = json.dumps([agent_type, model_id, normalize_query(prompt)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        return self.backend.get(key)
+
+    def set(self, key: str, agent_type: str, response: str, model_id: str) -> None:
+        ttl = self.ttl_for(agent_type)
+        if ttl > 0:
+            self.backend.set(key, {"response": response, "model_used": model_id}, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "ttls": self.ttls, **self.backend.stats()}
+
+
+def parse_cache_control(value: Optional[str]) -> Tuple[bool, bool]:
+    """
+    Interpret a Cache-Control style directive.
+
+    Returns:
+        Tuple[bool, bool]: (may read from cache, may write to cache)
+    """
+    directives = {d.strip().lower() for d in (value or "").split(",")}
+    if "no-store" in directives:
+        return False, False
+    if "no-cache" in directives:
+        return False, True
+    return True, True
@@ -0,0 +1,276 @@
+import contextvars
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from deadlines import cancel_token
+
+logger = logging.getLogger(__name__)
+
+# tiktoken encodings that approximate each model family's tokenizer, matched by model id
+# prefix. Llama 3 uses a 128k BPE vocabulary built on cl100k_base, and Llama 4 a 200k one,
+# so counts stay within a few percent of what Groq bills.
+MODEL_ENCODINGS: List[Tuple[str, str]] = [
+    ("meta-llama/llama-4", "o200k_base"),
+    ("llama", "cl100k_base"),
+]
+DEFAULT_ENCODING = "cl100k_base"
+
+WORD_PATTERN = re.compile(r"[A-Za-z]+|\d|[^\sA-Za-z\d]")
+
+SUMMARY_PROMPT = """Update the running summary of a conversation with the messages below.
+Keep names, numbers, decisions and open questions; drop small talk. Reply with the summary only, at most {words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate BPE tokens without a tokenizer.
+
+    Words count one token per four letters, and every digit and punctuation mark one
+    token, which is much closer to real counts than length / 4 for code, numbers and URLs.
+    """
+    tokens = 0
+    for piece in WORD_PATTERN.findall(text):
+        tokens += math.ceil(len(piece) / 4) if piece[0].isalpha() else 1
+    return max(1, tokens)
+
+
+class TokenCounter:
+    """
+    Counts tokens per model, using tiktoken when it is installed and an estimate otherwise.
+
+    Counts are cached by encoding and text hash, so messages that are counted on every
+    request (conversation history, instructions) are only tokenized once.
+    """
+
+    def __init__(self, use_tiktoken: bool = True, cache_size: int = 8192):
+        self.use_tiktoken = use_tiktoken
+        self.cache_size = cache_size
+        self._encoders: Dict[str, Any] = {}
+        self._counts: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def encoding_for(model_id: Optional[str]) -> str:
+        model = (model_id or "").lower()
+        for prefix, encoding in MODEL_ENCODINGS:
+            if model.startswith(prefix):
+                return encoding
+        return DEFAULT_ENCODING
+
+    def _encoder(self, encoding: str):
+        """Load a tiktoken encoding once; None means estimate instead."""
+        if encoding not in self._encoders:
+            encoder = None
+            if self.use_tiktoken:
+                try:
+                    import tiktoken
+
+                    encoder = tiktoken.get_encoding(encoding)
+                except Exception as e:  # not installed, or the BPE file cannot be downloaded
+                    logger.info(f"tiktoken encoding {encoding} unavailable, estimating token counts: {e}")
+            self._encoders[encoding] = encoder
+        return self._encoders[encoding]
+
+    @property
+    def backend(self) -> str:
+        return "tiktoken" if any(self._encoders.values()) else "estimate"
+
+    def count(self, text: str, model_id: Optional[str] = None) -> int:
+        if not text:
+            return 0
+        encoding = self.encoding_for(model_id)
+        key = (encoding, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return tokens
+            self.misses += 1
+
+        encoder = self._encoder(encoding)
+        tokens = len(encoder.encode(text, disallowed_special=())) if encoder else estimate_tokens(text)
+
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int, model_id: Optional[str] = None) -> str:
+        """Cut text down to about `max_tokens` tokens, at a word boundary where possible."""
+        if self.count(text, model_id) <= max_tokens:
+            return text
+        encoder = self._encoder(self.encoding_for(model_id))
+        if encoder:
+            cut = encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+        else:
+            cut = text[: max_tokens * 4]
+            while len(cut) > 1 and estimate_tokens(cut) > max_tokens:
+                cut = cut[: int(len(cut) * 0.9)]
+        if " " in cut[len(cut) // 2:]:
+            cut = cut[: cut.rindex(" ")]
+        return cut.rstrip() + " …"
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend,
+                "cached_counts": len(self._counts),
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class ContextBuilder:
+    """
+    Packs conversation history into a token budget in front of the current query.
+
+    The current query is always sent whole. The newest turns are added until the next
+    one no longer fits, so the history stays contiguous; a turn longer than
+    `max_turn_tokens` is shortened first. When older turns have been folded into a
+    summary, it is included as well if it fits. Each turn's rendered text and token count
+    are cached on the turn, per encoding.
+    """
+
+    def __init__(self, counter: TokenCounter, max_turn_tokens: int = 300):
+        self.counter = counter
+        self.max_turn_tokens = max_turn_tokens
+
+    @classmethod
+    def from_env(cls, counter: TokenCounter) -> "ContextBuilder":
+        return cls(counter, max_turn_tokens=int(os.getenv("CONTEXT_MAX_TURN_TOKENS", "300")))
+
+    def render_turn(self, turn, model_id: Optional[str]) -> Tuple[str, int]:
+        encoding = self.counter.encoding_for(model_id)
+        rendered = turn.rendered.get(encoding)
+        if rendered is None:
+            role_label = "Human" if turn.role == "user" else "Assistant"
+            content = self.counter.truncate(turn.content, self.max_turn_tokens, model_id)
+            text = f"{role_label}: {content}\n"
+            rendered = (text, self.counter.count(text, model_id))
+            turn.rendered[encoding] = rendered
+        return rendered
+
+    def build(self, turns: Sequence, query: str, model_id: Optional[str], budget: int, summary: str = "") -> Tuple[str, int]:
+        """
+        Assemble the prompt for one request.
+
+        Args:
+            turns (Sequence[Turn]): Earlier turns, oldest first
+            query (str): The current query, never truncated
+            model_id (Optional[str]): Model the prompt is for, which selects the tokenizer
+            budget (int): Token budget for history, summary and query together
+            summary (str): Summary of turns no longer kept in `turns`
+
+        Returns:
+            Tuple[str, int]: The prompt and its token count
+        """
+        current = f"Human: {query}"
+        remaining = budget - self.counter.count(current, model_id)
+
+        picked: List[str] = []
+        for turn in reversed(turns):
+            text, tokens = self.render_turn(turn, model_id)
+            if tokens > remaining:
+                break
+            picked.append(text)
+            remaining -= tokens
+
+        if summary and len(picked) == len(turns):
+            block = f"Summary of the earlier conversation: {summary}\n"
+            tokens = self.counter.count(block, model_id)
+            if tokens <= remaining:
+                picked.append(block)
+                remaining -= tokens
+
+        if not picked:
+            return query, self.counter.count(query, model_id)
+        return "".join(reversed(picked)) + "\n" + current, budget - remaining
+
+
+class Summarizer:
+    """
+    Folds turns that fall out of a session's history into a running summary.
+
+    Summaries are written by a small model on a single background thread, after the
+    response has been sent, so they never add latency to a request. They run in a copy
+    of the submitting context at batch priority, and outlive the request's deadline.
+    """
+
+    def __init__(self, model_id: str = "llama-3.1-8b-instant", max_words: int = 150):
+        self.model_id = model_id
+        self.max_words = max_words
+        self._client = None
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+        self.summaries = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["Summarizer"]:
+        if os.getenv("CONTEXT_SUMMARIZE", "false").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            model_id=os.getenv("CONTEXT_SUMMARY_MODEL", "llama-3.1-8b-instant"),
+            max_words=int(os.getenv("CONTEXT_SUMMARY_WORDS", "150")),
+        )
+
+    def summarize(self, summary: str, turns: Sequence) -> str:
+        """Return `summary` extended with `turns`. Blocking; keeps the old summary on failure."""
+        messages = "\n".join(f"{'Human' if t.role == 'user' else 'Assistant'}: {t.content[:2000]}" for t in turns)
+        try:
+            if self._client is None:
+                from agents import groq_client
+
+                self._client = groq_client(max_retries=1, timeout=30.0)
+            completion = self._client.chat.completions.create(
+                model=self.model_id,
+                messages=[{
+                    "role": "user",
+                    "content": SUMMARY_PROMPT.format(words=self.max_words, summary=summary or "(none)", messages=messages),
+                }],
+                temperature=0,
+                max_tokens=self.max_words * 2,
+            )
+            self.summaries += 1
+            return (completion.choices[0].message.content or summary).strip()
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Conversation summary failed: {e}")
+            return summary
+
+    def submit(self, job: Callable[[], None]) -> None:
+        self._pool.submit(contextvars.copy_context().run, self._run_in_background, job)
+
+    @staticmethod
+    def _run_in_background(job: Callable[[], None]) -> None:
+        # Imported here: the rate limiter module imports this one for its token counter
+        from ratelimit import request_priority
+
+        request_priority.set("batch")
+        cancel_token.set(None)
+        job()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"model": self.model_id, "summaries": self.summaries, "failures": self.failures}
+
+
+token_counter = TokenCounter(
+    use_tiktoken=os.getenv("TOKENIZER", "tiktoken").lower() == "tiktoken",
+    cache_size=int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "8192")),
+)
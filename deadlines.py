@@ -0,0 +1,262 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCancelled(Exception):
+    """Raised when work is abandoned because its request was cancelled or ran out of time."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Request {reason}")
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Cooperative cancellation for one request or one agent run.
+
+    A token is cancelled explicitly (client disconnected, run timed out) or by passing its
+    deadline, and a child token is cancelled with its parent. Blocking code checks the
+    token of the current context between steps: before each model call, while reading a
+    streamed model response and before each tool call. Python threads cannot be
+    interrupted, so a step that has already started runs to its end, but nothing after it.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, parent: Optional["CancelToken"] = None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.parent = parent
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        if parent is not None:
+            parent.on_cancel(lambda: self.cancel(parent.reason or "cancelled"))
+
+    @classmethod
+    def child(cls, timeout: Optional[float] = None) -> "CancelToken":
+        """A token for work done on behalf of the current context's token, if there is one."""
+        return cls(timeout, parent=cancel_token.get())
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Call `callback` when the token is cancelled (at once if it already is); not on deadline expiry."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until this token's (or a parent's) deadline, None if there is none."""
+        remaining = self.parent.remaining() if self.parent is not None else None
+        if self.deadline is not None:
+            own = self.deadline - time.monotonic()
+            remaining = own if remaining is None else min(remaining, own)
+        return remaining
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self.cancel("deadline exceeded")
+            return True
+        return False
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise RequestCancelled(self.reason or "cancelled")
+
+    def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Call `func` with this token as the current context's token."""
+        reset = cancel_token.set(self)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            cancel_token.reset(reset)
+
+
+cancel_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar("cancel_token", default=None)
+
+
+def parse_request_timeout(value: Optional[str]) -> Optional[float]:
+    """Parse an X-Request-Timeout header (seconds); raises ValueError for anything but a positive number."""
+    if value is None or not value.strip():
+        return None
+    timeout = float(value)
+    if not timeout > 0:
+        raise ValueError("must be a positive number of seconds")
+    return timeout
+
+
+class CancellableStream(httpx.SyncByteStream):
+    """Stops reading a streamed response body once the token is cancelled, closing the connection."""
+
+    def __init__(self, stream: httpx.SyncByteStream, token: CancelToken):
+        self.stream = stream
+        self.token = token
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.stream:
+            if self.token.cancelled:
+                raise httpx.ReadError(f"Request {self.token.reason}")
+            yield chunk
+
+    def close(self) -> None:
+        self.stream.close()
+
+
+class DeadlineTransport(httpx.BaseTransport):
+    """
+    httpx transport that applies the current context's CancelToken to model calls.
+
+    A call made after the token is cancelled is answered locally with 499 (and the SDK is
+    told not to retry it); a call in flight gets a read timeout no longer than the time
+    left, and a streamed response stops at the next chunk once the token is cancelled,
+    which closes the connection so the provider stops generating.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        token = cancel_token.get()
+        if token is None:
+            return self.transport.handle_request(request)
+        if token.cancelled:
+            return httpx.Response(
+                499,
+                headers={"x-should-retry": "false"},
+                json={"error": {"message": f"Request {token.reason}", "type": "request_cancelled"}},
+                request=request,
+            )
+
+        remaining = token.remaining()
+        if remaining is not None:
+            timeouts = dict(request.extensions.get("timeout") or {})
+            for phase in ("connect", "read", "write", "pool"):
+                current = timeouts.get(phase)
+                timeouts[phase] = remaining if current is None else min(current, remaining)
+            request.extensions["timeout"] = timeouts
+
+        response = self.transport.handle_request(request)
+        response.stream = CancellableStream(response.stream, token)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class ToolTimeouts:
+    """
+    Time limits for tool calls, from TOOL_TIMEOUT and TOOL_TIMEOUT_<TOOL> (seconds, 0 = none).
+
+    A call is also limited to the time its request has left. Each limited call runs on its
+    own daemon thread; a tool that overruns is answered with an error the model can react
+    to, and its thread is left to finish in the background, as Python cannot stop it. At
+    most `max_abandoned` such threads may be outstanding: beyond that, tool calls are
+    refused (and reported as such) until some of the hung ones return.
+    """
+
+    def __init__(self, default: Optional[float] = 30.0, overrides: Optional[Dict[str, float]] = None, max_abandoned: int = 16):
+        self.default = default
+        self.overrides = overrides or {}
+        self.max_abandoned = max_abandoned
+        self.timeouts = 0
+        self.refused = 0
+        self._abandoned = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ToolTimeouts":
+        default = float(os.getenv("TOOL_TIMEOUT", "30"))
+        overrides = {
+            key[len("TOOL_TIMEOUT_"):].lower(): float(value)
+            for key, value in os.environ.items()
+            if key.startswith("TOOL_TIMEOUT_")
+        }
+        return cls(default or None, overrides, max_abandoned=int(os.getenv("TOOL_MAX_ABANDONED", "16")))
+
+    def timeout_for(self, function_name: str) -> Optional[float]:
+        timeout = self.overrides.get(function_name.lower(), self.default)
+        return timeout or None
+
+    def hook(self, function_name: str, function_call: Callable[..., Any], arguments: Dict[str, Any]) -> Any:
+        """Agno tool hook that skips tools of cancelled requests and enforces tool time limits."""
+        token = cancel_token.get()
+        if token is not None and token.cancelled:
+            return f"Error: {function_name} was not run, the request was {token.reason}"
+
+        timeout = self.timeout_for(function_name)
+        remaining = token.remaining() if token is not None else None
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if timeout is None:
+            return function_call(**arguments)
+
+        with self._lock:
+            if self._abandoned >= self.max_abandoned:
+                self.refused += 1
+                logger.warning(f"Tool {function_name} refused: {self._abandoned} earlier tool calls are still hung")
+                return f"Error: {function_name} was not run, too many earlier tool calls are still hung"
+
+        outcome: Dict[str, Any] = {}
+        done = threading.Event()
+        ctx = contextvars.copy_context()
+
+        def call() -> None:
+            try:
+                outcome["result"] = ctx.run(function_call, **arguments)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                with self._lock:
+                    done.set()
+                    if outcome.get("abandoned"):
+                        self._abandoned -= 1
+
+        threading.Thread(target=call, name=f"tool-{function_name}", daemon=True).start()
+        if not done.wait(timeout):
+            with self._lock:
+                # It may have finished between the wait and the lock
+                if not done.is_set():
+                    outcome["abandoned"] = True
+                    self._abandoned += 1
+                    self.timeouts += 1
+            if outcome.get("abandoned"):
+                logger.warning(f"Tool {function_name} timed out after {timeout:.1f}s")
+                return f"Error: {function_name} timed out after {timeout:g}s"
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "default": self.default,
+                "overrides": self.overrides,
+                "timeouts": self.timeouts,
+                "abandoned": self._abandoned,
+                "max_abandoned": self.max_abandoned,
+                "refused": self.refused,
+            }
+
+
+tool_timeouts = ToolTimeouts.from_env()
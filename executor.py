@@ -0,0 +1,371 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from deadlines import CancelToken, RequestCancelled, cancel_token
+from metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+
+class AgentCapacityError(Exception):
+    """Raised when an agent has no free capacity for a new run."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AgentTimeoutError(Exception):
+    """Raised when an agent run does not finish within its timeout."""
+
+    def __init__(self, agent_type: str, timeout: float):
+        super().__init__(f"Agent '{agent_type}' did not answer within {timeout:g} seconds")
+        self.agent_type = agent_type
+        self.timeout = timeout
+
+
+class ResizableSemaphore:
+    """
+    An asyncio semaphore whose limit can be changed while permits are held.
+
+    Lowering the limit never interrupts running holders; new acquirers simply wait until
+    enough of them have released.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: deque = deque()
+
+    def locked(self) -> bool:
+        return self.active >= self.limit
+
+    async def acquire(self) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # The permit is counted in `active` by whoever resolves the future
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        self._wake()
+
+    def resize(self, limit: int) -> None:
+        self.limit = limit
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.active < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+
+class AgentExecutor:
+    """
+    Runs blocking agent calls on a dedicated thread pool with per-agent concurrency limits.
+
+    Each agent type may have at most `max_concurrency` runs in flight (overridable per
+    agent with `configure`). Up to `max_queue` further requests wait for a slot; anything
+    beyond that is rejected immediately with 429, and a request that waits longer than
+    `queue_timeout` seconds is rejected with 503.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 32,
+        max_concurrency: int = 8,
+        max_queue: int = 16,
+        queue_timeout: float = 10.0,
+    ):
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent")
+        self._semaphores: Dict[str, ResizableSemaphore] = {}
+        self._concurrency: Dict[str, int] = {}
+        self._timeouts: Dict[str, float] = {}
+        self._waiting: Dict[str, int] = {}
+        self._running: Dict[str, int] = {}
+        self._rejected: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "AgentExecutor":
+        """Build an executor configured from AGENT_* environment variables."""
+        return cls(
+            max_workers=int(os.getenv("AGENT_WORKERS", "32")),
+            max_concurrency=int(os.getenv("AGENT_MAX_CONCURRENCY", "8")),
+            max_queue=int(os.getenv("AGENT_MAX_QUEUE", "16")),
+            queue_timeout=float(os.getenv("AGENT_QUEUE_TIMEOUT", "10")),
+        )
+
+    def configure(self, concurrency: Dict[str, int], timeouts: Dict[str, float]) -> None:
+        """
+        Replace the per-agent concurrency limits and run timeouts.
+
+        Agents missing from `concurrency` use `max_concurrency`; agents missing from
+        `timeouts` have no run timeout. Limits of agents with runs in flight change in place.
+        """
+        self._concurrency = dict(concurrency)
+        self._timeouts = dict(timeouts)
+        for agent_type, semaphore in self._semaphores.items():
+            semaphore.resize(self.concurrency_for(agent_type))
+
+    def concurrency_for(self, agent_type: str) -> int:
+        return self._concurrency.get(agent_type, self.max_concurrency)
+
+    def timeout_for(self, agent_type: str) -> Optional[float]:
+        return self._timeouts.get(agent_type)
+
+    def _semaphore(self, agent_type: str) -> ResizableSemaphore:
+        if agent_type not in self._semaphores:
+            self._semaphores[agent_type] = ResizableSemaphore(self.concurrency_for(agent_type))
+        return self._semaphores[agent_type]
+
+    def _reject(self, agent_type: str, status_code: int, detail: str) -> AgentCapacityError:
+        self._rejected[agent_type] = self._rejected.get(agent_type, 0) + 1
+        logger.warning(f"Rejecting request for agent={agent_type}: {detail}")
+        return AgentCapacityError(status_code, detail, retry_after=max(1, int(self.queue_timeout)))
+
+    async def acquire(self, agent_type: str) -> None:
+        """Wait for a run slot for `agent_type`, failing fast when the queue is full."""
+        semaphore = self._semaphore(agent_type)
+        waiting = self._waiting.get(agent_type, 0)
+
+        if semaphore.locked() and waiting >= self.max_queue:
+            raise self._reject(agent_type, 429, f"Too many queued requests for agent '{agent_type}'")
+
+        self._waiting[agent_type] = waiting + 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(agent_type, 503, f"Agent '{agent_type}' is at capacity, please retry")
+        finally:
+            self._waiting[agent_type] -= 1
+            observe_stage("queue", agent_type, time.perf_counter() - started)
+
+        self._running[agent_type] = self._running.get(agent_type, 0) + 1
+
+    def release(self, agent_type: str) -> None:
+        """Release a run slot previously obtained with `acquire`."""
+        self._running[agent_type] -= 1
+        self._semaphore(agent_type).release()
+
+    @asynccontextmanager
+    async def slot(self, agent_type: str):
+        await self.acquire(agent_type)
+        try:
+            yield
+        finally:
+            self.release(agent_type)
+
+    async def run_in_pool(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking callable on the agent thread pool, preserving context variables."""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self._pool, functools.partial(ctx.run, func, *args, **kwargs))
+
+    async def run(self, agent_type: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a blocking agent call within the concurrency limits and timeout of `agent_type`.
+
+        The run gets its own CancelToken, a child of the request's, which expires with the
+        agent's timeout or the request's deadline, whichever is sooner. When the run times
+        out, or its request is cancelled, the token is cancelled and the caller gets
+        AgentTimeoutError or RequestCancelled at once. The thread (which Python cannot
+        interrupt) stops at its next model or tool call, and keeps its slot until it does,
+        so the concurrency limit stays truthful.
+        """
+        await self.acquire(agent_type)
+        token = CancelToken.child(self.timeout_for(agent_type))
+        future = asyncio.ensure_future(self.run_in_pool(token.run, func, *args, **kwargs))
+        future.add_done_callback(lambda f: self._run_finished(agent_type, f))
+
+        loop = asyncio.get_running_loop()
+        cancelled = loop.create_future()
+        token.on_cancel(lambda: loop.call_soon_threadsafe(lambda: cancelled.done() or cancelled.set_result(None)))
+        timeout = token.remaining()
+        try:
+            await asyncio.wait({future, cancelled}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            token.cancel("cancelled")
+            raise
+        finally:
+            cancelled.cancel()
+
+        if future.done():
+            return future.result()
+        if token.reason is not None and token.reason != "deadline exceeded":
+            raise RequestCancelled(token.reason)
+        token.cancel("deadline exceeded")
+        logger.warning(f"Agent run timed out after {timeout:.1f}s: agent={agent_type}")
+        raise AgentTimeoutError(agent_type, round(timeout, 1))
+
+    def _run_finished(self, agent_type: str, future: asyncio.Future) -> None:
+        self.release(agent_type)
+        # Mark the result of abandoned runs as retrieved so it is not logged as unhandled
+        if not future.cancelled():
+            future.exception()
+
+    def iterate(self, agent_type: str, iterator: Iterator[Any], parent: Optional[CancelToken] = None) -> "AgentStream":
+        """
+        Drain a blocking iterator on the thread pool, holding the slot of `agent_type`
+        until it is exhausted or closed. The slot must already be acquired.
+
+        The iterator runs under a CancelToken with the agent's timeout, bounded by the
+        deadline of `parent` (the request's token, which a streaming response has left the
+        context of by the time it is consumed).
+        """
+        token = CancelToken(self.timeout_for(agent_type), parent=parent or cancel_token.get())
+        return AgentStream(self, agent_type, iterator, token)
+
+    def stats(self) -> Dict[str, Any]:
+        agent_types = set(self._semaphores) | set(self._rejected)
+        return {
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "agents": {
+                agent_type: {
+                    "max_concurrency": self.concurrency_for(agent_type),
+                    "timeout": self.timeout_for(agent_type),
+                    "running": self._running.get(agent_type, 0),
+                    "waiting": self._waiting.get(agent_type, 0),
+                    "rejected": self._rejected.get(agent_type, 0),
+                }
+                for agent_type in sorted(agent_types)
+            },
+        }
+
+    def in_flight(self) -> int:
+        return sum(self._running.values())
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Wait up to `timeout` seconds for agent runs holding a slot to finish.
+
+        By the time the app shuts down the server has already finished its requests, but
+        runs abandoned by a timeout or a disconnect can still be working towards their next
+        model or tool call, and stopping the thread pool under them would lose their writes.
+
+        Returns:
+            int: The number of runs still in flight
+        """
+        deadline = time.monotonic() + timeout
+        while self.in_flight() > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        return self.in_flight()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+class AgentStream:
+    """
+    Async iterator over a blocking iterator that runs on the agent pool in a held slot.
+
+    The consumer must `aclose` the stream however it ends, including when it never asked
+    for an item (a streaming response whose client left before the body was sent): an
+    async generator that never started would not run its cleanup, and the slot would be
+    lost. Closing cancels the stream's token, so a model call in progress stops reading,
+    then closes the iterator (running its cleanup) once the step in progress has returned,
+    and releases the slot only after that, so the concurrency limit stays truthful.
+    """
+
+    _sentinel = object()
+
+    def __init__(self, executor: AgentExecutor, agent_type: str, iterator: Iterator[Any], token: CancelToken):
+        self._executor = executor
+        self._agent_type = agent_type
+        self._iterator = iterator
+        self._token = token
+        self._step = None
+        self._closed = False
+
+    def __aiter__(self) -> "AgentStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._closed:
+            raise StopAsyncIteration
+        ctx = contextvars.copy_context()
+        self._step = self._executor._pool.submit(ctx.run, self._token.run, next, self._iterator, self._sentinel)
+        try:
+            item = await asyncio.wrap_future(self._step)
+        except BaseException:
+            await self.aclose()
+            raise
+        if item is self._sentinel:
+            await self.aclose()
+            raise StopAsyncIteration
+        return item
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._token.cancel("cancelled")
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+
+        def release(_=None) -> None:
+            try:
+                loop.call_soon_threadsafe(self._executor.release, self._agent_type)
+            except RuntimeError:
+                # The event loop is gone and the slot with it
+                pass
+
+        def close(_=None) -> None:
+            close_iterator = getattr(self._iterator, "close", None)
+            if close_iterator is None:
+                release()
+                return
+            try:
+                self._executor._pool.submit(ctx.run, self._token.run, close_iterator).add_done_callback(release)
+            except RuntimeError:
+                # The pool has been shut down
+                release()
+
+        if self._step is None:
+            close()
+        else:
+            self._step.add_done_callback(close)
+
+
+agent_executor: Optional[AgentExecutor] = None
+
+
+def get_executor() -> AgentExecutor:
+    """Return the process-wide agent executor, creating it on first use."""
+    global agent_executor
+    if agent_executor is None:
+        agent_executor = AgentExecutor.from_env()
+        logger.info(
+            f"Agent executor started: workers={agent_executor.max_workers}, "
+            f"per-agent concurrency={agent_executor.max_concurrency}"
+        )
+    return agent_executor
@@ -0,0 +1,42 @@
+import os
+import shutil
+
+# Multi-worker production server: gunicorn supervises WEB_CONCURRENCY uvicorn workers,
+# restarts any that die and drains them on SIGTERM. Run with:
+#   gunicorn -c gunicorn.conf.py main:app
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+# One worker unless told otherwise: sessions and jobs are per process with the memory backends
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Agent runs take seconds to minutes; the per-agent timeouts in agents.toml bound requests,
+# so the worker timeout only catches a wedged event loop
+timeout = int(os.getenv("WORKER_TIMEOUT", "300"))
+# Seconds a worker gets after SIGTERM to finish open requests and drain agent runs and
+# jobs (SHUTDOWN_DRAIN_TIMEOUT) before it is killed
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# Each worker starts its own threads (executor, job workers, history writer, config
+# watcher), which do not survive a fork, so the app is imported in every worker
+preload_app = False
+
+accesslog = "-" if os.getenv("ACCESS_LOG", "false").lower() in ("1", "true", "yes") else None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # Metrics files left by an earlier run would be counted again
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
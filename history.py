@@ -0,0 +1,300 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Longest first query kept as a conversation title
+TITLE_MAX_CHARS = 120
+
+
+class SQLiteHistoryStore:
+    """
+    Conversation and turn records in a local SQLite database.
+
+    Any object with the same `write`, `conversation`, `page` and `stats` methods can stand in
+    for it, e.g. a store backed by Postgres for deployments that share one database.
+    """
+
+    def __init__(self, path: str = "history.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                agent TEXT NOT NULL,
+                title TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                turns INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                agent TEXT,
+                model TEXT,
+                input_tokens INTEGER,
+                output_tokens INTEGER,
+                latency_ms REAL,
+                cached INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS turns_by_conversation ON turns (conversation_id, id);
+            """
+        )
+        self._conn.commit()
+
+    def write(self, operations: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Apply a batch of queued operations ("exchange" or "delete") in one transaction."""
+        with self._lock:
+            with self._conn:
+                for op, data in operations:
+                    if op == "delete":
+                        self._conn.execute("DELETE FROM turns WHERE conversation_id = ?", (data["id"],))
+                        self._conn.execute("DELETE FROM conversations WHERE id = ?", (data["id"],))
+                        continue
+                    self._conn.execute(
+                        "INSERT INTO conversations (id, agent, title, created_at, updated_at, turns) "
+                        "VALUES (:id, :agent, :title, :created_at, :created_at, 2) "
+                        "ON CONFLICT(id) DO UPDATE SET agent = excluded.agent, "
+                        "updated_at = excluded.updated_at, turns = turns + 2",
+                        {
+                            "id": data["conversation_id"],
+                            "agent": data["agent"],
+                            "title": data["query"][:TITLE_MAX_CHARS],
+                            "created_at": data["created_at"],
+                        },
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO turns (conversation_id, role, content, agent, model, input_tokens, "
+                        "output_tokens, latency_ms, cached, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (data["conversation_id"], "user", data["query"], data["agent"], None, None, None, None, 0,
+                             data["created_at"]),
+                            (data["conversation_id"], "assistant", data["response"], data["agent"], data["model"],
+                             data["input_tokens"], data["output_tokens"], data["latency_ms"], int(data["cached"]),
+                             data["created_at"]),
+                        ],
+                    )
+
+    def conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, agent, title, created_at, updated_at, turns FROM conversations WHERE id = ?",
+                (conversation_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "agent", "title", "created_at", "updated_at", "turns"), row))
+
+    def page(self, conversation_id: str, limit: int, before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return up to `limit` turns older than turn id `before` (newest page if None), oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, role, content, agent, model, input_tokens, output_tokens, latency_ms, cached, created_at "
+                "FROM turns WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (conversation_id, before if before is not None else 2 ** 63 - 1, limit),
+            ).fetchall()
+        columns = ("id", "role", "content", "agent", "model", "input_tokens", "output_tokens", "latency_ms", "cached", "timestamp")
+        turns = [dict(zip(columns, row)) for row in reversed(rows)]
+        for turn in turns:
+            turn["cached"] = bool(turn["cached"])
+        return turns
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (conversations,) = self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()
+            (turns,) = self._conn.execute("SELECT COUNT(*) FROM turns").fetchone()
+        return {"backend": "sqlite", "path": self.path, "conversations": conversations, "turns": turns}
+
+
+class ConversationHistory:
+    """
+    Durable record of every exchange: queries, answers, model ids, token counts and latencies.
+
+    Requests never wait for the database. Exchanges are put on an in-memory queue and a
+    background thread writes them in batches of up to `batch_size`, at least every
+    `flush_interval` seconds, in a single transaction. If the queue is full the record
+    is dropped (and counted) rather than slowing the request down. Reads flush the queue
+    first, so a conversation's latest exchange is always visible to its own client.
+    """
+
+    def __init__(self, store=None, batch_size: int = 100, flush_interval: float = 0.5, max_queue: int = 10000):
+        self.store = store
+        self.enabled = store is not None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue(maxsize=max_queue)
+        self._pending = 0
+        self._idle = threading.Condition()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+        self._writer: Optional[threading.Thread] = None
+        if self.enabled:
+            self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+            self._writer.start()
+
+    @classmethod
+    def from_env(cls) -> "ConversationHistory":
+        if os.getenv("HISTORY_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return cls(None)
+
+        backend = os.getenv("HISTORY_BACKEND", "sqlite").lower()
+        if backend == "sqlite":
+            store = SQLiteHistoryStore(os.getenv("HISTORY_DB_PATH", "history.db"))
+        else:
+            raise ValueError(f"Unknown HISTORY_BACKEND: {backend}")
+
+        history = cls(
+            store,
+            batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "100")),
+            flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5")),
+            max_queue=int(os.getenv("HISTORY_QUEUE_SIZE", "10000")),
+        )
+        logger.info(f"Conversation history: backend={backend}, batch_size={history.batch_size}")
+        return history
+
+    def _enqueue(self, op: str, data: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        with self._idle:
+            try:
+                self._queue.put_nowait((op, data))
+            except queue.Full:
+                self.dropped += 1
+                logger.warning(f"Conversation history queue is full, dropping {op} record")
+                return
+            self._pending += 1
+
+    def record_exchange(
+        self,
+        conversation_id: str,
+        agent: str,
+        query: str,
+        response: str,
+        model: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None,
+        latency_ms: Optional[float] = None,
+        cached: bool = False,
+    ) -> None:
+        """Queue one query and its answer for writing. Never blocks."""
+        usage = usage or {}
+        self._enqueue("exchange", {
+            "conversation_id": conversation_id,
+            "agent": agent,
+            "query": query,
+            "response": response,
+            "model": model,
+            "input_tokens": usage.get("input"),
+            "output_tokens": usage.get("output"),
+            "latency_ms": latency_ms,
+            "cached": cached,
+            "created_at": time.time(),
+        })
+
+    def delete(self, conversation_id: str) -> None:
+        """Queue the removal of a conversation, after any of its exchanges still queued."""
+        self._enqueue("delete", {"id": conversation_id})
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self.store.write(batch)
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Could not write {len(batch)} conversation history records: {e}")
+            finally:
+                with self._idle:
+                    self._pending -= len(batch)
+                    self._idle.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything queued so far is written. Returns False on timeout."""
+        if not self.enabled:
+            return True
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def load(self, conversation_id: str, limit: int = 50) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Return a conversation's agent and its newest turns, to rebuild an expired session.
+
+        Returns:
+            Optional[Tuple[str, List[Dict[str, Any]]]]: The agent and turns, oldest first, or None if unknown
+        """
+        if not self.enabled:
+            return None
+        # No flush here: this runs on the request path, and a session only needs restoring
+        # long after its last exchange was written
+        conversation = self.store.conversation(conversation_id)
+        if conversation is None:
+            return None
+        return conversation["agent"], self.store.page(conversation_id, limit)
+
+    def page(self, conversation_id: str, limit: int = 50, before: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return one page of a conversation's turns, newest page first.
+
+        Args:
+            conversation_id (str): The session id the conversation was recorded under
+            limit (int): Turns per page
+            before (Optional[int]): Only return turns older than this turn id (the previous page's `next_before`)
+
+        Returns:
+            Optional[Dict[str, Any]]: The conversation with its `messages` and the cursor of the next page, or None
+        """
+        self.flush(timeout=1.0)
+        conversation = self.store.conversation(conversation_id)
+        if conversation is None:
+            return None
+        turns = self.store.page(conversation_id, limit + 1, before)
+        has_more = len(turns) > limit
+        turns = turns[-limit:] if has_more else turns
+        conversation["messages"] = turns
+        conversation["has_more"] = has_more
+        conversation["next_before"] = turns[0]["id"] if has_more else None
+        return conversation
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write out what is still queued; called on shutdown."""
+        if self.enabled and not self.flush(timeout):
+            logger.warning(f"Shutting down with {self._pending} conversation history records unwritten")
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        stats = self.store.stats()
+        stats.update({
+            "enabled": True,
+            "queued": self._pending,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        })
+        return stats
@@ -0,0 +1,169 @@
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterable, List, Optional
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest image side sent to the vision model; larger images only add tokens, not detail
+MAX_IMAGE_SIDE = int(os.getenv("VISION_MAX_IMAGE_SIDE", "1120"))
+JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+MAX_UPLOAD_BYTES = int(os.getenv("VISION_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+CACHE_SIZE = int(os.getenv("VISION_IMAGE_CACHE_SIZE", "64"))
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageProcessingError(ValueError):
+    """Raised when an uploaded image cannot be decoded or is too large."""
+
+
+@dataclass(frozen=True)
+class ProcessedImage:
+    """An image decoded once and re-encoded at the size the vision model benefits from."""
+
+    sha256: str
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+
+    @property
+    def format(self) -> str:
+        return self.mime_type.split("/")[1]
+
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+
+class ImageCache:
+    """Small LRU of processed images keyed by the content hash of the original bytes."""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, ProcessedImage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[ProcessedImage]:
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, image: ProcessedImage) -> None:
+        with self._lock:
+            self._entries[image.sha256] = image
+            self._entries.move_to_end(image.sha256)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+image_cache = ImageCache(CACHE_SIZE)
+
+
+def _hash_stream(stream: BinaryIO) -> tuple:
+    """Hash a seekable stream in chunks, enforcing the upload size limit."""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise ImageProcessingError(f"Image exceeds the {MAX_UPLOAD_BYTES} byte limit")
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+def _downscale(stream: BinaryIO, sha256: str, size: int) -> ProcessedImage:
+    try:
+        with Image.open(stream) as img:
+            # Let the JPEG decoder skip detail we are about to throw away
+            img.draft("RGB", (MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.Resampling.LANCZOS)
+
+            if img.mode in ("RGBA", "LA", "P"):
+                # Flatten transparency onto white so the result can be a compact JPEG
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    except ImageProcessingError:
+        raise
+    except Exception as e:
+        raise ImageProcessingError(f"Could not decode image: {str(e)}")
+
+    return ProcessedImage(
+        sha256=sha256,
+        data=out.getvalue(),
+        mime_type="image/jpeg",
+        width=img.width,
+        height=img.height,
+        original_bytes=size,
+    )
+
+
+def process_image_stream(stream: BinaryIO) -> ProcessedImage:
+    """
+    Decode, downscale and re-encode an image from a seekable binary stream.
+
+    Identical images (by SHA-256 of the original bytes) are processed only once.
+    """
+    sha256, size = _hash_stream(stream)
+    cached = image_cache.get(sha256)
+    if cached is not None:
+        return cached
+
+    image = _downscale(stream, sha256, size)
+    image_cache.put(image)
+    logger.info(
+        f"Processed image {sha256[:12]}: {size} -> {len(image.data)} bytes, {image.width}x{image.height}"
+    )
+    return image
+
+
+def process_image_base64(data: str) -> ProcessedImage:
+    """Process a base64 image payload, with or without a data URL prefix."""
+    if data.startswith("data:"):
+        data = data.split(",", 1)[1]
+    try:
+        raw = base64.b64decode(data, validate=False)
+    except Exception as e:
+        raise ImageProcessingError(f"Invalid base64 image data: {str(e)}")
+    return process_image_stream(io.BytesIO(raw))
+
+
+def dedupe_images(images: Iterable[ProcessedImage]) -> List[ProcessedImage]:
+    """Drop repeated images within a single request, keeping the first occurrence."""
+    seen = set()
+    unique = []
+    for image in images:
+        if image.sha256 not in seen:
+            seen.add(image.sha256)
+            unique.append(image)
+    return unique
@@ -0,0 +1,474 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from cache import redis_url
+from deadlines import CancelToken
+from metrics import JOB_SECONDS, JOBS
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+# A job still "running" this long after its deadline lost its worker (e.g. a killed process)
+LOST_JOB_GRACE = 60.0
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at JOB_MAX_QUEUED."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+@dataclass
+class Job:
+    """A background agent run and its outcome."""
+
+    id: str
+    agent: str
+    query: str
+    session_id: Optional[str] = None
+    model_tier: Optional[str] = None
+    status: str = "queued"  # queued, running, succeeded, failed or cancelled
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    deadline: Optional[float] = None  # Wall-clock time by which a running job must finish
+    response: Optional[str] = None
+    model_used: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        return cls(**data)
+
+    def copy(self) -> "Job":
+        return Job.from_dict(self.to_dict())
+
+
+class MemoryJobStore:
+    """In-process job queue, records and progress events; finished jobs expire after `ttl`."""
+
+    def __init__(self, ttl: float = 86400.0):
+        self.ttl = ttl
+        self._jobs: Dict[str, Job] = {}
+        self._events: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        self._cancelled: set = set()
+        self._queue: Deque[str] = deque()
+        self._lock = threading.Condition()
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished and (j.finished_at or 0) < cutoff]:
+            self._jobs.pop(job_id, None)
+            self._events.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+    def create(self, job: Job) -> None:
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job.copy()
+            self._events[job.id] = []
+            self._queue.append(job.id)
+            self._lock.notify()
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job.copy()
+
+    def transition(self, job: Job, expected: Tuple[str, ...]) -> bool:
+        """Save `job` only if the stored job's status is one of `expected`; True if it was saved."""
+        with self._lock:
+            current = self._jobs.get(job.id)
+            if current is None or current.status not in expected:
+                return False
+            self._jobs[job.id] = job.copy()
+            return True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            # Callers update their copy and save it back
+            return job.copy() if job else None
+
+    def next_job(self, timeout: float) -> Optional[str]:
+        with self._lock:
+            if not self._queue:
+                self._lock.wait(timeout)
+            return self._queue.popleft() if self._queue else None
+
+    def add_event(self, job_id: str, event: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._events.setdefault(job_id, []).append((event, data))
+
+    def events(self, job_id: str, start: int = 0) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return list(self._events.get(job_id, [])[start:])
+
+    def request_cancel(self, job_id: str) -> None:
+        with self._lock:
+            self._cancelled.add(job_id)
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._cancelled
+
+    def queued(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {"backend": "memory", "queued": len(self._queue), "jobs": statuses}
+
+
+# Compare-and-set of a job record's status; ARGV: new record, ttl, expected statuses...
+TRANSITION_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then return 0 end
+local status = cjson.decode(current)['status']
+for i = 3, #ARGV do
+  if ARGV[i] == status then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    return 1
+  end
+end
+return 0
+"""
+
+
+class RedisJobStore:
+    """
+    Job queue and records in Redis (or a compatible server such as Valkey), so several
+    processes or hosts can share one queue. Needs the `redis` package.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl: float = 86400.0, prefix: str = "agentium:jobs"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ValueError("JOB_BACKEND=redis requires the redis package (pip install redis)") from e
+        self.url = url
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._transition = self._redis.register_script(TRANSITION_SCRIPT)
+
+    def _key(self, job_id: str, suffix: str = "") -> str:
+        return f"{self.prefix}:{job_id}{suffix}"
+
+    def create(self, job: Job) -> None:
+        pipe = self._redis.pipeline()
+        pipe.set(self._key(job.id), json.dumps(job.to_dict()), ex=self.ttl)
+        pipe.rpush(f"{self.prefix}:queue", job.id)
+        pipe.execute()
+
+    def save(self, job: Job) -> None:
+        self._redis.set(self._key(job.id), json.dumps(job.to_dict()), ex=self.ttl)
+
+    def transition(self, job: Job, expected: Tuple[str, ...]) -> bool:
+        return bool(self._transition(keys=[self._key(job.id)], args=[json.dumps(job.to_dict()), self.ttl, *expected]))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        data = self._redis.get(self._key(job_id))
+        return Job.from_dict(json.loads(data)) if data else None
+
+    def next_job(self, timeout: float) -> Optional[str]:
+        item = self._redis.blpop([f"{self.prefix}:queue"], timeout=max(1, int(timeout)))
+        return item[1] if item else None
+
+    def add_event(self, job_id: str, event: str, data: Dict[str, Any]) -> None:
+        pipe = self._redis.pipeline()
+        pipe.rpush(self._key(job_id, ":events"), json.dumps([event, data]))
+        pipe.expire(self._key(job_id, ":events"), self.ttl)
+        pipe.execute()
+
+    def events(self, job_id: str, start: int = 0) -> List[Tuple[str, Dict[str, Any]]]:
+        return [tuple(json.loads(item)) for item in self._redis.lrange(self._key(job_id, ":events"), start, -1)]
+
+    def request_cancel(self, job_id: str) -> None:
+        self._redis.set(self._key(job_id, ":cancel"), "1", ex=self.ttl)
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return bool(self._redis.exists(self._key(job_id, ":cancel")))
+
+    def queued(self) -> int:
+        return self._redis.llen(f"{self.prefix}:queue")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "queued": self.queued()}
+
+
+class JobContext:
+    """
+    Handed to the job runner to report progress and to notice cancellation.
+
+    Content deltas are buffered and sent as one event every `flush_interval` seconds,
+    and cancellation is looked up at most as often, so a remote store is not called
+    for every token. A cancelled job also cancels `token`, the CancelToken its run
+    executes under, so model and tool calls in progress stop early.
+    """
+
+    def __init__(self, store, job: Job, flush_interval: float = 0.25, token: Optional[CancelToken] = None):
+        self.store = store
+        self.job = job
+        self.token = token
+        self.flush_interval = flush_interval
+        self._content: List[str] = []
+        self._last_flush = time.monotonic()
+        self._last_cancel_check = 0.0
+
+    def emit(self, event: str, data: Dict[str, Any]) -> None:
+        self.flush()
+        self.store.add_event(self.job.id, event, data)
+
+    def emit_content(self, delta: str) -> None:
+        self._content.append(delta)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._content:
+            self.store.add_event(self.job.id, "content", {"delta": "".join(self._content)})
+            self._content = []
+        self._last_flush = time.monotonic()
+
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if the job has been cancelled since the last check."""
+        now = time.monotonic()
+        if now - self._last_cancel_check < self.flush_interval:
+            return
+        self._last_cancel_check = now
+        if self.store.cancel_requested(self.job.id):
+            if self.token is not None:
+                self.token.cancel("cancelled")
+            raise JobCancelled()
+
+
+class JobManager:
+    """
+    Runs long agent requests in the background on dedicated worker threads.
+
+    Jobs do not take run slots from the interactive executor, so a queue of slow research
+    or transcript jobs cannot starve chat requests; at most `workers` jobs run at once per
+    process and the rest wait in the store's queue. The runner reports progress through a
+    JobContext, which clients follow as Server-Sent Events, and checks it for cancellation
+    between steps of the run.
+    """
+
+    def __init__(self, store, workers: int = 2, max_queued: int = 100, timeout: Optional[float] = 1800.0):
+        self.store = store
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._runner: Optional[Callable[[Job, JobContext], Dict[str, Any]]] = None
+        self._timeout_for: Callable[[str], Optional[float]] = lambda agent: None
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._running = 0
+        self._active: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "JobManager":
+        backend = os.getenv("JOB_BACKEND", "memory").lower()
+        ttl = float(os.getenv("JOB_RESULT_TTL", "86400"))
+        if backend == "memory":
+            store = MemoryJobStore(ttl=ttl)
+        elif backend == "redis":
+            store = RedisJobStore(redis_url("JOB"), ttl=ttl)
+        else:
+            raise ValueError(f"Unknown JOB_BACKEND: {backend}")
+        return cls(
+            store,
+            workers=int(os.getenv("JOB_WORKERS", "2")),
+            max_queued=int(os.getenv("JOB_MAX_QUEUED", "100")),
+            timeout=float(os.getenv("JOB_TIMEOUT", "1800")) or None,
+        )
+
+    def start(
+        self,
+        runner: Callable[[Job, JobContext], Dict[str, Any]],
+        timeout_for: Optional[Callable[[str], Optional[float]]] = None,
+    ) -> None:
+        """
+        Start the worker threads.
+
+        Args:
+            runner: Executes one job and returns its result fields
+            timeout_for: The time limit of a job for an agent type (None for `timeout`, 0 for no limit)
+        """
+        self._runner = runner
+        if timeout_for is not None:
+            self._timeout_for = timeout_for
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Job workers started: workers={self.workers}, backend={self.store.stats()['backend']}")
+
+    def stop(self) -> None:
+        """Stop taking new jobs; runs in progress finish on their own."""
+        self._stopping.set()
+
+    def drain(self, timeout: float) -> int:
+        """
+        Stop taking new jobs and wait up to `timeout` seconds for running ones to finish.
+
+        Worker threads are daemons and die with the process, so jobs still running after
+        the timeout are marked failed rather than being left "running" in a shared store.
+
+        Returns:
+            int: The number of jobs that were interrupted
+        """
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            interrupted = list(self._active.values())
+        for job in interrupted:
+            try:
+                self._finish(job, "failed", ("running",), error="interrupted by shutdown")
+            except Exception as e:
+                logger.error(f"Could not mark job {job.id} as interrupted: {e}")
+        if interrupted:
+            logger.warning(f"{len(interrupted)} job(s) interrupted by shutdown")
+        return len(interrupted)
+
+    def submit(self, agent: str, query: str, session_id: Optional[str] = None, model_tier: Optional[str] = None) -> Job:
+        if self.store.queued() >= self.max_queued:
+            raise JobQueueFull(f"{self.max_queued} jobs are already queued, please retry later")
+        job = Job(id=uuid.uuid4().hex, agent=agent, query=query, session_id=session_id, model_tier=model_tier)
+        self.store.create(job)
+        self.store.add_event(job.id, "status", {"status": job.status})
+        logger.info(f"Job {job.id} queued: agent={agent}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job; one left running long past its deadline is marked failed first."""
+        job = self.store.get(job_id)
+        if job is not None and job.status == "running" and job.deadline and time.time() > job.deadline + LOST_JOB_GRACE:
+            if self._finish(job, "failed", ("running",), error="job worker lost"):
+                logger.warning(f"Job {job.id} lost its worker")
+            job = self.store.get(job_id)
+        return job
+
+    def events(self, job_id: str, start: int = 0) -> List[Tuple[str, Dict[str, Any]]]:
+        return self.store.events(job_id, start)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job. A queued job is cancelled at once; a running one stops at its next step.
+
+        Returns:
+            Optional[Job]: The job, or None if it does not exist
+        """
+        job = self.store.get(job_id)
+        if job is None or job.finished:
+            return job
+        self.store.request_cancel(job_id)
+        # A worker may take the job at the same moment; then it stops at its first step
+        if job.status == "queued" and not self._finish(job, "cancelled", ("queued",)):
+            job = self.store.get(job_id) or job
+        return job
+
+    def _finish(self, job: Job, status: str, expected: Tuple[str, ...] = ("running",), **fields: Any) -> bool:
+        """Move a job from one of the `expected` statuses to a final one; False if it had moved on."""
+        job.status = status
+        job.finished_at = time.time()
+        for name, value in fields.items():
+            setattr(job, name, value)
+        if not self.store.transition(job, expected):
+            return False
+        self.store.add_event(job.id, "status", {
+            "status": status,
+            "response": job.response,
+            "model_used": job.model_used,
+            "error": job.error,
+        })
+        JOBS.labels(agent=job.agent, status=status).inc()
+        if job.started_at is not None:
+            JOB_SECONDS.labels(agent=job.agent).observe(job.finished_at - job.started_at)
+        return True
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job_id = self.store.next_job(timeout=1.0)
+                if job_id is None:
+                    continue
+                job = self.store.get(job_id)
+                if job is None or job.status != "queued" or self.store.cancel_requested(job_id):
+                    continue
+                self._run(job)
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+                time.sleep(1.0)
+
+    def job_timeout(self, agent_type: str) -> Optional[float]:
+        """Seconds a job of `agent_type` may run, None for no limit."""
+        timeout = self._timeout_for(agent_type)
+        if timeout is None:
+            timeout = self.timeout
+        return timeout or None
+
+    def _run(self, job: Job) -> None:
+        timeout = self.job_timeout(job.agent)
+        job.status = "running"
+        job.started_at = time.time()
+        job.deadline = job.started_at + timeout if timeout else None
+        # Cancelled (or taken by another worker) between being dequeued and now
+        if not self.store.transition(job, ("queued",)):
+            return
+        self.store.add_event(job.id, "status", {"status": "running"})
+        token = CancelToken.child(timeout)
+        context = JobContext(self.store, job, token=token)
+        with self._lock:
+            self._running += 1
+            self._active[job.id] = job
+        try:
+            result = token.run(self._runner, job, context)
+            context.flush()
+            if self._finish(job, "succeeded", **result):
+                logger.info(f"Job {job.id} succeeded in {job.finished_at - job.started_at:.1f}s")
+        except Exception as e:
+            context.flush()
+            # The token's reason may come from elsewhere, so the job's own state decides
+            if isinstance(e, JobCancelled) or self.store.cancel_requested(job.id):
+                self._finish(job, "cancelled")
+                logger.info(f"Job {job.id} cancelled")
+            elif job.deadline is not None and time.time() >= job.deadline:
+                self._finish(job, "failed", error=f"Job did not finish within {timeout:g} seconds")
+                logger.warning(f"Job {job.id} timed out after {timeout:g}s")
+            else:
+                self._finish(job, "failed", error=str(e))
+                logger.error(f"Job {job.id} failed: {e}")
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._active.pop(job.id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.store.stats()
+        stats.update({"workers": self.workers, "running": self._running, "max_queued": self.max_queued})
+        return stats
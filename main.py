@@ -1,14 +1,49 @@
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, Form, Header, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-import base64
-import io
+from typing import List, Optional, Dict, Any, Tuple
 import os
+import time
 from dotenv import load_dotenv
-from PIL import Image
-from agents import get_agent
+from agents import agent_pool, agent_registry, groq_rate_limiter
+from assets import StaticAssets
+from cache import ResponseCache, parse_cache_control
+from context import ContextBuilder, token_counter
+from deadlines import CancelToken, RequestCancelled, cancel_token, parse_request_timeout, tool_timeouts
+from executor import AgentCapacityError, AgentTimeoutError, get_executor
+from history import ConversationHistory
+from jobs import FINISHED_STATUSES, Job, JobContext, JobManager, JobQueueFull
+from metrics import (
+    CONTENT_TYPE_LATEST,
+    CONTEXT_TOKENS,
+    ESCALATIONS,
+    IN_FLIGHT,
+    MODEL_CALL_SECONDS,
+    REQUEST_SECONDS,
+    REQUESTS,
+    ROUTE_DECISIONS,
+    SEMANTIC_CACHE_LOOKUPS,
+    observe_parse,
+    observe_stage,
+    record_run_metrics,
+    register_stats_collector,
+    render_metrics,
+    request_usage,
+    server_timing_header,
+    stage,
+    start_request_trace,
+)
+from images import ImageProcessingError, ProcessedImage, dedupe_images, image_cache, process_image_base64, process_image_stream
+from ratelimit import PRIORITIES, request_priority, retry_after_from
+from registry import AgentRegistry, UnknownAgentError
+from router import QueryRouter
+from semantic_cache import SemanticCache
+from sessions import Session, SessionManager, Turn
+from tool_cache import tool_cache
+from vision import vision_selector
 import json
 
 # Set up logging
@@ -50,29 +85,744 @@ class ChatMessage(BaseModel):
     files: Optional[List[FileData]] = None
 
 class ChatRequest(BaseModel):
-    agent: str
+    agent: str  # An agent id, or "auto" to let the router pick the agent and model tier
     query: str
-    messages: List[ChatMessage]
+    messages: List[ChatMessage] = []  # Full client-side history (legacy clients only)
     useVisionModel: Optional[bool] = False
     files: Optional[List[FileData]] = None
+    session_id: Optional[str] = None  # Server-side session to continue
+    cache_control: Optional[str] = None  # "no-cache" skips cached answers, "no-store" also skips storing
+    model_tier: Optional[str] = None  # "fast" uses the agent's fast variant, if it has one
+    priority: Optional[str] = None  # "interactive" (default) or "batch", which yields to interactive traffic
 
 class ChatResponse(BaseModel):
     response: str
     agent_used: str
     model_used: str
+    session_id: Optional[str] = None
+    cached: bool = False
+    routed: bool = False  # The agent was picked by the router (agent="auto")
+    escalated: bool = False  # The fast-tier answer was not good enough and was redone on the default model
+
+class JobRequest(BaseModel):
+    agent: str  # An agent id, or "auto"
+    query: str
+    session_id: Optional[str] = None
+    model_tier: Optional[str] = None
+
+class FanoutRequest(BaseModel):
+    agents: List[str]  # Agent types to ask concurrently
+    query: str
+    session_id: Optional[str] = None
+    timeout: Optional[float] = None  # Seconds per agent, on top of each agent's own timeout
+    synthesize: bool = False  # Merge the answers with a synthesizer agent
+    synthesizer: Optional[str] = None  # Agent that merges the answers (default FANOUT_SYNTHESIZER)
+    cache_control: Optional[str] = None
+
+class AgentResult(BaseModel):
+    agent: str
+    status: str  # ok, timeout, rejected or error
+    response: Optional[str] = None
+    model_used: Optional[str] = None
+    cached: bool = False
+    error: Optional[str] = None
+    elapsed_ms: float
+
+class FanoutResponse(BaseModel):
+    response: str  # The synthesis, or the successful answers one after another
+    results: List[AgentResult]
+    synthesis: Optional[AgentResult] = None
+    session_id: Optional[str] = None
+
+FANOUT_MAX_AGENTS = int(os.getenv("FANOUT_MAX_AGENTS", "6"))
+FANOUT_SYNTHESIZER = os.getenv("FANOUT_SYNTHESIZER", "general")
+# Longest part of each answer passed on to the synthesizer
+FANOUT_SYNTHESIS_MAX_CHARS = int(os.getenv("FANOUT_SYNTHESIS_MAX_CHARS", "6000"))
+# Seconds between checks for new job events on /jobs/{id}/events
+JOB_EVENTS_POLL_INTERVAL = 0.5
+# Seconds /health reuses the stats it reads from SQLite and Redis
+HEALTH_STATS_TTL = float(os.getenv("HEALTH_STATS_TTL", "5"))
+
+static_assets = StaticAssets.from_env()
+conversation_history = ConversationHistory.from_env()
+job_manager = JobManager.from_env()
+session_manager = SessionManager.from_env(history=conversation_history if conversation_history.enabled else None)
+response_cache = ResponseCache.from_env()
+semantic_cache = SemanticCache.from_env()
+query_router = QueryRouter.from_env(agent_registry)
+context_builder = ContextBuilder.from_env(token_counter)
+
+def apply_agent_config(registry: AgentRegistry):
+    """Push per-agent concurrency, timeout and cache settings from the registry to the runtime."""
+    specs = registry.specs()
+    get_executor().configure(
+        concurrency={spec.id: spec.max_concurrency for spec in specs if spec.max_concurrency},
+        timeouts={spec.id: spec.timeout for spec in specs if spec.timeout},
+    )
+    response_cache.configure_ttls({spec.id: spec.cache_ttl for spec in specs if spec.cache_ttl is not None})
+    semantic_cache.configure_agents(spec.id for spec in specs if spec.semantic_cache)
+
+agent_registry.subscribe(apply_agent_config)
+
+register_stats_collector({
+    "executor": lambda: get_executor().stats(),
+    "agent_pool": agent_pool.stats,
+    "response_cache": response_cache.stats,
+    "semantic_cache": semantic_cache.stats,
+    "tool_cache": tool_cache.stats,
+    "image_cache": image_cache.stats,
+})
+
+@app.middleware("http")
+async def trace_agent_requests(request, call_next):
+    """Collect per-stage timings for agent requests and report them as Server-Timing."""
+    if not request.url.path.startswith("/agent/"):
+        return await call_next(request)
+
+    start_request_trace()
+    response = await call_next(request)
+    header = server_timing_header()
+    # Streams send their headers before the run finishes, so only complete responses get the header
+    if header and not response.headers.get("content-type", "").startswith("text/event-stream"):
+        response.headers["Server-Timing"] = header
+    return response
+
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+@app.api_route("/", methods=["GET", "HEAD"], include_in_schema=False)
+async def read_root(request: Request):
+    """Serve the web client from memory, compressed and with an ETag."""
+    return static_assets.respond(
+        static_assets.index,
+        request.headers.get("accept-encoding"),
+        request.headers.get("if-none-match"),
+        head=request.method == "HEAD",
+    )
+
+@app.api_route("/static/{name}", methods=["GET", "HEAD"], include_in_schema=False)
+async def read_static(name: str, request: Request, v: Optional[str] = None):
+    """Serve one of the web client's assets; anything else in the project directory is not exposed."""
+    asset = static_assets.get(name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return static_assets.respond(
+        asset,
+        request.headers.get("accept-encoding"),
+        request.headers.get("if-none-match"),
+        version=v,
+        head=request.method == "HEAD",
+    )
+
+def context_settings(request: ChatRequest) -> Tuple[Optional[str], int]:
+    """Return the model id a request's prompt is built for and its context token budget."""
+    try:
+        spec = agent_registry.resolve(request.agent, bool(request.useVisionModel), uses_fast_tier(request))
+    except UnknownAgentError:
+        return None, session_manager.token_budget
+    return spec.model, spec.context_tokens or session_manager.token_budget
+
+def build_full_query(request: ChatRequest, query: str) -> str:
+    """
+    Combine the conversation history sent by a legacy client with the current query.
+
+    Args:
+        request (ChatRequest): The incoming chat request
+        query (str): The stripped current query
+
+    Returns:
+        str: The prompt to send to the agent
+    """
+    model_id, budget = context_settings(request)
+    # Exclude the current message; token counts of the resent history come from the counter's cache
+    turns = [Turn(role=msg.role, content=msg.content, timestamp=0.0) for msg in request.messages[:-1] if msg.content]
+    full_query, tokens = context_builder.build(turns, query, model_id, budget)
+    CONTEXT_TOKENS.labels(agent=request.agent).observe(tokens)
+    return full_query
+
+def prepare_query_blocking(request: ChatRequest, query: str) -> Tuple[str, Optional[Session]]:
+    """
+    Build the prompt for a request and resolve its server-side session. Blocking.
+
+    Clients that send their own history (more than the current message) without a
+    session id keep the legacy behaviour. Everyone else gets a server-side session whose
+    history (and summary of older turns) is packed into the agent's token budget in
+    front of the query.
+
+    Returns:
+        Tuple[str, Optional[Session]]: The prompt and the session (None for legacy requests)
+    """
+    if len(request.messages) > 1 and not request.session_id:
+        return build_full_query(request, query), None
+
+    session = session_manager.get_or_create(request.session_id, request.agent)
+    model_id, budget = context_settings(request)
+    turns, summary = session.snapshot()
+    full_query, tokens = context_builder.build(turns, query, model_id, budget, summary)
+    CONTEXT_TOKENS.labels(agent=request.agent).observe(tokens)
+    return full_query, session
+
+async def prepare_query(request: ChatRequest, query: str) -> Tuple[str, Optional[Session]]:
+    """
+    Build the prompt and resolve the session without blocking the event loop.
+
+    A named session may be read from SQLite or Redis, or restored from the conversation
+    history, so those requests are prepared on a thread; new sessions need no I/O.
+    """
+    if request.session_id:
+        return await asyncio.to_thread(prepare_query_blocking, request, query)
+    return prepare_query_blocking(request, query)
+
+def record_exchange_blocking(
+    session: Session,
+    agent: str,
+    query: str,
+    response: str,
+    model_id: Optional[str],
+    started: float,
+    cached: bool = False,
+):
+    """Add an exchange to its session and queue it, with model, tokens and latency, for the conversation history."""
+    session_manager.record_exchange(session, query, response)
+    conversation_history.record_exchange(
+        session.id,
+        agent,
+        query,
+        response,
+        model_id,
+        dict(request_usage.get() or {}),
+        round((time.perf_counter() - started) * 1000, 1),
+        cached,
+    )
+
+async def record_exchange(
+    session: Session,
+    agent: str,
+    query: str,
+    response: str,
+    model_id: Optional[str],
+    started: float,
+    cached: bool = False,
+):
+    """`record_exchange_blocking` on a thread: saving the session writes to SQLite or Redis."""
+    await asyncio.to_thread(record_exchange_blocking, session, agent, query, response, model_id, started, cached)
+
+def response_cache_key(request: ChatRequest, full_query: str, images: Optional[List[ProcessedImage]] = None) -> Optional[str]:
+    """Return the response cache key for a request, or None if it must not be cached."""
+    if not response_cache.enabled or images:
+        return None
+    if request.useVisionModel and request.files and any(f.type == "image" for f in request.files):
+        return None
+    model_id = agent_pool.model_id(request.agent, request.useVisionModel, uses_fast_tier(request))
+    return response_cache.make_key(request.agent, model_id, full_query)
+
+async def semantic_cache_lookup(
+    request: ChatRequest,
+    query: str,
+    full_query: str,
+    read_cache: bool = True,
+    write_cache: bool = True,
+    images: Optional[List[ProcessedImage]] = None,
+) -> Tuple[Optional[Dict[str, Any]], Any]:
+    """
+    Look a question up in the semantic cache, embedding it on the worker pool.
+
+    Only standalone questions qualify: with conversation context in the prompt, or images,
+    the same words can call for a different answer.
+
+    Returns:
+        Tuple[Optional[Dict[str, Any]], Any]: The cached answer (None on a miss) and the
+        question's embedding to store the new answer under (None if it must not be stored)
+    """
+    if not semantic_cache.enabled_for(request.agent) or full_query != query or images:
+        return None, None
+    if not read_cache and not write_cache:
+        return None, None
+    if request.useVisionModel and request.files and any(f.type == "image" for f in request.files):
+        return None, None
+
+    model_id = agent_pool.model_id(request.agent, request.useVisionModel, uses_fast_tier(request))
+    with stage("semantic_cache", request.agent):
+        if not read_cache:
+            return None, await get_executor().run_in_pool(semantic_cache.embed, query)
+        hit, vector = await get_executor().run_in_pool(semantic_cache.lookup, request.agent, model_id, query)
+    SEMANTIC_CACHE_LOOKUPS.labels(agent=request.agent, result="hit" if hit else "miss").inc()
+    if hit is not None:
+        logger.info(f"Response served from semantic cache (similarity {hit['similarity']}): {hit['query'][:100]}")
+    return hit, vector if write_cache else None
+
+def apply_priority(priority: Optional[str]):
+    """Set the rate limit priority class of the model calls made for this request."""
+    if priority is None:
+        return
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(PRIORITIES)}")
+    request_priority.set(priority)
+
+def uses_fast_tier(request: ChatRequest) -> bool:
+    return request.model_tier == "fast"
+
+def may_escalate(request: ChatRequest, routed: bool) -> bool:
+    """True if a routed request runs on a fast model that differs from its agent's default one."""
+    return (
+        routed
+        and uses_fast_tier(request)
+        and agent_pool.model_id(request.agent, request.useVisionModel, fast=True)
+        != agent_pool.model_id(request.agent, request.useVisionModel)
+    )
+
+async def route_request(request: ChatRequest) -> bool:
+    """
+    Resolve `agent: "auto"` to a concrete agent and model tier, in place.
+
+    The heuristic router runs inline; the model-based modes call a small model and run on
+    the worker pool. An explicit model_tier from the client is kept.
+
+    Returns:
+        bool: True if the request was routed
+    """
+    if request.agent != "auto":
+        return False
+
+    query = (request.query or "").strip()
+    has_images = bool(request.useVisionModel and request.files and any(f.type == "image" for f in request.files))
+    with stage("route", "auto"):
+        if query_router.mode == "heuristic":
+            decision = query_router.route(query, has_images)
+        else:
+            decision = await get_executor().run_in_pool(query_router.route, query, has_images)
+
+    request.agent = decision.agent
+    if request.model_tier is None:
+        request.model_tier = "fast" if decision.fast else "default"
+    ROUTE_DECISIONS.labels(agent=decision.agent, tier=request.model_tier, source=decision.source).inc()
+    return True
+
+def get_model_id(agent) -> str:
+    """Return the model id of an agent, or 'unknown' if it cannot be determined."""
+    try:
+        return agent.model.id if hasattr(agent.model, 'id') else str(agent.model)
+    except Exception:
+        return "unknown"
+
+def validate_agent(agent_type: str):
+    """Reject agent types that are not in the registry (and have no fallback) with 400."""
+    try:
+        agent_registry.resolve(agent_type)
+    except UnknownAgentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def capacity_exception(error: AgentCapacityError) -> HTTPException:
+    """Translate an executor capacity error into a 429/503 response with Retry-After."""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=error.detail,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+def rate_limit_exception(retry_after: int) -> HTTPException:
+    """Translate an exhausted model rate limit into a 429 response with Retry-After."""
+    return HTTPException(
+        status_code=429,
+        detail="Model rate limit reached, please retry",
+        headers={"Retry-After": str(retry_after)},
+    )
 
-from fastapi.staticfiles import StaticFiles
+def cancellation_exception(error: RequestCancelled) -> HTTPException:
+    """Answer a cancelled request: 499 if the client went away, 504 if its deadline passed."""
+    if error.reason == "client disconnected":
+        return HTTPException(status_code=499, detail=str(error))
+    return HTTPException(status_code=504, detail=str(error))
 
-app.mount("/static", StaticFiles(directory="."), name="static")
-from fastapi.responses import HTMLResponse
+def request_cancelled() -> bool:
+    """Whether the current request has been cancelled or is past its deadline."""
+    token = cancel_token.get()
+    return token is not None and token.cancelled
 
-@app.get("/", response_class=HTMLResponse)
-async def read_root():
-    with open("index.html") as f:
-        return f.read()
+async def watch_disconnect(http_request: Request, token: CancelToken):
+    """
+    Cancel `token` as soon as the client disconnects.
+
+    The request body has already been read, so the only message left to receive is the
+    disconnect; waiting for it (rather than polling `is_disconnected()`, which never sees
+    it behind the HTTP middleware) costs nothing while the request runs.
+    """
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            logger.info(f"Client disconnected, cancelling {http_request.url.path}")
+            token.cancel("client disconnected")
+            return
+
+@asynccontextmanager
+async def request_deadline(http_request: Request, x_request_timeout: Optional[str] = None):
+    """
+    Give a request a CancelToken for its duration.
+
+    The token expires after the X-Request-Timeout header's seconds, if sent, and is
+    cancelled when the client disconnects. Agent runs, model calls and tool calls made on
+    behalf of the request inherit it, so abandoned work stops at its next step instead of
+    spending slots, rate limit capacity and tokens on an answer nobody will read.
+    """
+    try:
+        timeout = parse_request_timeout(x_request_timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid X-Request-Timeout header: {e}")
+
+    token = CancelToken(timeout)
+    reset = cancel_token.set(token)
+    watcher = asyncio.ensure_future(watch_disconnect(http_request, token))
+    try:
+        yield token
+    finally:
+        watcher.cancel()
+        cancel_token.reset(reset)
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that closes its body iterator however the response ends.
+
+    Starlette only reaches the body's cleanup by iterating it, so a client that leaves
+    before the first chunk (or a failing `http.response.start`) would leave an agent
+    stream, and the run slot it holds, open for good.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a single Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_agent_events(
+    agent_type: str,
+    use_vision: bool,
+    message: str,
+    query: str,
+    session: Optional[Session] = None,
+    cache_key: Optional[str] = None,
+    fast: bool = False,
+    semantic_vector=None,
+):
+    """
+    Run a pooled agent in streaming mode and translate Agno run events into SSE frames.
+
+    Args:
+        agent_type (str): The agent type requested by the client
+        use_vision (bool): Whether to use the vision-enabled agent
+        message (str): The prompt to send to the agent
+        query (str): The current query, recorded in the session once the run completes
+        session (Optional[Session]): The server-side session, if any
+        cache_key (Optional[str]): Where to store the completed answer in the response cache
+        fast (bool): Whether to use the agent's fast variant
+        semantic_vector: The query's embedding, to store the completed answer in the semantic cache
+
+    Yields:
+        str: SSE frames (start, content, tool_call_started, tool_call_completed, done, error)
+    """
+    status = "error"
+    completed = {}
+    # The generator may be closed from another context once its consumer is gone
+    token = cancel_token.get()
+
+    def on_complete(response: str, model_id: str):
+        nonlocal status
+        status = "ok"
+        completed.update(response=response, model_id=model_id)
+        if session is not None:
+            session_manager.record_exchange(session, query, response)
+        if cache_key is not None:
+            response_cache.set(cache_key, agent_type, response, model_id)
+        if semantic_vector is not None:
+            semantic_cache.store(agent_type, model_id, semantic_vector, query, response, response_cache.ttl_for(agent_type))
+
+    IN_FLIGHT.labels(agent=agent_type).inc()
+    started = checkout_started = time.perf_counter()
+    with agent_pool.checkout(agent_type, use_vision, fast) as agent:
+        observe_stage("checkout", agent_type, time.perf_counter() - checkout_started)
+        model_id = get_model_id(agent)
+
+        run_started = time.perf_counter()
+        try:
+            yield from stream_agent_run(agent, agent_type, message, session.id if session else None, on_complete)
+        finally:
+            elapsed = time.perf_counter() - run_started
+            observe_stage("model_call", agent_type, elapsed)
+            MODEL_CALL_SECONDS.labels(agent=agent_type, model=model_id).observe(elapsed)
+            record_run_metrics(agent_type, model_id, getattr(agent.run_response, "metrics", None))
+            if session is not None and completed:
+                # Recorded once the run's token counts are known; the session was updated before `done`
+                conversation_history.record_exchange(
+                    session.id,
+                    agent_type,
+                    query,
+                    completed["response"],
+                    completed["model_id"],
+                    dict(request_usage.get() or {}),
+                    round((time.perf_counter() - started) * 1000, 1),
+                )
+            if status == "error" and token is not None and token.cancelled:
+                status = "cancelled"
+            IN_FLIGHT.labels(agent=agent_type).dec()
+            REQUESTS.labels(endpoint="stream", agent=agent_type, status=status).inc()
+            REQUEST_SECONDS.labels(endpoint="stream", agent=agent_type).observe(time.perf_counter() - started)
+
+def stream_agent_run(agent, agent_type: str, message: str, session_id: Optional[str] = None, on_complete=None):
+    """Translate the streamed run events of a single agent run into SSE frames."""
+    from agno.run.response import RunEvent
+
+    model_id = get_model_id(agent)
+    yield sse_event("start", {"agent_used": agent_type, "model_used": model_id, "session_id": session_id})
+
+    chunks = []
+    run_started = time.perf_counter()
+    try:
+        for event in agent.run(message, stream=True, stream_intermediate_steps=True):
+            event_type = getattr(event, "event", None)
+
+            if event_type == RunEvent.run_response_content.value:
+                if event.content:
+                    if not chunks:
+                        observe_stage("first_token", agent_type, time.perf_counter() - run_started)
+                    chunks.append(str(event.content))
+                    yield sse_event("content", {"delta": str(event.content)})
+            elif event_type == RunEvent.tool_call_started.value and event.tool:
+                yield sse_event("tool_call_started", {
+                    "tool_call_id": event.tool.tool_call_id,
+                    "tool_name": event.tool.tool_name,
+                    "tool_args": event.tool.tool_args,
+                })
+            elif event_type == RunEvent.tool_call_completed.value and event.tool:
+                yield sse_event("tool_call_completed", {
+                    "tool_call_id": event.tool.tool_call_id,
+                    "tool_name": event.tool.tool_name,
+                    "tool_call_error": bool(event.tool.tool_call_error),
+                })
+            elif event_type == RunEvent.run_error.value:
+                raise RuntimeError(event.content or "Agent run failed")
+
+        if not chunks:
+            logger.warning("Empty streamed response from agent")
+            yield sse_event("content", {"delta": "I apologize, but I couldn't generate a response. Please try again."})
+        elif on_complete is not None:
+            on_complete("".join(chunks), get_model_id(agent))
+
+        yield sse_event("done", {"agent_used": agent_type, "model_used": get_model_id(agent), "session_id": session_id})
+        logger.info("Streamed response completed successfully")
+    except Exception as e:
+        token = cancel_token.get()
+        if token is not None and token.cancelled:
+            logger.info(f"Streamed run stopped: request {token.reason}")
+            yield sse_event("error", {"detail": f"Request {token.reason}"})
+            return
+        logger.error(f"Error streaming agent response: {str(e)}")
+        yield sse_event("error", {"detail": f"Agent execution failed: {str(e)}"})
+
+def load_request_images(request: ChatRequest) -> List[ProcessedImage]:
+    """Decode and downscale the base64 images attached to a JSON chat request."""
+    images = []
+    for file_data in request.files or []:
+        if file_data.type == "image" and file_data.data:
+            try:
+                images.append(process_image_base64(file_data.data))
+            except ImageProcessingError as e:
+                logger.warning(f"Skipping image {file_data.name}: {str(e)}")
+    return dedupe_images(images)
+
+def run_agent(agent, request: ChatRequest, query: str, full_query: str, images: List[ProcessedImage]) -> str:
+    """
+    Run an agent for a chat request, including the vision path and retries.
+
+    This is blocking and is executed on the agent worker pool.
+
+    Args:
+        agent (Agent): The agent to run
+        request (ChatRequest): The incoming chat request
+        query (str): The stripped current query
+        full_query (str): The query with conversation context prepended
+        images (List[ProcessedImage]): Downscaled images for the vision model
+
+    Returns:
+        str: The agent response content
+    """
+    # For vision model with images, we need special handling
+    if request.useVisionModel and images:
+        logger.info(f"Processing vision model request with {len(images)} images")
+
+        try:
+            # The invocation format is probed once per model, then reused
+            run_response = vision_selector.run(agent, get_model_id(agent), query, images)
+            response = run_response.content if hasattr(run_response, 'content') else str(run_response)
+            logger.info("Vision processing successful")
+        except Exception as e:
+            logger.error(f"Error processing vision request: {str(e)}")
+            if request_cancelled():
+                raise
+            # Fallback to text-only with image description
+            fallback_query = f"{query}\n\nNote: I received {len(images)} image(s) but couldn't process them visually. Please describe the image content if you need specific analysis."
+            run_response = agent.run(fallback_query)
+            response = run_response.content if hasattr(run_response, 'content') else str(run_response)
+            response = f"⚠️ **Vision Processing Issue**: {response}"
+
+    else:
+        logger.info("Processing regular model request")
+
+        # Call the agent with error handling
+        try:
+            logger.info("Calling agent.run()...")
+            run_response = agent.run(full_query)
+            response = run_response.content if hasattr(run_response, 'content') else str(run_response)
+            logger.info("Agent response received successfully")
+        except Exception as e:
+            logger.error(f"Error running agent: {str(e)}")
+            # Retrying a rate limited call only makes things worse; let the caller answer 429.
+            # Nor is there any point once the request is cancelled or out of time.
+            if retry_after_from(e) is not None or request_cancelled():
+                raise
+            # Try with just the original query if context caused issues
+            try:
+                logger.info("Retrying with simple query...")
+                run_response = agent.run(query)
+                response = run_response.content if hasattr(run_response, 'content') else str(run_response)
+                logger.info("Retry successful")
+            except Exception as retry_error:
+                logger.error(f"Retry also failed: {str(retry_error)}")
+                raise HTTPException(status_code=500, detail=f"Agent execution failed: {str(retry_error)}")
+
+    return response
+
+def run_agent_request(
+    request: ChatRequest, query: str, full_query: str, images: Optional[List[ProcessedImage]] = None
+) -> Tuple[str, str]:
+    """
+    Borrow an isolated agent from the pool and run it for a chat request.
+
+    Images from a multipart upload are passed in already processed; otherwise any
+    base64 images in the JSON request are decoded here, on the worker pool.
+
+    Returns:
+        Tuple[str, str]: The response content and the id of the model that produced it
+    """
+    if images is None:
+        with stage("image_decode", request.agent):
+            images = load_request_images(request) if request.useVisionModel else []
+
+    checkout_started = time.perf_counter()
+    with agent_pool.checkout(request.agent, request.useVisionModel, uses_fast_tier(request)) as agent:
+        observe_stage("checkout", request.agent, time.perf_counter() - checkout_started)
+        model_id = get_model_id(agent)
+
+        run_started = time.perf_counter()
+        try:
+            response = run_agent(agent, request, query, full_query, images)
+        finally:
+            elapsed = time.perf_counter() - run_started
+            observe_stage("model_call", request.agent, elapsed)
+            MODEL_CALL_SECONDS.labels(agent=request.agent, model=model_id).observe(elapsed)
+
+        record_run_metrics(request.agent, model_id, getattr(agent.run_response, "metrics", None))
+        return response, model_id
+
+def process_uploads(uploads: List[UploadFile]) -> List[ProcessedImage]:
+    """Decode and downscale uploaded images straight from their spooled files."""
+    return dedupe_images(process_image_stream(upload.file) for upload in uploads)
+
+def response_events(result: ChatResponse):
+    """Emit a complete ChatResponse as the SSE frames of the streaming endpoint."""
+    meta = {
+        "agent_used": result.agent_used,
+        "model_used": result.model_used,
+        "session_id": result.session_id,
+        "cached": result.cached,
+        "routed": result.routed,
+        "escalated": result.escalated,
+    }
+    yield sse_event("start", meta)
+    yield sse_event("content", {"delta": result.response})
+    yield sse_event("done", meta)
 
 @app.post("/agent/ask", response_model=ChatResponse)
-async def ask_agent(request: ChatRequest):
+async def ask_agent(
+    request: ChatRequest,
+    http_request: Request,
+    cache_control: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None),
+):
+    async with request_deadline(http_request, x_request_timeout):
+        return await answer_request(request, cache_control=cache_control)
+
+async def run_cached_agent(
+    request: ChatRequest,
+    query: str,
+    full_query: str,
+    images: Optional[List[ProcessedImage]] = None,
+    read_cache: bool = True,
+    write_cache: bool = True,
+) -> Tuple[str, str, bool]:
+    """
+    Answer a prepared prompt from the response cache, or run the agent on the worker pool.
+
+    Returns:
+        Tuple[str, str, bool]: The response, the model id and whether it came from the cache
+    """
+    # Serve repeated questions from the response cache when enabled
+    cache_key = response_cache_key(request, full_query, images)
+    if cache_key and read_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Response served from cache")
+            return cached["response"], cached["model_used"], True
+
+    # Then from an earlier answer to the same question in other words
+    similar, vector = await semantic_cache_lookup(request, query, full_query, read_cache, write_cache, images)
+    if similar is not None:
+        return similar["response"], similar["model_used"], True
+
+    # Run the agent on the worker pool so slow model and tool calls do not block the event loop
+    response, model_id = await get_executor().run(request.agent, run_agent_request, request, query, full_query, images)
+
+    # Validate response
+    if not response:
+        logger.warning("Empty response from agent")
+        return "I apologize, but I couldn't generate a response. Please try again.", model_id, False
+
+    if cache_key and write_cache:
+        response_cache.set(cache_key, request.agent, str(response), model_id)
+    if vector is not None:
+        semantic_cache.store(request.agent, model_id, vector, query, str(response), response_cache.ttl_for(request.agent))
+
+    logger.info("Response generated successfully")
+    return str(response), model_id, False
+
+async def answer_request(
+    request: ChatRequest,
+    images: Optional[List[ProcessedImage]] = None,
+    cache_control: Optional[str] = None,
+    routed: bool = False,
+) -> ChatResponse:
+    """
+    Validate a chat request, run its agent on the worker pool and record the exchange.
+
+    Requests for agent "auto" are routed first. A routed fast-tier answer that looks like
+    a refusal or a non-answer is redone once on the agent's default model.
+
+    Args:
+        request (ChatRequest): The incoming chat request
+        images (Optional[List[ProcessedImage]]): Already processed images from a multipart upload
+        cache_control (Optional[str]): Cache-Control header value, overriding request.cache_control
+        routed (bool): The request was already routed by the caller
+
+    Returns:
+        ChatResponse: The agent's answer
+    """
+    apply_priority(request.priority)
+    routed = await route_request(request) or routed
+    observe_parse(request.agent)
+    started = time.perf_counter()
+    status = "error"
+    IN_FLIGHT.labels(agent=request.agent).inc()
     try:
         logger.info(f"Request received: agent={request.agent}, useVisionModel={request.useVisionModel}")
         logger.info(f"Query: {request.query[:100]}...")  # Log first 100 chars of query
@@ -84,212 +834,702 @@ async def ask_agent(request: ChatRequest):
         if not request.agent:
             raise HTTPException(status_code=400, detail="Agent type must be specified")
 
-        # Get the appropriate agent
-        try:
-            agent = get_agent(request.agent, request.useVisionModel)
-            if agent is None:
-                raise HTTPException(status_code=400, detail=f"Invalid agent type: {request.agent}")
-        except Exception as e:
-            logger.error(f"Error getting agent: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to initialize agent: {str(e)}")
+        validate_agent(request.agent)
 
         # Prepare the query
         query = request.query.strip()
+        with stage("context", request.agent):
+            full_query, session = await prepare_query(request, query)
 
-        # For vision model with images, we need special handling
-        if request.useVisionModel and request.files and any(f.type == "image" for f in request.files):
-            logger.info("Processing vision model request with images")
+        read_cache, write_cache = parse_cache_control(cache_control or request.cache_control)
+        response, model_id, cached = await run_cached_agent(request, query, full_query, images, read_cache, write_cache)
 
-            try:
-                # For Agno vision models, we need to pass images as part of the message
-                images_data = []
-
-                for file_data in request.files:
-                    if file_data.type == "image" and file_data.data:
-                        # Remove data URL prefix if present (data:image/jpeg;base64,)
-                        image_data = file_data.data
-                        if image_data.startswith('data:'):
-                            image_data = image_data.split(',')[1]
-
-                        images_data.append({
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{file_data.mimeType};base64,{image_data}"
-                            }
-                        })
-
-                if images_data:
-                    logger.info(f"Processing {len(images_data)} images for vision model")
-
-                    # For Agno, we can pass images directly in the run method
-                    # The agent should handle multimodal input automatically
-                    try:
-                        # Method 1: Try passing images as a parameter to run()
-                        run_response = agent.run(query, images=images_data)
-                        response = run_response.content if hasattr(run_response, 'content') else str(run_response)
-                        logger.info("Vision processing successful with images parameter")
-                    except Exception as e1:
-                        logger.warning(f"Method 1 failed: {e1}, trying method 2")
-                        try:
-                            # Method 2: Try creating a multimodal message structure
-                            multimodal_message = {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": query}
-                                ] + [
-                                    {"type": "image_url", "image_url": img["image_url"]}
-                                    for img in images_data
-                                ]
-                            }
-                            run_response = agent.run(multimodal_message)
-                            response = run_response.content if hasattr(run_response, 'content') else str(run_response)
-                            logger.info("Vision processing successful with multimodal message")
-                        except Exception as e2:
-                            logger.warning(f"Method 2 failed: {e2}, trying method 3")
-                            try:
-                                # Method 3: Try using the image data directly with base64
-                                image_prompt = f"{query}\n\n[Image data provided as base64]"
-                                # Pass the first image as base64 directly
-                                first_image = images_data[0]["image_url"]["url"]
-                                run_response = agent.run(image_prompt, image=first_image)
-                                response = run_response.content if hasattr(run_response, 'content') else str(run_response)
-                                logger.info("Vision processing successful with direct base64")
-                            except Exception as e3:
-                                logger.error(f"All vision methods failed: {e1}, {e2}, {e3}")
-                                # Fallback to text-only with image description
-                                fallback_query = f"{query}\n\nNote: I received {len(images_data)} image(s) but couldn't process them visually. Please describe the image content if you need specific analysis."
-                                run_response = agent.run(fallback_query)
-                                response = run_response.content if hasattr(run_response, 'content') else str(run_response)
-                                response = f"⚠️ **Vision Processing Issue**: {response}"
-                else:
-                    # No valid images found
-                    run_response = agent.run(query)
-                    response = run_response.content if hasattr(run_response, 'content') else str(run_response)
-
-            except Exception as e:
-                logger.error(f"Error processing vision request: {str(e)}")
-                # Fallback to regular text processing
-                run_response = agent.run(f"{query}\n\n[Note: Image processing failed - {str(e)}]")
-                response = run_response.content if hasattr(run_response, 'content') else str(run_response)
+        escalated = False
+        if (
+            routed
+            and uses_fast_tier(request)
+            and query_router.needs_escalation(response)
+            and model_id != agent_pool.model_id(request.agent, request.useVisionModel)
+        ):
+            logger.info(f"Escalating {request.agent} answer from {model_id} to the default model")
+            ESCALATIONS.labels(agent=request.agent).inc()
+            request.model_tier = "default"
+            escalated = True
+            response, model_id, cached = await run_cached_agent(request, query, full_query, images, read_cache, write_cache)
 
-        else:
-            logger.info("Processing regular model request")
+        if session is not None:
+            await record_exchange(session, request.agent, query, response, model_id, started, cached)
 
-            # Build conversation context with error handling
-            conversation_context = ""
-            try:
-                if request.messages and len(request.messages) > 1:
-                    # Add recent conversation history for context
-                    recent_messages = request.messages[-6:]  # Last 6 messages for context
-                    for msg in recent_messages[:-1]:  # Exclude current message
-                        if msg.content:  # Only add non-empty messages
-                            role_label = "Human" if msg.role == "user" else "Assistant"
-                            conversation_context += f"{role_label}: {msg.content[:500]}\n"  # Limit message length
-            except Exception as e:
-                logger.warning(f"Error building conversation context: {str(e)}")
-                conversation_context = ""
-
-            # Combine context with current query
-            full_query = f"{conversation_context}\nHuman: {query}" if conversation_context else query
-
-            # Limit total query length to prevent issues
-            if len(full_query) > 4000:
-                full_query = full_query[-4000:]  # Keep last 4000 characters
-                logger.warning("Query truncated due to length")
-
-            # Call the agent with error handling
-            try:
-                logger.info("Calling agent.run()...")
-                run_response = agent.run(full_query)
-                response = run_response.content if hasattr(run_response, 'content') else str(run_response)
-                logger.info("Agent response received successfully")
-            except Exception as e:
-                logger.error(f"Error running agent: {str(e)}")
-                # Try with just the original query if context caused issues
-                try:
-                    logger.info("Retrying with simple query...")
-                    run_response = agent.run(query)
-                    response = run_response.content if hasattr(run_response, 'content') else str(run_response)
-                    logger.info("Retry successful")
-                except Exception as retry_error:
-                    logger.error(f"Retry also failed: {str(retry_error)}")
-                    raise HTTPException(status_code=500, detail=f"Agent execution failed: {str(retry_error)}")
-
-        # Validate response
-        if not response:
-            logger.warning("Empty response from agent")
-            response = "I apologize, but I couldn't generate a response. Please try again."
-
-        logger.info("Response generated successfully")
-
-        # Get model ID safely
-        try:
-            model_id = agent.model.id if hasattr(agent.model, 'id') else str(agent.model)
-        except:
-            model_id = "unknown"
-
-        return ChatResponse(
-            response=str(response),  # Ensure response is string
-            agent_used=request.agent,
-            model_used=model_id
-        )
+        with stage("serialize", request.agent):
+            result = ChatResponse(
+                response=response,
+                agent_used=request.agent,
+                model_used=model_id,
+                session_id=session.id if session else None,
+                cached=cached,
+                routed=routed,
+                escalated=escalated,
+            )
+        status = "cached" if cached else "ok"
+        return result
 
     except HTTPException:
         # Re-raise HTTP exceptions as-is
         raise
+    except AgentCapacityError as e:
+        status = "rejected"
+        raise capacity_exception(e)
+    except AgentTimeoutError as e:
+        status = "timeout"
+        raise HTTPException(status_code=504, detail=str(e))
+    except RequestCancelled as e:
+        status = "cancelled"
+        raise cancellation_exception(e)
     except Exception as e:
-        logger.error(f"Unexpected error in ask_agent: {str(e)}")
+        token = cancel_token.get()
+        if token is not None and token.cancelled:
+            status = "cancelled"
+            raise cancellation_exception(RequestCancelled(token.reason))
+        retry_after = retry_after_from(e)
+        if retry_after is not None:
+            status = "rejected"
+            raise rate_limit_exception(retry_after)
+        logger.error(f"Unexpected error in answer_request: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        IN_FLIGHT.labels(agent=request.agent).dec()
+        REQUESTS.labels(endpoint="ask", agent=request.agent, status=status).inc()
+        REQUEST_SECONDS.labels(endpoint="ask", agent=request.agent).observe(time.perf_counter() - started)
+
+@app.post("/agent/ask/stream")
+async def ask_agent_stream(
+    request: ChatRequest,
+    http_request: Request,
+    cache_control: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None),
+):
+    """
+    Stream an agent response as Server-Sent Events while it is being generated.
+
+    Once the response has started, a client disconnect cancels the stream and with it the
+    agent run; the X-Request-Timeout deadline keeps applying to the run.
+    """
+    async with request_deadline(http_request, x_request_timeout) as token:
+        return await start_agent_stream(request, token, cache_control)
+
+async def start_agent_stream(request: ChatRequest, token: CancelToken, cache_control: Optional[str] = None) -> StreamingResponse:
+    started = time.perf_counter()
+    apply_priority(request.priority)
+    routed = await route_request(request)
+    logger.info(f"Stream request received: agent={request.agent}, useVisionModel={request.useVisionModel}")
+
+    if not request.query or not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    if not request.agent:
+        raise HTTPException(status_code=400, detail="Agent type must be specified")
+
+    validate_agent(request.agent)
+
+    # Vision requests, and routed fast-tier requests (whose answer may have to be redone
+    # on the default model), are answered in one piece and emitted as a single content event
+    if (request.useVisionModel and request.files and any(f.type == "image" for f in request.files)) or may_escalate(request, routed):
+        result = await answer_request(request, cache_control=cache_control, routed=routed)
+        events = response_events(result)
+    else:
+        query = request.query.strip()
+        full_query, session = await prepare_query(request, query)
+
+        read_cache, write_cache = parse_cache_control(cache_control or request.cache_control)
+        cache_key = response_cache_key(request, full_query)
+        cached = response_cache.get(cache_key) if cache_key and read_cache else None
+        vector = None
+        if cached is None:
+            cached, vector = await semantic_cache_lookup(request, query, full_query, read_cache, write_cache)
+        if cached is not None:
+            logger.info("Streaming response served from cache")
+            if session is not None:
+                await record_exchange(session, request.agent, query, cached["response"], cached["model_used"], started, cached=True)
+            result = ChatResponse(
+                response=cached["response"],
+                agent_used=request.agent,
+                model_used=cached["model_used"],
+                session_id=session.id if session else None,
+                cached=True,
+            )
+            return StreamingResponse(response_events(result), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+        # Reserve a run slot before the response starts so overload surfaces as 429/503
+        executor = get_executor()
+        try:
+            await executor.acquire(request.agent)
+        except AgentCapacityError as e:
+            raise capacity_exception(e)
+
+        run_events = stream_agent_events(
+            request.agent,
+            request.useVisionModel,
+            full_query,
+            query,
+            session,
+            cache_key if write_cache else None,
+            uses_fast_tier(request),
+            vector,
+        )
+        events = executor.iterate(request.agent, run_events, parent=token)
+        return ClosingStreamingResponse(
+            events,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/agent/ask/upload")
+async def ask_agent_upload(
+    http_request: Request,
+    agent: str = Form(...),
+    query: str = Form(...),
+    session_id: Optional[str] = Form(None),
+    stream: bool = Form(False),
+    images: List[UploadFile] = File(...),
+    x_request_timeout: Optional[str] = Header(None),
+):
+    """
+    Ask the vision agent about images sent as multipart/form-data.
+
+    Image bytes are read from the spooled upload, decoded once, downscaled to the size
+    the vision model benefits from and deduplicated by content hash. Set `stream=true`
+    to receive the answer as Server-Sent Events.
+    """
+    logger.info(f"Upload request received: agent={agent}, images={len(images)}")
+    request = ChatRequest(agent=agent, query=query, session_id=session_id, useVisionModel=True)
+
+    try:
+        processed = await get_executor().run_in_pool(process_uploads, images)
+    except ImageProcessingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async with request_deadline(http_request, x_request_timeout):
+        result = await answer_request(request, processed)
+    if stream:
+        return StreamingResponse(response_events(result), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    return result
+
+async def prepare_fanout(request: FanoutRequest) -> Tuple[List[str], str, str, Optional[Session]]:
+    """
+    Validate a fan-out request and build the shared prompt.
+
+    Returns:
+        Tuple[List[str], str, str, Optional[Session]]: The agent types, the query, the prompt and the session
+    """
+    if not request.query or not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    agent_types = list(dict.fromkeys(a for a in request.agents if a))
+    if not agent_types:
+        raise HTTPException(status_code=400, detail="At least one agent must be specified")
+    if len(agent_types) > FANOUT_MAX_AGENTS:
+        raise HTTPException(status_code=400, detail=f"At most {FANOUT_MAX_AGENTS} agents can be asked at once")
+    for agent_type in agent_types:
+        validate_agent(agent_type)
+    if request.synthesize:
+        validate_agent(request.synthesizer or FANOUT_SYNTHESIZER)
+
+    query = request.query.strip()
+    chat_request = ChatRequest(agent="fanout", query=query, session_id=request.session_id)
+    full_query, session = await prepare_query(chat_request, query)
+    return agent_types, query, full_query, session
+
+async def run_fanout_agent(
+    agent_type: str,
+    query: str,
+    full_query: str,
+    timeout: Optional[float] = None,
+    cache_control: Optional[str] = None,
+) -> AgentResult:
+    """Run one agent of a fan-out; failures are reported in the result instead of raised."""
+    started = time.perf_counter()
+    status = "error"
+    error = None
+    read_cache, write_cache = parse_cache_control(cache_control)
+    try:
+        run = run_cached_agent(ChatRequest(agent=agent_type, query=query), query, full_query, None, read_cache, write_cache)
+        response, model_id, cached = await asyncio.wait_for(run, timeout)
+        status = "ok"
+        return AgentResult(
+            agent=agent_type,
+            status=status,
+            response=response,
+            model_used=model_id,
+            cached=cached,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+        )
+    except AgentCapacityError as e:
+        status, error = "rejected", e.detail
+    except (AgentTimeoutError, asyncio.TimeoutError):
+        status, error = "timeout", f"Agent '{agent_type}' did not answer in time"
+    except RequestCancelled as e:
+        status, error = "cancelled", str(e)
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except Exception as e:
+        logger.error(f"Fan-out agent {agent_type} failed: {str(e)}")
+        if request_cancelled():
+            status = "cancelled"
+        elif retry_after_from(e) is not None:
+            status = "rejected"
+        error = str(e)
+    finally:
+        REQUESTS.labels(endpoint="fanout", agent=agent_type, status=status).inc()
+        REQUEST_SECONDS.labels(endpoint="fanout", agent=agent_type).observe(time.perf_counter() - started)
+
+    return AgentResult(agent=agent_type, status=status, error=error, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+
+def synthesis_prompt(query: str, results: List[AgentResult]) -> str:
+    """Ask the synthesizer to merge the successful answers into one."""
+    parts = [f"Question: {query}\n"]
+    for result in results:
+        parts.append(f"### Answer from the {result.agent} agent\n{result.response[:FANOUT_SYNTHESIS_MAX_CHARS]}\n")
+    parts.append(
+        "Write a single answer to the question that combines the answers above. Keep the facts, "
+        "figures and sources they give, point out where they disagree, and do not mention the agents."
+    )
+    return "\n".join(parts)
+
+async def synthesize_results(request: FanoutRequest, query: str, results: List[AgentResult]) -> Optional[AgentResult]:
+    """Run the synthesizer over the successful answers; with fewer than two there is nothing to merge."""
+    answers = [r for r in results if r.status == "ok"]
+    if not request.synthesize or len(answers) < 2:
+        return None
+    prompt = synthesis_prompt(query, answers)
+    return await run_fanout_agent(request.synthesizer or FANOUT_SYNTHESIZER, prompt, prompt, request.timeout, request.cache_control)
 
-@app.get("/")
-async def root():
-    return {"message": "Agentium API is running"}
+def fanout_models(results: List[AgentResult], synthesis: Optional[AgentResult]) -> Optional[str]:
+    """The models that contributed to a fan-out answer, for the conversation history."""
+    models = [r.model_used for r in results + ([synthesis] if synthesis else []) if r.status == "ok" and r.model_used]
+    return ", ".join(dict.fromkeys(models)) or None
+
+def fanout_answer(results: List[AgentResult], synthesis: Optional[AgentResult]) -> str:
+    """The final answer: the synthesis if there is one, otherwise every successful answer in turn."""
+    if synthesis is not None and synthesis.status == "ok":
+        return synthesis.response
+    answers = [r for r in results if r.status == "ok"]
+    if len(answers) == 1:
+        return answers[0].response
+    if not answers:
+        return "I apologize, but none of the agents could answer. Please try again."
+    return "\n\n".join(f"## {r.agent}\n\n{r.response}" for r in answers)
+
+@app.post("/agent/fanout", response_model=FanoutResponse)
+async def ask_agents(
+    request: FanoutRequest,
+    http_request: Request,
+    cache_control: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None),
+):
+    """
+    Ask several agents the same question concurrently and optionally merge their answers.
+
+    Wall-clock time is that of the slowest agent (plus the synthesizer), not the sum.
+    """
+    started = time.perf_counter()
+    agent_types, query, full_query, session = await prepare_fanout(request)
+    cache_control = cache_control or request.cache_control
+
+    async with request_deadline(http_request, x_request_timeout) as token:
+        results = await asyncio.gather(
+            *(run_fanout_agent(a, query, full_query, request.timeout, cache_control) for a in agent_types)
+        )
+        synthesis = await synthesize_results(request, query, results)
+    if token.cancelled:
+        raise cancellation_exception(RequestCancelled(token.reason))
+    response = fanout_answer(results, synthesis)
+
+    if session is not None:
+        await record_exchange(session, "fanout", query, response, fanout_models(results, synthesis), started)
+    return FanoutResponse(
+        response=response,
+        results=results,
+        synthesis=synthesis,
+        session_id=session.id if session else None,
+    )
+
+@app.post("/agent/fanout/stream")
+async def ask_agents_stream(
+    request: FanoutRequest,
+    cache_control: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None),
+):
+    """
+    Stream a fan-out as Server-Sent Events: one `agent_result` event as each agent finishes,
+    then `synthesis` (if requested) and `done` with the final answer.
+    """
+    agent_types, query, full_query, session = await prepare_fanout(request)
+    cache_control = cache_control or request.cache_control
+    try:
+        token = CancelToken(parse_request_timeout(x_request_timeout))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid X-Request-Timeout header: {e}")
+
+    async def events():
+        started = time.perf_counter()
+        yield sse_event("start", {"agents": agent_types, "session_id": session.id if session else None})
+
+        # The agents' runs (and the synthesizer's) inherit the token
+        reset = cancel_token.set(token)
+        finished = False
+        tasks = [
+            asyncio.ensure_future(run_fanout_agent(a, query, full_query, request.timeout, cache_control))
+            for a in agent_types
+        ]
+        try:
+            results = []
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                results.append(result)
+                yield sse_event("agent_result", result.model_dump())
+
+            if request.synthesize and sum(r.status == "ok" for r in results) >= 2:
+                yield sse_event("synthesis_started", {"agent": request.synthesizer or FANOUT_SYNTHESIZER})
+            synthesis = await synthesize_results(request, query, results)
+            if synthesis is not None:
+                yield sse_event("synthesis", synthesis.model_dump())
+
+            response = fanout_answer(results, synthesis)
+            if session is not None:
+                await record_exchange(session, "fanout", query, response, fanout_models(results, synthesis), started)
+            finished = True
+            yield sse_event("done", {
+                "response": response,
+                "session_id": session.id if session else None,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+        finally:
+            # The client went away: stop the agents that are still running
+            for task in tasks:
+                task.cancel()
+            if not finished:
+                token.cancel("client disconnected")
+            cancel_token.reset(reset)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def run_job(job: Job, context: JobContext) -> Dict[str, Any]:
+    """
+    Run a background job's agent on a job worker thread.
+
+    Tool calls and content are reported as progress events, and cancellation is checked
+    between the events of the run. Model calls are made with batch priority, so jobs
+    yield rate limit capacity to interactive requests.
+
+    Returns:
+        Dict[str, Any]: The job's response and model_used
+    """
+    from agno.run.response import RunEvent
+
+    request_priority.set("batch")
+    request_usage.set({})
+    request = ChatRequest(agent=job.agent, query=job.query, session_id=job.session_id, model_tier=job.model_tier)
+    query = request.query.strip()
+    full_query, session = prepare_query_blocking(request, query)
+    if session is not None:
+        context.emit("session", {"session_id": session.id})
+
+    started = time.perf_counter()
+    with agent_pool.checkout(request.agent, False, uses_fast_tier(request)) as agent:
+        model_id = get_model_id(agent)
+        chunks = []
+        try:
+            for event in agent.run(full_query, stream=True, stream_intermediate_steps=True):
+                context.check_cancelled()
+                event_type = getattr(event, "event", None)
+                if event_type == RunEvent.run_response_content.value and event.content:
+                    chunks.append(str(event.content))
+                    context.emit_content(str(event.content))
+                elif event_type == RunEvent.tool_call_started.value and event.tool:
+                    context.emit("tool_call_started", {"tool_name": event.tool.tool_name, "tool_args": event.tool.tool_args})
+                elif event_type == RunEvent.tool_call_completed.value and event.tool:
+                    context.emit("tool_call_completed", {
+                        "tool_name": event.tool.tool_name,
+                        "tool_call_error": bool(event.tool.tool_call_error),
+                    })
+                elif event_type == RunEvent.run_error.value:
+                    raise RuntimeError(event.content or "Agent run failed")
+        finally:
+            elapsed = time.perf_counter() - started
+            MODEL_CALL_SECONDS.labels(agent=request.agent, model=model_id).observe(elapsed)
+            record_run_metrics(request.agent, model_id, getattr(agent.run_response, "metrics", None))
+
+    response = "".join(chunks) or "I apologize, but I couldn't generate a response. Please try again."
+    if session is not None:
+        record_exchange_blocking(session, request.agent, query, response, model_id, started)
+    return {"response": response, "model_used": model_id, "session_id": session.id if session else None}
+
+def job_timeout_for(agent_type: str) -> Optional[float]:
+    """The agent's `job_timeout` from the registry, None when it uses JOB_TIMEOUT."""
+    try:
+        return agent_registry.resolve(agent_type).job_timeout
+    except UnknownAgentError:
+        return None
+
+def job_or_404(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Queue a long-running agent request and return its job id at once.
+
+    Poll `GET /jobs/{id}` (or follow `GET /jobs/{id}/events`) until the job has finished.
+    """
+    if not request.query or not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    chat_request = ChatRequest(agent=request.agent, query=request.query, model_tier=request.model_tier)
+    await route_request(chat_request)
+    validate_agent(chat_request.agent)
+
+    try:
+        job = await get_executor().run_in_pool(
+            job_manager.submit, chat_request.agent, request.query, request.session_id, chat_request.model_tier
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a job, with its response once it has succeeded"""
+    return (await get_executor().run_in_pool(job_or_404, job_id)).to_dict()
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """The answer of a finished job: 202 while it is still queued or running, 409 if it failed or was cancelled"""
+    job = await get_executor().run_in_pool(job_or_404, job_id)
+    if not job.finished:
+        return JSONResponse(status_code=202, content={"id": job.id, "status": job.status})
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=job.error or f"Job was {job.status}")
+    return ChatResponse(response=job.response, agent_used=job.agent, model_used=job.model_used, session_id=job.session_id)
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job; a running job stops at the next step of its run"""
+    job = await get_executor().run_in_pool(job_manager.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return {"id": job.id, "status": job.status if job.finished else "cancelling"}
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Follow a job as Server-Sent Events: `status` changes, `tool_call_started`,
+    `tool_call_completed` and `content` deltas. Earlier events are replayed first, and
+    the stream ends with the final `status` event.
+    """
+    await get_executor().run_in_pool(job_or_404, job_id)
+
+    async def events():
+        sent = 0
+        while True:
+            new_events = await get_executor().run_in_pool(job_manager.events, job_id, sent)
+            for event, data in new_events:
+                yield sse_event(event, data)
+                if event == "status" and data["status"] in FINISHED_STATUSES:
+                    return
+            sent += len(new_events)
+            if not new_events:
+                # The record may have expired, or finished without its event reaching us
+                job = await get_executor().run_in_pool(job_manager.get, job_id)
+                if job is None:
+                    yield sse_event("error", {"error": f"Job '{job_id}' no longer exists"})
+                    return
+                if job.finished:
+                    yield sse_event("status", {"status": job.status, "response": job.response, "model_used": job.model_used, "error": job.error})
+                    return
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Forget a server-side conversation session and its recorded history."""
+    await asyncio.to_thread(session_manager.store.delete, session_id)
+    conversation_history.delete(session_id)
+    return {"deleted": session_id}
+
+@app.get("/sessions/{session_id}/messages")
+async def session_messages(session_id: str, limit: int = Query(50, ge=1, le=200), before: Optional[int] = None):
+    """
+    Return one page of a session's recorded messages, newest page first.
+
+    Messages within a page are oldest first. To load older messages, pass the page's
+    `next_before` as `before`; it is null on the oldest page.
+    """
+    if not conversation_history.enabled:
+        raise HTTPException(status_code=404, detail="Conversation history is not enabled")
+    page = await get_executor().run_in_pool(conversation_history.page, session_id, limit, before)
+    if page is None:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found")
+    return page
+
+def backend_stats() -> Dict[str, Any]:
+    """Stats that count rows in SQLite or read Redis, gathered on a thread by /health."""
+    return {
+        "sessions": session_manager.stats(),
+        "history": conversation_history.stats(),
+        "jobs": job_manager.stats(),
+        "response_cache": response_cache.stats(),
+        "rate_limits": groq_rate_limiter.stats(),
+    }
+
+health_stats_cache: Dict[str, Any] = {"at": 0.0, "stats": None}
+health_stats_lock = asyncio.Lock()
+
+async def cached_backend_stats() -> Dict[str, Any]:
+    """`backend_stats`, reused for HEALTH_STATS_TTL seconds so frequent probes query the backends once."""
+    async with health_stats_lock:
+        if health_stats_cache["stats"] is None or time.monotonic() - health_stats_cache["at"] >= HEALTH_STATS_TTL:
+            health_stats_cache["stats"] = await asyncio.to_thread(backend_stats)
+            health_stats_cache["at"] = time.monotonic()
+        return health_stats_cache["stats"]
 
 @app.get("/health")
 async def health_check():
     try:
         # Test basic functionality
         groq_key = os.getenv("GROQ_API_KEY")
+        backends = await cached_backend_stats()
         return {
             "status": "healthy",
             "message": "API is working correctly",
             "has_groq_key": bool(groq_key),
-            "groq_key_prefix": groq_key[:10] if groq_key else None
+            "groq_key_prefix": groq_key[:10] if groq_key else None,
+            "executor": get_executor().stats(),
+            "agent_pool": agent_pool.stats(),
+            "sessions": backends["sessions"],
+            "history": backends["history"],
+            "jobs": backends["jobs"],
+            "image_cache": image_cache.stats(),
+            "response_cache": backends["response_cache"],
+            "semantic_cache": semantic_cache.stats(),
+            "tool_cache": tool_cache.stats(),
+            "tool_timeouts": tool_timeouts.stats(),
+            "vision": vision_selector.stats(),
+            "agent_registry": agent_registry.stats(),
+            "router": query_router.stats(),
+            "token_counter": token_counter.stats(),
+            "rate_limits": backends["rate_limits"],
         }
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         return {"status": "unhealthy", "error": str(e)}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request and stage latencies, tokens, tool calls, pool and cache gauges"""
+    # Collecting the gauges reads cache and pool stats, some of them from SQLite
+    return Response(await asyncio.to_thread(render_metrics), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/agents")
 async def list_agents():
     """List available agents"""
     try:
         return {
+            "version": agent_registry.version,
             "agents": [
-                {"id": "general", "name": "General Chat", "description": "General purpose assistant"},
-                {"id": "web", "name": "Web Search", "description": "Web research and search"},
-                {"id": "youtube", "name": "YouTube", "description": "YouTube content analysis"},
-                {"id": "articles", "name": "Articles", "description": "Article research and analysis"},
-                {"id": "linkedin", "name": "LinkedIn", "description": "LinkedIn content generation"},
-                {"id": "finance", "name": "Finance", "description": "Financial analysis and data"}
+                {
+                    "id": spec.id,
+                    "name": spec.name,
+                    "description": spec.summary,
+                    "model": spec.model,
+                    "vision": agent_registry.has_variant(spec.id, "vision"),
+                    "fast_model": agent_registry.resolve(spec.id, fast=True).model if agent_registry.has_variant(spec.id, "fast") else None,
+                    "tools": list(spec.tools),
+                }
+                for spec in agent_registry.specs()
             ]
         }
     except Exception as e:
         logger.error(f"Error listing agents: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to list agents: {str(e)}")
 
+@app.post("/agents/reload")
+async def reload_agents():
+    """Reload the agent config file now instead of waiting for the next poll"""
+    snapshot = await asyncio.to_thread(agent_registry.load, True)
+    if snapshot is None:
+        raise HTTPException(status_code=422, detail=agent_registry.last_error or "Agent config was not reloaded")
+    agent_registry.apply(snapshot)
+    return {"reloaded": True, "version": agent_registry.version}
+
 # Add startup event to test agent initialization
 @app.on_event("startup")
 async def startup_event():
-    try:
-        logger.info("Testing agent initialization...")
-        test_agent = get_agent("general", False)
-        logger.info(f"General agent initialized successfully: {test_agent}")
-    except Exception as e:
-        logger.error(f"Failed to initialize agents on startup: {str(e)}")
+    # Agents and toolkits are built on first use; AGENT_WARMUP lists the ones to build ahead of time
+    warmup = [entry for entry in os.getenv("AGENT_WARMUP", "").split(",") if entry.strip()]
+    if warmup:
+        asyncio.get_running_loop().create_task(get_executor().run_in_pool(agent_pool.warm_up, warmup))
+
+    # Background jobs run on their own worker threads, outside the interactive executor
+    job_manager.start(run_job, timeout_for=job_timeout_for)
+
+    # Pick up edits to the agent config without a restart
+    reload_interval = float(os.getenv("AGENT_CONFIG_RELOAD_INTERVAL", "5"))
+    if reload_interval > 0:
+        asyncio.get_running_loop().create_task(agent_registry.watch(reload_interval))
+
+    # Decide the vision invocation format in the background so startup is not delayed
+    if os.getenv("VISION_PROBE_ON_STARTUP", "false").lower() in ("1", "true", "yes"):
+        asyncio.get_running_loop().create_task(probe_vision_model())
+
+async def probe_vision_model():
+    def probe():
+        with agent_pool.checkout("general", True) as agent:
+            return vision_selector.probe(agent, get_model_id(agent))
+
+    strategy = await get_executor().run_in_pool(probe)
+    logger.info(f"Vision probe finished: strategy={strategy}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # The server has stopped accepting requests and finished the open ones; let agent runs
+    # and background jobs still in progress finish before their threads are torn down
+    drain_timeout = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+    started = time.monotonic()
+    still_running = await get_executor().drain(drain_timeout)
+    if still_running:
+        logger.warning(f"Shutting down with {still_running} agent run(s) still in progress")
+    await asyncio.to_thread(job_manager.drain, max(0.0, drain_timeout - (time.monotonic() - started)))
+    get_executor().shutdown(wait=False)
+    conversation_history.close()
+    logger.info(f"Shutdown drained in {time.monotonic() - started:.1f}s")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Development server; use gunicorn with gunicorn.conf.py to run several workers in production
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        reload=os.getenv("RELOAD", "false").lower() in ("1", "true", "yes"),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
\ No newline at end of file
@@ -0,0 +1,215 @@
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUESTS = Counter(
+    "agentium_requests_total", "Agent requests handled", ["endpoint", "agent", "status"]
+)
+REQUEST_SECONDS = Histogram(
+    "agentium_request_seconds", "End-to-end agent request latency", ["endpoint", "agent"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "agentium_stage_seconds", "Latency of each pipeline stage", ["stage", "agent"], buckets=LATENCY_BUCKETS
+)
+MODEL_CALL_SECONDS = Histogram(
+    "agentium_model_call_seconds", "Agent run latency including tool calls", ["agent", "model"], buckets=LATENCY_BUCKETS
+)
+TOKENS = Counter(
+    "agentium_tokens_total", "Tokens reported by the model provider", ["agent", "model", "kind"]
+)
+TOOL_CALL_SECONDS = Histogram(
+    "agentium_tool_call_seconds", "Tool call latency", ["tool"], buckets=LATENCY_BUCKETS
+)
+TOOL_CALLS = Counter(
+    "agentium_tool_calls_total", "Tool calls by outcome", ["tool", "status"]
+)
+IN_FLIGHT = Gauge(
+    "agentium_in_flight_requests", "Agent requests currently being handled", ["agent"], multiprocess_mode="livesum"
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "agentium_rate_limit_wait_seconds", "Time model calls waited for rate limit capacity", ["model", "priority"],
+    buckets=LATENCY_BUCKETS,
+)
+RATE_LIMITED = Counter(
+    "agentium_rate_limited_total", "Model calls refused for rate limits", ["model", "source"]
+)
+JOBS = Counter(
+    "agentium_jobs_total", "Background jobs finished", ["agent", "status"]
+)
+JOB_SECONDS = Histogram(
+    "agentium_job_seconds", "Background job run time, from start to finish", ["agent"], buckets=LATENCY_BUCKETS + (300, 600, 1800)
+)
+CONTEXT_TOKENS = Histogram(
+    "agentium_context_tokens", "Tokens of history plus query in each prompt", ["agent"],
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+ROUTE_DECISIONS = Counter(
+    "agentium_route_decisions_total", "Agent/tier picked for agent=auto requests", ["agent", "tier", "source"]
+)
+ESCALATIONS = Counter(
+    "agentium_escalations_total", "Fast-tier answers retried on the default model", ["agent"]
+)
+SEMANTIC_CACHE_LOOKUPS = Counter(
+    "agentium_semantic_cache_lookups_total", "Semantic cache lookups by outcome", ["agent", "result"]
+)
+
+# Per-request stage timings, reported back to the client as a Server-Timing header
+request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+request_started: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_started", default=None)
+# Input/output tokens of the agent runs made for the current request
+request_usage: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar("request_usage", default=None)
+
+
+def start_request_trace() -> None:
+    """Begin collecting stage timings for the current request."""
+    request_started.set(time.perf_counter())
+    request_timings.set({})
+    request_usage.set({})
+
+
+def observe_stage(stage: str, agent: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage=stage, agent=agent).observe(seconds)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str, agent: str):
+    """Time one pipeline stage (checkout, context, model_call, serialize, ...)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, agent, time.perf_counter() - start)
+
+
+def observe_parse(agent: str) -> None:
+    """Record the time between the request arriving and the handler starting (body read + validation)."""
+    started = request_started.get()
+    if started is not None:
+        observe_stage("parse", agent, time.perf_counter() - started)
+
+
+def server_timing_header() -> Optional[str]:
+    timings = request_timings.get()
+    if not timings:
+        return None
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+def record_run_metrics(agent_type: str, model_id: str, run_metrics: Optional[Dict[str, Any]]) -> None:
+    """Count the input/output tokens of a finished agent run, also towards the current request's usage."""
+    if not run_metrics:
+        return
+    usage = request_usage.get()
+    for kind in ("input_tokens", "output_tokens"):
+        total = sum(v for v in run_metrics.get(kind, []) if isinstance(v, (int, float)))
+        if total:
+            TOKENS.labels(agent=agent_type, model=model_id, kind=kind.split("_")[0]).inc(total)
+            if usage is not None:
+                usage[kind.split("_")[0]] = usage.get(kind.split("_")[0], 0) + int(total)
+
+
+def tool_metrics_hook(function_name: str, function_call: Callable[..., Any], arguments: Dict[str, Any]) -> Any:
+    """Agno tool hook that times every tool call and counts failures by tool name."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        result = function_call(**arguments)
+        if isinstance(result, str) and result.lower().startswith("error"):
+            status = "error"
+        return result
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        TOOL_CALL_SECONDS.labels(tool=function_name).observe(time.perf_counter() - start)
+        TOOL_CALLS.labels(tool=function_name, status=status).inc()
+
+
+class StatsCollector:
+    """Exposes the executor, agent pool and cache statistics as gauges at scrape time."""
+
+    def __init__(self, sources: Dict[str, Callable[[], Dict[str, Any]]]):
+        self.sources = sources
+
+    def collect(self):
+        executor = self.sources["executor"]()
+        running = GaugeMetricFamily("agentium_executor_running", "Agent runs holding a slot", labels=["agent"])
+        waiting = GaugeMetricFamily("agentium_executor_waiting", "Requests queued for a slot", labels=["agent"])
+        rejected = GaugeMetricFamily("agentium_executor_rejected", "Requests rejected for capacity", labels=["agent"])
+        for agent, values in executor["agents"].items():
+            running.add_metric([agent], values["running"])
+            waiting.add_metric([agent], values["waiting"])
+            rejected.add_metric([agent], values["rejected"])
+        yield running
+        yield waiting
+        yield rejected
+
+        pool = self.sources["agent_pool"]()
+        idle = GaugeMetricFamily("agentium_agent_pool_idle", "Idle pooled agents", labels=["agent"])
+        in_use = GaugeMetricFamily("agentium_agent_pool_in_use", "Checked-out pooled agents", labels=["agent"])
+        for agent, values in pool["agents"].items():
+            idle.add_metric([agent], values["idle"])
+            in_use.add_metric([agent], values["in_use"])
+        yield idle
+        yield in_use
+        yield GaugeMetricFamily(
+            "agentium_agent_pool_checkout_ms_avg", "Average agent checkout latency", value=pool["checkout_ms_avg"]
+        )
+
+        hits = GaugeMetricFamily("agentium_cache_hits", "Cache hits", labels=["cache"])
+        misses = GaugeMetricFamily("agentium_cache_misses", "Cache misses", labels=["cache"])
+        ratio = GaugeMetricFamily("agentium_cache_hit_ratio", "Cache hit ratio", labels=["cache"])
+        for name in ("response_cache", "tool_cache", "image_cache"):
+            stats = self.sources[name]()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            lookups = stats["hits"] + stats["misses"]
+            ratio.add_metric([name], stats["hits"] / lookups if lookups else 0.0)
+        yield hits
+        yield misses
+        yield ratio
+
+
+_stats_collector: Optional[StatsCollector] = None
+
+
+def register_stats_collector(sources: Dict[str, Callable[[], Dict[str, Any]]]) -> None:
+    global _stats_collector
+    _stats_collector = StatsCollector(sources)
+    REGISTRY.register(_stats_collector)
+
+
+def render_metrics() -> bytes:
+    """
+    Render the metrics of this process, or of all workers when PROMETHEUS_MULTIPROC_DIR is set.
+
+    Under gunicorn each worker writes its counters and histograms to files in that directory
+    and any worker can serve the aggregate; the stats gauges still describe the worker that
+    answers the scrape.
+    """
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest(REGISTRY)
+
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _stats_collector is not None:
+        registry.register(_stats_collector)
+    return generate_latest(registry)
+
@@ -0,0 +1,536 @@
+import contextvars
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from cache import redis_url
+from context import token_counter
+from deadlines import cancel_token
+from metrics import RATE_LIMIT_WAIT_SECONDS, RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("interactive", "batch")
+
+# Priority class of the model calls made by the current request. Interactive calls are
+# served first; batch calls wait while interactive ones are queued and leave headroom.
+request_priority: contextvars.ContextVar[str] = contextvars.ContextVar("request_priority", default="interactive")
+
+# Completion tokens reserved for a request that does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Attempts per call when the provider answers 429
+MAX_ATTEMPTS = 3
+
+DURATION_PATTERN = re.compile(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?$")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse Groq's reset headers ("7.66s", "2m59.56s", "120ms") into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    match = DURATION_PATTERN.match(value.strip())
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes, seconds, millis = (float(g) if g else 0.0 for g in match.groups())
+    return hours * 3600 + minutes * 60 + seconds + millis / 1000
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call would have to wait longer than the scheduler's max_wait."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Rate limit for {model} exhausted, retry in {retry_after:.1f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def retry_after_from(error: Optional[BaseException]) -> Optional[int]:
+    """
+    Return the Retry-After seconds if an exception (or its cause) is a rate limit error.
+
+    Agno wraps the Groq SDK's RateLimitError in a ModelProviderError with status 429.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, RateLimitExceeded):
+            return max(1, math.ceil(error.retry_after))
+        if getattr(error, "status_code", None) == 429:
+            response = getattr(error, "response", None)
+            if response is not None:
+                return max(1, math.ceil(parse_duration(response.headers.get("retry-after")) or 1))
+            return retry_after_from(error.__cause__) or 1
+        error = error.__cause__ or error.__context__
+    return None
+
+
+class TokenBucket:
+    """
+    Requests-per-minute and tokens-per-minute budget of one (API key, model) pair.
+
+    Both buckets refill continuously. Unconfigured limits are learned from the provider's
+    rate limit headers, and the remaining-tokens header corrects the local estimate.
+    The public methods are thread-safe.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm) if rpm else math.inf
+        self.tokens = float(tpm) if tpm else math.inf
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        self.updated = now
+        if self.rpm:
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def wait_time(self, tokens: int, reserve: float = 0.0) -> float:
+        """Seconds until one request of `tokens` fits, keeping a `reserve` fraction untouched."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.rpm:
+            needed = 1 + reserve * self.rpm
+            if self.requests < needed:
+                wait = max(wait, (needed - self.requests) * 60 / self.rpm)
+        if self.tpm:
+            needed = min(tokens, self.tpm) + reserve * self.tpm
+            if self.tokens < needed:
+                wait = max(wait, (needed - self.tokens) * 60 / self.tpm)
+        return wait
+
+    def take(self, tokens: int) -> None:
+        self.requests -= 1
+        self.tokens -= tokens
+
+    def try_take(self, tokens: int, reserve: float = 0.0) -> float:
+        """Take one request of `tokens` if it fits now and return 0, otherwise return the wait."""
+        with self._lock:
+            wait = self.wait_time(tokens, reserve)
+            if wait <= 0:
+                self.take(tokens)
+            return wait
+
+    def observe(self, headers: httpx.Headers) -> None:
+        """Align the bucket with the provider's x-ratelimit-* headers."""
+        with self._lock:
+            limit_tokens = headers.get("x-ratelimit-limit-tokens")
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            try:
+                if limit_tokens and not self.tpm:
+                    self.tpm = float(limit_tokens)
+                    self.tokens = self.tpm
+                if remaining_tokens is not None and self.tpm:
+                    self.tokens = min(self.tpm, float(remaining_tokens))
+            except ValueError:
+                pass
+            # Groq's request limit is per day; only an exhausted one matters here
+            if headers.get("x-ratelimit-remaining-requests") == "0":
+                reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + reset)
+
+    def block(self, seconds: float) -> None:
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.throttled += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "requests_available": round(self.requests, 1) if self.rpm else None,
+                "tokens_available": round(self.tokens) if self.tpm else None,
+                "blocked_for": round(max(0.0, self.blocked_until - now), 2),
+                "provider_429s": self.throttled,
+            }
+
+
+# Refill, then take or observe, in one atomic step on the server's clock.
+# ARGV: rpm, tpm (0 = unlimited or not yet learned), ttl, op, cost, reserve,
+# remaining tokens, learned token limit, block seconds, count a provider 429
+BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'updated', 'blocked_until', 'tpm')
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+if tpm == 0 then tpm = tonumber(state[5]) or 0 end
+local requests = tonumber(state[1]) or rpm
+local tokens = tonumber(state[2]) or tpm
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+local blocked_until = tonumber(state[4]) or 0
+if rpm > 0 then requests = math.min(rpm, requests + elapsed * rpm / 60) end
+if tpm > 0 then tokens = math.min(tpm, tokens + elapsed * tpm / 60) end
+
+local wait = 0
+if ARGV[4] == 'take' then
+  local cost = tonumber(ARGV[5])
+  local reserve = tonumber(ARGV[6])
+  wait = math.max(0, blocked_until - now)
+  if rpm > 0 and requests < 1 + reserve * rpm then
+    wait = math.max(wait, (1 + reserve * rpm - requests) * 60 / rpm)
+  end
+  if tpm > 0 and tokens < math.min(cost, tpm) + reserve * tpm then
+    wait = math.max(wait, (math.min(cost, tpm) + reserve * tpm - tokens) * 60 / tpm)
+  end
+  if wait <= 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+  end
+else
+  if ARGV[8] ~= '' and tpm == 0 then
+    tpm = tonumber(ARGV[8])
+    tokens = tpm
+    redis.call('HSET', KEYS[1], 'tpm', ARGV[8])
+  end
+  if ARGV[7] ~= '' and tpm > 0 then tokens = math.min(tpm, tonumber(ARGV[7])) end
+  blocked_until = math.max(blocked_until, now + tonumber(ARGV[9]))
+  if ARGV[10] == '1' then redis.call('HINCRBY', KEYS[1], 'throttled', 1) end
+end
+
+redis.call('HSET', KEYS[1], 'requests', tostring(requests), 'tokens', tostring(tokens),
+  'updated', tostring(now), 'blocked_until', tostring(blocked_until))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {tostring(wait), tostring(requests), tostring(tokens), tostring(tpm),
+  tostring(math.max(0, blocked_until - now)), redis.call('HGET', KEYS[1], 'throttled') or '0'}
+"""
+
+
+class RedisTokenBucket:
+    """
+    TokenBucket kept in Redis (or a compatible server), shared by every worker using the same key.
+
+    Refill, check and take run as one Lua script on the server's clock, so processes on
+    different hosts draw from a single budget and never overshoot it together. Token
+    limits learned from the provider's headers are shared too. If the server cannot be
+    reached, calls are let through and only the provider's own 429s slow them down.
+    """
+
+    def __init__(self, client, name: str, rpm: Optional[float] = None, tpm: Optional[float] = None, ttl: int = 3600):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.ttl = ttl
+        self.errors = 0
+        self._script = client.register_script(BUCKET_SCRIPT)
+
+    def _call(self, op: str, cost: int = 0, reserve: float = 0.0, remaining: str = "", limit: str = "", block: float = 0.0, throttled: bool = False) -> Optional[List[float]]:
+        args = [self.rpm or 0, self.tpm or 0, self.ttl, op, cost, reserve, remaining, limit, block, "1" if throttled else "0"]
+        try:
+            values = self._script(keys=[self.name], args=args)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Rate limit bucket {self.name} unavailable: {e}")
+            return None
+        return [float(v.decode() if isinstance(v, bytes) else v) for v in values]
+
+    def try_take(self, tokens: int, reserve: float = 0.0) -> float:
+        values = self._call("take", cost=tokens, reserve=reserve)
+        return values[0] if values is not None else 0.0
+
+    def observe(self, headers: httpx.Headers) -> None:
+        remaining = headers.get("x-ratelimit-remaining-tokens")
+        limit = headers.get("x-ratelimit-limit-tokens")
+        block = 0.0
+        if headers.get("x-ratelimit-remaining-requests") == "0":
+            block = parse_duration(headers.get("x-ratelimit-reset-requests")) or 0.0
+        try:
+            remaining = str(float(remaining)) if remaining is not None else ""
+            limit = str(float(limit)) if limit and not self.tpm else ""
+        except ValueError:
+            remaining, limit = "", ""
+        if remaining or limit or block:
+            self._call("observe", remaining=remaining, limit=limit, block=block)
+
+    def block(self, seconds: float) -> None:
+        self._call("observe", block=seconds, throttled=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        values = self._call("observe")
+        if values is None:
+            return {"rpm": self.rpm, "tpm": self.tpm, "errors": self.errors}
+        _, requests, tokens, tpm, blocked_for, throttled = values
+        return {
+            "rpm": self.rpm,
+            "tpm": tpm or None,
+            "requests_available": round(requests, 1) if self.rpm else None,
+            "tokens_available": round(tokens) if tpm else None,
+            "blocked_for": round(blocked_for, 2),
+            "provider_429s": int(throttled),
+            "errors": self.errors,
+        }
+
+
+def redis_bucket_factory(url: str, prefix: str = "agentium:ratelimit") -> Callable[[str, str, Optional[float], Optional[float]], RedisTokenBucket]:
+    """Bucket factory for RateLimitScheduler that keeps every (API key, model) budget in Redis."""
+    try:
+        import redis
+    except ImportError as e:
+        raise ValueError("RATE_LIMIT_BACKEND=redis requires the redis package (pip install redis)") from e
+
+    client = redis.Redis.from_url(url)
+
+    def factory(key: str, model: str, rpm: Optional[float], tpm: Optional[float]) -> RedisTokenBucket:
+        # API keys are hashed so they are never written to the shared server
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+        return RedisTokenBucket(client, f"{prefix}:{digest}:{model}", rpm, tpm)
+
+    return factory
+
+
+class RateLimitScheduler:
+    """
+    Schedules Groq chat completions against per-key, per-model RPM and TPM limits.
+
+    Every call reserves one request and its estimated tokens from the bucket of the key
+    that can serve it soonest, so bursts are smoothed locally instead of turning into
+    429s. Interactive calls go first: batch calls wait while interactive ones are queued
+    for the same model and never use the last `batch_reserve` of a bucket. A 429 from the
+    provider blocks its bucket for the Retry-After period, and other keys take over.
+    Calls that would wait longer than `max_wait` fail fast with a local 429.
+
+    Buckets live in this process by default; with `bucket_factory=redis_bucket_factory(url)`
+    all workers share them, while the interactive-first ordering stays per process.
+    """
+
+    def __init__(
+        self,
+        keys: List[str],
+        limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        default_rpm: Optional[float] = None,
+        default_tpm: Optional[float] = None,
+        max_wait: float = 30.0,
+        batch_reserve: float = 0.2,
+        bucket_factory: Optional[Callable[[str, str, Optional[float], Optional[float]], Any]] = None,
+    ):
+        self.keys = [key for key in keys if key]
+        self.limits = dict(limits or {})
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_wait = max_wait
+        self.batch_reserve = batch_reserve
+        self.bucket_factory = bucket_factory or (lambda key, model, rpm, tpm: TokenBucket(rpm, tpm))
+        self._buckets: Dict[Tuple[str, str], Any] = {}
+        self._interactive_waiting: Dict[str, int] = {}
+        self._condition = threading.Condition()
+        self._rotation = 0
+
+    @classmethod
+    def from_env(cls, default_key: Optional[str] = None) -> "RateLimitScheduler":
+        keys = [k.strip() for k in os.getenv("GROQ_API_KEYS", "").split(",") if k.strip()] or [default_key or ""]
+        limits = {}
+        # GROQ_RATE_LIMITS="llama-3.3-70b-versatile=1000:300000,llama-3.1-8b-instant=1000:250000"
+        for entry in os.getenv("GROQ_RATE_LIMITS", "").split(","):
+            if "=" in entry:
+                model, values = entry.split("=", 1)
+                rpm, _, tpm = values.partition(":")
+                limits[model.strip()] = (float(rpm) if rpm else None, float(tpm) if tpm else None)
+        default_rpm = os.getenv("GROQ_RPM")
+        default_tpm = os.getenv("GROQ_TPM")
+        backend = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+        if backend == "redis":
+            bucket_factory = redis_bucket_factory(redis_url("RATE_LIMIT"))
+        elif backend == "memory":
+            bucket_factory = None
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+        return cls(
+            keys,
+            limits=limits,
+            default_rpm=float(default_rpm) if default_rpm else None,
+            default_tpm=float(default_tpm) if default_tpm else None,
+            max_wait=float(os.getenv("GROQ_RATE_LIMIT_MAX_WAIT", "30")),
+            batch_reserve=float(os.getenv("GROQ_BATCH_RESERVE", "0.2")),
+            bucket_factory=bucket_factory,
+        )
+
+    def _bucket(self, key: str, model: str):
+        bucket = self._buckets.get((key, model))
+        if bucket is None:
+            rpm, tpm = self.limits.get(model, (self.default_rpm, self.default_tpm))
+            bucket = self._buckets[(key, model)] = self.bucket_factory(key, model, rpm, tpm)
+        return bucket
+
+    def acquire(
+        self, model: str, tokens: int, priority: str = "interactive", max_wait: Optional[float] = None
+    ) -> Tuple[Optional[str], float]:
+        """
+        Reserve capacity for one call, waiting for it if needed (at most `max_wait`, when
+        shorter than the scheduler's own). Blocking.
+
+        Returns:
+            Tuple[Optional[str], float]: The API key to use (None when no keys are configured)
+                and the seconds waited
+        """
+        if not self.keys:
+            return None, 0.0
+        batch = priority == "batch"
+        started = time.monotonic()
+        deadline = started + (self.max_wait if max_wait is None else min(self.max_wait, max_wait))
+
+        reserve = self.batch_reserve if batch else 0.0
+
+        # The condition only guards the scheduler's own bookkeeping and the waiting; buckets
+        # are taken from outside it, as a Redis bucket costs a round trip
+        if not batch:
+            with self._condition:
+                self._interactive_waiting[model] = self._interactive_waiting.get(model, 0) + 1
+        try:
+            while True:
+                with self._condition:
+                    # Start the scan at a rotating offset so equally free keys share the load
+                    self._rotation = (self._rotation + 1) % len(self.keys)
+                    candidates = self.keys[self._rotation:] + self.keys[:self._rotation]
+                    buckets = [(key, self._bucket(key, model)) for key in candidates]
+                    yield_to_interactive = batch and self._interactive_waiting.get(model, 0) > 0
+
+                if yield_to_interactive:
+                    wait = 0.05
+                else:
+                    # Take from the first key with room; otherwise wait for the soonest one
+                    waits = []
+                    for key, bucket in buckets:
+                        wait = bucket.try_take(tokens, reserve)
+                        if wait <= 0:
+                            return key, time.monotonic() - started
+                        waits.append(wait)
+                    wait = min(waits)
+
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    raise RateLimitExceeded(model, wait)
+                with self._condition:
+                    self._condition.wait(min(wait, remaining))
+        finally:
+            if not batch:
+                with self._condition:
+                    self._interactive_waiting[model] -= 1
+                    self._condition.notify_all()
+
+    def observe(self, key: Optional[str], model: str, response: httpx.Response) -> None:
+        """Update the bucket of `key` from a provider response."""
+        if key is None:
+            return
+        with self._condition:
+            bucket = self._bucket(key, model)
+        bucket.observe(response.headers)
+        if response.status_code == 429:
+            retry_after = parse_duration(response.headers.get("retry-after")) or 1.0
+            bucket.block(retry_after)
+            RATE_LIMITED.labels(model=model, source="provider").inc()
+            logger.warning(f"Groq rate limit hit for {model} (key {self._key_label(key)}), backing off {retry_after:g}s")
+        with self._condition:
+            self._condition.notify_all()
+
+    def _key_label(self, key: str) -> str:
+        return f"#{self.keys.index(key) + 1}" if key in self.keys else "?"
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            items = list(self._buckets.items())
+            interactive_waiting = sum(self._interactive_waiting.values())
+        return {
+            "keys": len(self.keys),
+            "max_wait": self.max_wait,
+            "batch_reserve": self.batch_reserve,
+            "interactive_waiting": interactive_waiting,
+            "buckets": {f"{self._key_label(key)}:{model}": bucket.snapshot() for (key, model), bucket in items},
+        }
+
+
+def estimate_request_tokens(body: Dict[str, Any]) -> int:
+    """Prompt tokens of a chat completion request plus the completion tokens it may use."""
+    prompt = 0
+    for message in body.get("messages", []):
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        prompt += token_counter.count(str(content), body.get("model")) + 4
+    if body.get("tools"):
+        prompt += token_counter.count(json.dumps(body["tools"]), body.get("model"))
+    completion = body.get("max_completion_tokens") or body.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return prompt + completion
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """
+    httpx transport that passes chat completion calls through the RateLimitScheduler.
+
+    It sits under the shared Groq HTTP client, so every agent, the router and the
+    summarizer are scheduled together. The chosen key replaces the Authorization header.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, scheduler: RateLimitScheduler):
+        self.transport = transport
+        self.scheduler = scheduler
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST" or not request.url.path.endswith("/chat/completions"):
+            return self.transport.handle_request(request)
+
+        try:
+            body = json.loads(request.read() or b"{}")
+        except ValueError:
+            body = {}
+        model = body.get("model", "unknown")
+        priority = request_priority.get()
+        tokens = estimate_request_tokens(body)
+        # Never wait for capacity beyond the request's deadline
+        request_token = cancel_token.get()
+        max_wait = request_token.remaining() if request_token is not None else None
+
+        # A provider 429 blocks that key's bucket, so the next attempt goes to another key,
+        # waits for the block to pass, or fails fast when that would take longer than max_wait
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                key, waited = self.scheduler.acquire(model, tokens, priority, max_wait)
+            except RateLimitExceeded as e:
+                RATE_LIMITED.labels(model=model, source="local").inc()
+                logger.warning(str(e))
+                return httpx.Response(
+                    429,
+                    headers={"retry-after": str(math.ceil(e.retry_after)), "x-should-retry": "false"},
+                    json={"error": {"message": str(e), "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}},
+                    request=request,
+                )
+            RATE_LIMIT_WAIT_SECONDS.labels(model=model, priority=priority).observe(waited)
+
+            if key is not None:
+                request.headers["Authorization"] = f"Bearer {key}"
+            response = self.transport.handle_request(request)
+            self.scheduler.observe(key, model, response)
+            if response.status_code != 429 or key is None or attempt == MAX_ATTEMPTS - 1:
+                break
+            response.close()
+
+        if response.status_code == 429:
+            # Retries happen here, against the scheduler; the SDK's own backoff would hold the thread
+            response.headers["x-should-retry"] = "false"
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
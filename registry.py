@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Optional per-agent sub-tables that override the agent's settings: the vision model used
+# when a request has images, and a smaller, faster model the router may pick for simple queries
+VARIANTS = ("vision", "fast")
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agents.toml")
+
+# Keys that may appear in an agent table, with the type they must have
+SPEC_FIELDS: Dict[str, Any] = {
+    "name": str,
+    "summary": str,
+    "model": str,
+    "tools": list,
+    "description": str,
+    "instructions": (str, list),
+    "expected_output": str,
+    "markdown": bool,
+    "show_tool_calls": bool,
+    "add_datetime_to_instructions": bool,
+    "max_concurrency": int,
+    "timeout": (int, float),
+    "job_timeout": (int, float),
+    "cache_ttl": (int, float),
+    "semantic_cache": bool,
+    "context_tokens": int,
+}
+
+
+class AgentConfigError(ValueError):
+    """Raised when the agent config file cannot be parsed or is invalid."""
+
+
+class UnknownAgentError(KeyError):
+    """Raised when a request names an agent that is not in the registry."""
+
+    def __init__(self, agent_type: str, available: Iterable[str]):
+        self.agent_type = agent_type
+        self.available = sorted(available)
+        super().__init__(agent_type)
+
+    def __str__(self) -> str:
+        return f"Unknown agent '{self.agent_type}'. Available agents: {', '.join(self.available)}"
+
+
+@dataclass(frozen=True)
+class AgentSpec:
+    """Everything needed to build and operate one agent (or one of its variants)."""
+
+    id: str
+    model: str
+    name: str = ""
+    summary: str = ""
+    variant: str = "default"
+    tools: Tuple[str, ...] = ()
+    description: Optional[str] = None
+    instructions: Optional[Union[str, List[str]]] = None
+    expected_output: Optional[str] = None
+    markdown: bool = True
+    show_tool_calls: bool = True
+    add_datetime_to_instructions: bool = False
+    max_concurrency: Optional[int] = None
+    timeout: Optional[float] = None
+    job_timeout: Optional[float] = None
+    cache_ttl: Optional[float] = None
+    semantic_cache: bool = False
+    context_tokens: Optional[int] = None
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.id, self.variant)
+
+
+@dataclass
+class RegistrySnapshot:
+    """One immutable generation of the registry, swapped in whole on reload."""
+
+    specs: Dict[Tuple[str, str], AgentSpec] = field(default_factory=dict)
+    fallback: Optional[str] = None
+    version: int = 0
+
+
+def read_config_file(path: str) -> Dict[str, Any]:
+    """Parse a TOML or YAML (by file extension) agent config."""
+    try:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+
+            with open(path, "r", encoding="utf-8") as f:
+                return yaml.safe_load(f) or {}
+
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    except OSError as e:
+        raise AgentConfigError(f"Cannot read agent config {path}: {e}")
+    except Exception as e:
+        raise AgentConfigError(f"Cannot parse agent config {path}: {e}")
+
+
+def _check_fields(where: str, table: Dict[str, Any]) -> None:
+    for key, value in table.items():
+        if key in VARIANTS:
+            continue
+        if key not in SPEC_FIELDS:
+            raise AgentConfigError(f"{where}: unknown key '{key}'")
+        if not isinstance(value, SPEC_FIELDS[key]) or (isinstance(value, bool) and SPEC_FIELDS[key] is not bool):
+            raise AgentConfigError(f"{where}: '{key}' has the wrong type")
+
+
+def parse_config(config: Dict[str, Any], known_tools: Optional[Iterable[str]] = None) -> RegistrySnapshot:
+    """
+    Validate a parsed config and turn it into agent specs.
+
+    Args:
+        config (Dict[str, Any]): The parsed TOML/YAML document
+        known_tools (Optional[Iterable[str]]): Toolkit names agents may use; None skips the check
+
+    Returns:
+        RegistrySnapshot: The specs keyed by (agent id, variant)
+    """
+    defaults = config.get("defaults") or {}
+    agents = config.get("agents") or {}
+    if not agents:
+        raise AgentConfigError("No agents defined")
+    _check_fields("[defaults]", defaults)
+    tools_allowed = set(known_tools) if known_tools is not None else None
+
+    snapshot = RegistrySnapshot(fallback=config.get("fallback"))
+    for agent_id, table in agents.items():
+        if not isinstance(table, dict):
+            raise AgentConfigError(f"[agents.{agent_id}] must be a table")
+        _check_fields(f"[agents.{agent_id}]", table)
+        values = {**defaults, **{k: v for k, v in table.items() if k not in VARIANTS}}
+        if "model" not in values:
+            raise AgentConfigError(f"[agents.{agent_id}]: no model")
+
+        values["tools"] = tuple(values.get("tools", ()))
+        if tools_allowed is not None:
+            unknown = [t for t in values["tools"] if t not in tools_allowed]
+            if unknown:
+                raise AgentConfigError(f"[agents.{agent_id}]: unknown tools {unknown}")
+        values.setdefault("name", agent_id.title())
+        if values.get("timeout") == 0:
+            values["timeout"] = None
+
+        spec = AgentSpec(id=agent_id, **values)
+        snapshot.specs[spec.key] = spec
+
+        for variant in VARIANTS:
+            if table.get(variant) is None:
+                continue
+            _check_fields(f"[agents.{agent_id}.{variant}]", table[variant])
+            overrides = dict(table[variant])
+            if "tools" in overrides:
+                overrides["tools"] = tuple(overrides["tools"])
+            variant_spec = replace(spec, variant=variant, **overrides)
+            snapshot.specs[variant_spec.key] = variant_spec
+
+    if snapshot.fallback is not None and (snapshot.fallback, "default") not in snapshot.specs:
+        raise AgentConfigError(f"fallback agent '{snapshot.fallback}' is not defined")
+    return snapshot
+
+
+class AgentRegistry:
+    """
+    Agent definitions loaded from a config file, reloadable while the app is running.
+
+    A reload validates the whole file first and only then swaps it in, so a bad edit
+    leaves the running definitions untouched. Subscribers (the agent pool, executor and
+    response cache) are notified after every successful load.
+    """
+
+    def __init__(self, path: str, known_tools: Optional[Iterable[str]] = None):
+        self.path = path
+        self.known_tools = list(known_tools) if known_tools is not None else None
+        self._snapshot = RegistrySnapshot()
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[["AgentRegistry"], None]] = []
+        self.last_error: Optional[str] = None
+
+    @classmethod
+    def from_env(cls, known_tools: Optional[Iterable[str]] = None) -> "AgentRegistry":
+        registry = cls(os.getenv("AGENT_CONFIG", DEFAULT_CONFIG_PATH), known_tools=known_tools)
+        registry.reload(force=True)
+        return registry
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def subscribe(self, callback: Callable[["AgentRegistry"], None]) -> None:
+        """Call `callback(registry)` now and after every reload."""
+        self._subscribers.append(callback)
+        callback(self)
+
+    def load(self, force: bool = False) -> Optional[RegistrySnapshot]:
+        """
+        Read and validate the config file if it changed since the last load.
+
+        Blocking (a stat and a parse), and safe on any thread; nothing is swapped in.
+
+        Returns:
+            Optional[RegistrySnapshot]: The new definitions for `apply`, or None
+        """
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError as e:
+                if force:
+                    raise AgentConfigError(f"Cannot read agent config {self.path}: {e}")
+                logger.error(f"Agent config unavailable, keeping version {self.version}: {e}")
+                return None
+            if not force and mtime == self._mtime:
+                return None
+
+            try:
+                snapshot = parse_config(read_config_file(self.path), self.known_tools)
+            except AgentConfigError as e:
+                self.last_error = str(e)
+                if force and self._mtime is None:
+                    raise
+                logger.error(f"Invalid agent config, keeping version {self.version}: {e}")
+                self._mtime = mtime
+                return None
+
+            self._mtime = mtime
+            self.last_error = None
+            return snapshot
+
+    def apply(self, snapshot: RegistrySnapshot) -> None:
+        """Swap in definitions returned by `load` and notify the subscribers, on the event loop if there is one."""
+        with self._lock:
+            snapshot.version = self._snapshot.version + 1
+            self._snapshot = snapshot
+
+        logger.info(f"Loaded agent config {self.path} (version {snapshot.version}, {len(snapshot.specs)} agents)")
+        for callback in self._subscribers:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Agent config subscriber failed: {e}")
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Load the config file if it changed since the last load, and swap it in.
+
+        Returns:
+            bool: True if new definitions were swapped in
+        """
+        snapshot = self.load(force)
+        if snapshot is None:
+            return False
+        self.apply(snapshot)
+        return True
+
+    async def watch(self, interval: float) -> None:
+        """
+        Poll the config file for changes every `interval` seconds.
+
+        The file is read and parsed on a thread; only the swap and the subscribers, which
+        resize the executor's semaphores, run on the event loop.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            snapshot = await asyncio.to_thread(self.load)
+            if snapshot is not None:
+                self.apply(snapshot)
+
+    def resolve(self, agent_type: str, use_vision: bool = False, fast: bool = False) -> AgentSpec:
+        """
+        Return the spec for a requested agent type, vision flag and model tier.
+
+        Agents without a vision or fast variant ignore the corresponding flag; vision wins
+        when both are set. Unknown types go to the configured fallback agent, or raise
+        UnknownAgentError when there is none.
+        """
+        specs = self._snapshot.specs
+        if (agent_type, "default") not in specs:
+            fallback = self._snapshot.fallback
+            if fallback is None:
+                raise UnknownAgentError(agent_type, {agent_id for agent_id, _ in specs})
+            logger.warning(f"Unknown agent '{agent_type}', using fallback '{fallback}'")
+            agent_type = fallback
+        if use_vision and (agent_type, "vision") in specs:
+            return specs[(agent_type, "vision")]
+        if fast and (agent_type, "fast") in specs:
+            return specs[(agent_type, "fast")]
+        return specs[(agent_type, "default")]
+
+    def specs(self) -> List[AgentSpec]:
+        """All base agent specs (no variants), in config order."""
+        return [spec for spec in self._snapshot.specs.values() if spec.variant == "default"]
+
+    def has_variant(self, agent_type: str, variant: str) -> bool:
+        return (agent_type, variant) in self._snapshot.specs
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "version": self.version,
+            "agents": [spec.id for spec in self.specs()],
+            "last_error": self.last_error,
+        }
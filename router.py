@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+from cache import TTLCache, normalize_query
+from registry import AgentRegistry
+
+logger = logging.getLogger(__name__)
+
+ROUTER_MODES = ("heuristic", "model", "hybrid")
+
+# Keyword rules tried in order; the first match picks the agent
+HEURISTIC_RULES: List[Tuple[str, Pattern]] = [
+    ("youtube", re.compile(r"youtube\.com/|youtu\.be/|\b(youtube|video|transcript|timestamps?)\b", re.I)),
+    ("linkedin", re.compile(r"\blinkedin\b", re.I)),
+    ("finance", re.compile(
+        r"\$[A-Z]{1,5}\b|\b(stocks?|shares?|ticker|market cap|earnings|dividends?|analyst|valuation|"
+        r"p/e|nasdaq|nyse|s&p|portfolio|crypto|bitcoin)\b",
+        re.I,
+    )),
+    ("articles", re.compile(r"https?://|\b(article|paper|research|sources|citations?|in-depth)\b", re.I)),
+    ("web", re.compile(r"\b(latest|news|today|tonight|yesterday|this week|current(ly)?|right now|search|look up)\b", re.I)),
+]
+
+# Signs that a query needs the larger model even when it is short
+COMPLEX_PATTERN = re.compile(
+    r"\b(analy[sz]e|analysis|compare|comparison|contrast|evaluate|explain why|in[- ]depth|detailed|"
+    r"step[- ]by[- ]step|pros and cons|trade-?offs?|strategy|forecast|recommend(ation)?s?|report|plan|"
+    r"prove|derive|debug|refactor)\b",
+    re.I,
+)
+
+# Phrases that suggest a fast-tier answer is not good enough and should be retried
+ESCALATION_PATTERN = re.compile(
+    r"\b(i('m| am) not sure|i don'?t know|i('m| am) unable to|i cannot|i can'?t (help|answer|provide)|"
+    r"i don'?t have (access|enough information)|as an ai)\b|couldn'?t generate a response",
+    re.I,
+)
+
+CLASSIFIER_PROMPT = """You route user queries to the best agent. Agents:
+{agents}
+
+Reply with JSON only: {{"agent": "<agent id>", "complex": <true if the query needs multi-step reasoning, analysis or a long answer, else false>}}"""
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """The agent and model tier picked for an `agent: "auto"` request."""
+
+    agent: str
+    fast: bool
+    confidence: float
+    source: str  # heuristic, model or cache
+
+
+class QueryRouter:
+    """
+    Picks an agent and model tier for requests that set `agent: "auto"`.
+
+    The heuristic mode uses keyword rules and costs nothing. The model mode asks a small
+    model to classify the query, and hybrid asks it only when the heuristic is unsure.
+    Decisions are cached by normalized query, so repeated questions skip classification.
+    Simple queries go to the agent's fast variant; `needs_escalation` tells the caller
+    when such an answer should be retried on the default model.
+    """
+
+    def __init__(
+        self,
+        registry: AgentRegistry,
+        mode: str = "heuristic",
+        classifier_model: str = "llama-3.1-8b-instant",
+        min_confidence: float = 0.6,
+        fast_max_words: int = 40,
+        cache_ttl: float = 3600.0,
+        cache_size: int = 4096,
+    ):
+        if mode not in ROUTER_MODES:
+            raise ValueError(f"Unknown ROUTER_MODE: {mode}")
+        self.registry = registry
+        self.mode = mode
+        self.classifier_model = classifier_model
+        self.min_confidence = min_confidence
+        self.fast_max_words = fast_max_words
+        self.cache_ttl = cache_ttl
+        self._cache = TTLCache(max_entries=cache_size)
+        self._client = None
+        self.classifier_errors = 0
+
+    @classmethod
+    def from_env(cls, registry: AgentRegistry) -> "QueryRouter":
+        return cls(
+            registry,
+            mode=os.getenv("ROUTER_MODE", "heuristic").lower(),
+            classifier_model=os.getenv("ROUTER_MODEL", "llama-3.1-8b-instant"),
+            min_confidence=float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.6")),
+            fast_max_words=int(os.getenv("ROUTER_FAST_MAX_WORDS", "40")),
+            cache_ttl=float(os.getenv("ROUTER_CACHE_TTL", "3600")),
+            cache_size=int(os.getenv("ROUTER_CACHE_SIZE", "4096")),
+        )
+
+    def default_agent(self) -> str:
+        agent_ids = [spec.id for spec in self.registry.specs()]
+        return "general" if "general" in agent_ids else agent_ids[0]
+
+    def is_simple(self, query: str) -> bool:
+        return len(query.split()) <= self.fast_max_words and not COMPLEX_PATTERN.search(query)
+
+    def heuristic(self, query: str) -> RouteDecision:
+        """Route by keyword rules; falls back to the default agent with low confidence."""
+        agent_ids = {spec.id for spec in self.registry.specs()}
+        for agent_id, pattern in HEURISTIC_RULES:
+            if agent_id in agent_ids and pattern.search(query):
+                return RouteDecision(agent_id, self.is_simple(query), 0.8, "heuristic")
+        return RouteDecision(self.default_agent(), self.is_simple(query), 0.4, "heuristic")
+
+    def classify(self, query: str) -> Optional[RouteDecision]:
+        """
+        Ask the classifier model for an agent. Blocking; run it on the worker pool.
+
+        Returns:
+            Optional[RouteDecision]: The decision, or None if the model call or its answer failed
+        """
+        specs = self.registry.specs()
+        agents = "\n".join(f"- {spec.id}: {spec.summary or spec.name}" for spec in specs)
+        try:
+            if self._client is None:
+                from agents import groq_client
+
+                # Routing must stay cheap: no retries, and give up quickly in favour of the heuristic
+                self._client = groq_client(max_retries=0, timeout=5.0)
+            completion = self._client.chat.completions.create(
+                model=self.classifier_model,
+                messages=[
+                    {"role": "system", "content": CLASSIFIER_PROMPT.format(agents=agents)},
+                    {"role": "user", "content": query[:2000]},
+                ],
+                temperature=0,
+                max_tokens=40,
+                response_format={"type": "json_object"},
+            )
+            answer = json.loads(completion.choices[0].message.content or "{}")
+            agent_id = answer.get("agent")
+            if agent_id not in {spec.id for spec in specs}:
+                raise ValueError(f"unknown agent {agent_id!r}")
+        except Exception as e:
+            self.classifier_errors += 1
+            logger.warning(f"Router classifier failed, using the heuristic: {e}")
+            return None
+        fast = not answer.get("complex", False) and self.is_simple(query)
+        return RouteDecision(agent_id, fast, 0.9, "model")
+
+    def route(self, query: str, has_images: bool = False) -> RouteDecision:
+        """
+        Pick the agent and tier for a query. May call the classifier model, so this is blocking.
+
+        Args:
+            query (str): The current user query (without conversation context)
+            has_images (bool): Whether the request carries images for the vision model
+
+        Returns:
+            RouteDecision: Where to send the query
+        """
+        if has_images:
+            vision_agents = [spec.id for spec in self.registry.specs() if self.registry.has_variant(spec.id, "vision")]
+            agent_id = "general" if "general" in vision_agents else (vision_agents or [self.default_agent()])[0]
+            return RouteDecision(agent_id, False, 1.0, "heuristic")
+
+        normalized = normalize_query(query)
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        # The registry version is part of the key so a config reload re-routes everything
+        key = f"{self.registry.version}:{digest}"
+        cached = self._cache.get(key)
+        if cached is not None:
+            return replace(cached, source="cache")
+
+        decision = self.heuristic(query)
+        if self.mode == "model" or (self.mode == "hybrid" and decision.confidence < self.min_confidence):
+            classified = self.classify(query)
+            if classified is not None:
+                decision = classified
+            elif decision.confidence < self.min_confidence:
+                # An unsure guess after a failed classifier call (timeout, 429) is not
+                # cached, so the next request asks the classifier again
+                logger.info(f"Routed query to {decision.agent} without caching, the classifier failed")
+                return decision
+
+        self._cache.set(key, decision, self.cache_ttl)
+        logger.info(f"Routed query to {decision.agent} ({'fast' if decision.fast else 'default'}, {decision.source})")
+        return decision
+
+    @staticmethod
+    def needs_escalation(response: str) -> bool:
+        """Whether a fast-tier answer looks like a refusal, a non-answer or a failure."""
+        text = (response or "").strip()
+        return len(text) < 20 or bool(ESCALATION_PATTERN.search(text[:500]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "classifier_model": self.classifier_model,
+            "classifier_errors": self.classifier_errors,
+            "cache": self._cache.stats(),
+        }
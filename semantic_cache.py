@@ -0,0 +1,289 @@
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FASTEMBED_MODEL = "BAAI/bge-small-en-v1.5"
+
+# Words that carry no meaning of their own; dropping them keeps "what is the capital of
+# France" and "capital of France?" together and "capital of France" apart from "capital of Peru".
+# Question words other than "what" are kept: "when was X born" and "where was X born" differ.
+STOPWORDS = frozenset(
+    "a about an and are as at be by can could d do does for from i in is it ll m me my of on or "
+    "please re s should t tell the this to ve was what whats will with would you".split()
+)
+
+
+def stem(word: str) -> str:
+    """Crude plural and verb-form folding ("works", "worked", "working" -> "work")."""
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+            return word[: -len(suffix)]
+    return word
+
+
+class HashingEmbedder:
+    """
+    Dependency-free fallback embedder: words and character trigrams hashed into a fixed-size vector.
+
+    A bag of words cannot tell "celsius to fahrenheit" from "fahrenheit to celsius", so
+    it only vouches for questions with the same content words in the same order: its
+    `signature` must match exactly and the similarity must reach `default_threshold`.
+    That covers changes of punctuation, case, plurals and filler words, not synonyms or
+    reordering; install `fastembed` for real sentence embeddings.
+    """
+
+    name = "hashing"
+    default_threshold = 0.97
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    @staticmethod
+    def _words(text: str) -> List[str]:
+        return [stem(w) for w in re.findall(r"\w+", text.lower()) if w not in STOPWORDS]
+
+    def signature(self, text: str) -> Optional[int]:
+        """Hash of the content words in order; cached answers are only served to an equal signature."""
+        return zlib.crc32(" ".join(self._words(text)).encode("utf-8")) + 1
+
+    def _features(self, text: str) -> Iterable[Tuple[str, float]]:
+        words = self._words(text)
+        for word in words:
+            yield word, 1.0
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                yield "#" + padded[i:i + 3], 0.3
+        for first, second in zip(words, words[1:]):
+            yield f"{first} {second}", 0.5
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # The sign bit keeps colliding features from always adding up
+                vectors[row, h % self.dim] += weight if h & 0x80000000 else -weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class FastEmbedEmbedder:
+    """Small ONNX sentence embedding model run on the CPU by `fastembed`, loaded on first use."""
+
+    name = "fastembed"
+    default_threshold = 0.9
+
+    def __init__(self, model_name: str = DEFAULT_FASTEMBED_MODEL):
+        from fastembed import TextEmbedding  # noqa: F401 - fail at startup if it is missing
+
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            if self._model is None:
+                from fastembed import TextEmbedding
+
+                start = time.perf_counter()
+                self._model = TextEmbedding(self.model_name)
+                logger.info(f"Loaded embedding model {self.model_name} in {time.perf_counter() - start:.2f}s")
+            vectors = np.asarray(list(self._model.embed(texts)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def signature(self, text: str) -> Optional[int]:
+        return None
+
+
+def load_embedder(kind: str = "auto", model_name: str = DEFAULT_FASTEMBED_MODEL):
+    """Return the `fastembed` embedder when requested or (for "auto") installed, otherwise the hashing one."""
+    if kind in ("auto", "fastembed"):
+        try:
+            return FastEmbedEmbedder(model_name)
+        except ImportError:
+            if kind == "fastembed":
+                raise ValueError("SEMANTIC_CACHE_EMBEDDER=fastembed requires the fastembed package")
+            logger.info("fastembed is not installed, the semantic cache uses the hashing embedder")
+    elif kind != "hashing":
+        raise ValueError(f"Unknown SEMANTIC_CACHE_EMBEDDER: {kind}")
+    return HashingEmbedder()
+
+
+class SemanticCache:
+    """
+    Cache of agent answers looked up by the meaning of the question rather than its exact text.
+
+    Questions are embedded on the CPU and kept in one NumPy matrix; a lookup is a single
+    matrix-vector product over the entries of the same agent and model, and the best match
+    is served if its cosine similarity reaches `threshold`. At a few thousand entries this
+    exact scan takes well under a millisecond, so no approximate index is needed. Entries
+    expire with the agent's response cache TTL, and when the matrix is full the least
+    recently used entry is replaced. Only agents listed in `agents` (from `semantic_cache`
+    in agents.toml, or SEMANTIC_CACHE_AGENTS) use it, as most answers about prices and
+    news go stale quickly.
+    """
+
+    def __init__(
+        self,
+        embedder=None,
+        enabled: bool = False,
+        threshold: Optional[float] = None,
+        max_entries: int = 2048,
+        agents: Optional[Iterable[str]] = None,
+    ):
+        self.embedder = embedder
+        self.enabled = enabled and embedder is not None
+        # Unless set, the threshold is the one the embedder is reliable at
+        self.threshold = threshold if threshold is not None else getattr(embedder, "default_threshold", 0.9)
+        self.max_entries = max_entries
+        # Explicit agents (from SEMANTIC_CACHE_AGENTS) win over the agent registry
+        self.overrides = set(agents) if agents is not None else None
+        self.agents = set(self.overrides or ())
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._expires_at = np.zeros(max_entries)
+        self._used_at = np.zeros(max_entries)
+        self._groups = np.full(max_entries, -1, dtype=np.int32)
+        self._signatures = np.zeros(max_entries, dtype=np.int64)
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._group_ids: Dict[Tuple[str, str], int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._embed_seconds = 0.0
+        self._embeds = 0
+
+    @classmethod
+    def from_env(cls) -> "SemanticCache":
+        if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return cls(None)
+
+        embedder = load_embedder(
+            os.getenv("SEMANTIC_CACHE_EMBEDDER", "auto").lower(),
+            os.getenv("SEMANTIC_CACHE_MODEL", DEFAULT_FASTEMBED_MODEL),
+        )
+        agents = os.getenv("SEMANTIC_CACHE_AGENTS")
+        threshold = os.getenv("SEMANTIC_CACHE_THRESHOLD")
+        cache = cls(
+            embedder,
+            enabled=True,
+            threshold=float(threshold) if threshold else None,
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048")),
+            agents=[a.strip() for a in agents.split(",") if a.strip()] if agents is not None else None,
+        )
+        logger.info(f"Semantic cache enabled: embedder={embedder.name}, threshold={cache.threshold}")
+        return cache
+
+    def configure_agents(self, agents: Iterable[str]) -> None:
+        """Apply the agents with `semantic_cache = true` from the agent registry."""
+        if self.overrides is None:
+            self.agents = set(agents)
+
+    def enabled_for(self, agent_type: str) -> bool:
+        return self.enabled and agent_type in self.agents
+
+    def embed(self, text: str) -> np.ndarray:
+        start = time.perf_counter()
+        vector = self.embedder.embed([text])[0]
+        self._embed_seconds += time.perf_counter() - start
+        self._embeds += 1
+        return vector
+
+    def _group(self, agent_type: str, model_id: str) -> int:
+        return self._group_ids.setdefault((agent_type, model_id), len(self._group_ids))
+
+    def _best_match(self, group: int, vector: np.ndarray, signature: Optional[int], now: float) -> Tuple[int, float]:
+        """Index and similarity of the closest live entry of `group`, (-1, 0.0) if there is none."""
+        if self._vectors is None:
+            return -1, 0.0
+        live = (self._groups == group) & (self._expires_at > now)
+        if signature is not None:
+            live &= self._signatures == signature
+        if not live.any():
+            return -1, 0.0
+        scores = self._vectors @ vector
+        scores[~live] = -np.inf
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+    def lookup(self, agent_type: str, model_id: str, query: str) -> Tuple[Optional[Dict[str, Any]], np.ndarray]:
+        """
+        Find a cached answer to a question with the same meaning. Blocking (embeds the query).
+
+        Returns:
+            Tuple[Optional[Dict[str, Any]], np.ndarray]: The cached `response`, `model_used`,
+            `query` and `similarity` (None on a miss), and the query's embedding for `store`
+        """
+        vector = self.embed(query)
+        signature = self.embedder.signature(query)
+        now = time.time()
+        with self._lock:
+            index, similarity = self._best_match(self._group(agent_type, model_id), vector, signature, now)
+            if index < 0 or similarity < self.threshold:
+                self.misses += 1
+                return None, vector
+            self._used_at[index] = now
+            self.hits += 1
+            return {**self._entries[index], "similarity": round(similarity, 4)}, vector
+
+    def store(self, agent_type: str, model_id: str, vector: np.ndarray, query: str, response: str, ttl: float) -> None:
+        """Cache an answer under the embedding returned by `lookup`."""
+        if ttl <= 0:
+            return
+        signature = self.embedder.signature(query)
+        now = time.time()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            group = self._group(agent_type, model_id)
+
+            # The same question again replaces its entry rather than taking a second one
+            index, similarity = self._best_match(group, vector, signature, now)
+            if index < 0 or similarity < 0.999:
+                free = np.flatnonzero(self._expires_at <= now)
+                if len(free):
+                    index = int(free[0])
+                else:
+                    index = int(np.argmin(self._used_at))
+                    self.evictions += 1
+
+            self._vectors[index] = vector
+            self._expires_at[index] = now + ttl
+            self._used_at[index] = now
+            self._groups[index] = group
+            self._signatures[index] = signature or 0
+            self._entries[index] = {"response": response, "model_used": model_id, "query": query}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires_at[:] = 0
+            self._groups[:] = -1
+            self._entries = [None] * self.max_entries
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "embedder": self.embedder.name,
+                "threshold": self.threshold,
+                "agents": sorted(self.agents),
+                "entries": int((self._expires_at > time.time()).sum()),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "embed_ms_avg": round(1000 * self._embed_seconds / self._embeds, 3) if self._embeds else 0.0,
+            }
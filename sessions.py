@@ -0,0 +1,512 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from cache import redis_url
+from context import Summarizer, token_counter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Turn:
+    role: str
+    content: str
+    timestamp: float
+    tokens: int = 0
+    # Position in a persistent store, 0 until the turn has been stored
+    seq: int = 0
+    # Rendered context line and its token count per encoding, filled in by the ContextBuilder
+    rendered: Dict[str, Tuple[str, int]] = field(default_factory=dict, repr=False, compare=False)
+
+
+@dataclass
+class Session:
+    """
+    A conversation kept on the server.
+
+    The history is maintained incrementally: each turn is measured once when it is added,
+    and the oldest turns are dropped as soon as the history exceeds `token_budget`, so the
+    per-turn cost does not grow with conversation length. Dropped turns wait in `evicted`
+    until the SessionManager folds them into `summary` (or discards them). How much of the
+    history goes into a prompt is decided per request by the ContextBuilder.
+
+    Turns are recorded on worker threads while other requests of the same session read
+    the history, so both sides hold `lock`; readers take a `snapshot` rather than
+    iterating `turns` directly. Each store keeps one Session object per id in a process,
+    so concurrent requests of a session share it.
+    """
+
+    id: str
+    agent: str
+    token_budget: int = 4000
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    turns: Deque[Turn] = field(default_factory=deque)
+    history_tokens: int = 0
+    summary: str = ""
+    evicted: List[Turn] = field(default_factory=list)
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False, compare=False)
+
+    def snapshot(self) -> Tuple[List[Turn], str]:
+        """A consistent copy of the turns and the summary, safe to use without the lock."""
+        with self.lock:
+            return list(self.turns), self.summary
+
+    def add_turn(self, role: str, content: str, timestamp: Optional[float] = None) -> None:
+        if not content:
+            return
+        turn = Turn(role=role, content=content, timestamp=timestamp or time.time())
+        turn.tokens = token_counter.count(content)
+
+        with self.lock:
+            self.turns.append(turn)
+            self.history_tokens += turn.tokens
+            while len(self.turns) > 1 and self.history_tokens > self.token_budget:
+                dropped = self.turns.popleft()
+                self.history_tokens -= dropped.tokens
+                self.evicted.append(dropped)
+            self.updated_at = time.time()
+
+    def merge(self, stored: List[Turn], summary: str, updated_at: float) -> None:
+        """
+        Bring the history up to date with the turns of a persistent store, in their order.
+
+        Turns this object already holds are kept as they are (with their rendered context
+        lines), and turns not stored yet stay at the end. Turns beyond the budget are
+        dropped without being summarized again: whoever recorded after them did that.
+        """
+        with self.lock:
+            known = {turn.seq: turn for turn in self.turns if turn.seq}
+            pending = [turn for turn in self.turns if not turn.seq]
+            self.turns = deque([known.get(turn.seq, turn) for turn in stored] + pending)
+            self.history_tokens = sum(turn.tokens for turn in self.turns)
+            while len(self.turns) > 1 and self.history_tokens > self.token_budget:
+                self.history_tokens -= self.turns.popleft().tokens
+            self.summary = summary
+            self.updated_at = max(self.updated_at, updated_at)
+
+
+class MemorySessionStore:
+    """In-process session store with TTL expiry and LRU eviction."""
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 3600.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session.updated_at > self.ttl:
+                del self._sessions[session_id]
+                self._evictions += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def append(self, session: Session) -> None:
+        """Store the session; its new turns are already in the object every request shares."""
+        with self._lock:
+            self._sessions[session.id] = session
+            self._sessions.move_to_end(session.id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evictions += 1
+
+    def set_summary(self, session_id: str, summary: str) -> None:
+        session = self.get(session_id)
+        if session is not None:
+            with session.lock:
+                session.summary = summary
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions), "evictions": self._evictions}
+
+
+class PersistentSessionStore:
+    """
+    Shared part of the stores that keep sessions outside the process.
+
+    Turns are appended to the store, never rewritten with the rest of the session, so
+    concurrent turns of a session, from other threads or other workers, are all kept.
+    The store trims each session's turns to `token_budget` as the Session does. Each
+    process keeps one Session object per id (the `cache_size` most recent), brought up
+    to date from the store on every `get`, so requests of a session share it and the
+    rendered context lines of its turns are not rebuilt per request.
+    """
+
+    def __init__(self, ttl: float, token_budget: int, cache_size: int = 1024):
+        self.ttl = ttl
+        self.token_budget = token_budget
+        self.cache_size = cache_size
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+    def _load(self, session_id: str) -> Optional[Tuple[Dict[str, Any], List[Turn]]]:
+        """The session's `agent`, `created_at`, `updated_at` and `summary`, and its stored turns."""
+        raise NotImplementedError
+
+    def _append(self, session: Session, turns: List[Turn]) -> List[int]:
+        """Atomically add `turns` to the stored session, creating it if needed; returns their sequence numbers."""
+        raise NotImplementedError
+
+    def _set_summary(self, session_id: str, summary: str) -> None:
+        raise NotImplementedError
+
+    def _delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def _remember(self, session: Session) -> Session:
+        with self._sessions_lock:
+            session = self._sessions.setdefault(session.id, session)
+            self._sessions.move_to_end(session.id)
+            while len(self._sessions) > self.cache_size:
+                self._sessions.popitem(last=False)
+        return session
+
+    def _cached(self, session_id: str) -> Optional[Session]:
+        with self._sessions_lock:
+            return self._sessions.get(session_id)
+
+    def _forget(self, session_id: str) -> None:
+        with self._sessions_lock:
+            self._sessions.pop(session_id, None)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        loaded = self._load(session_id)
+        if loaded is None:
+            self._forget(session_id)
+            return None
+        record, turns = loaded
+        session = self._remember(
+            Session(id=session_id, agent=record["agent"], token_budget=self.token_budget, created_at=record["created_at"])
+        )
+        session.merge(turns, record["summary"], record["updated_at"])
+        return session
+
+    def append(self, session: Session) -> None:
+        """Store the turns of `session` that are not stored yet."""
+        # Held throughout, so turns another thread adds meanwhile are stored once, in order
+        with session.lock:
+            pending = [turn for turn in session.turns if not turn.seq]
+            if pending:
+                for turn, seq in zip(pending, self._append(session, pending)):
+                    turn.seq = seq
+        self._remember(session)
+
+    def set_summary(self, session_id: str, summary: str) -> None:
+        self._set_summary(session_id, summary)
+        session = self._cached(session_id)
+        if session is not None:
+            with session.lock:
+                session.summary = summary
+
+    def delete(self, session_id: str) -> None:
+        self._delete(session_id)
+        self._forget(session_id)
+
+
+class SQLiteSessionStore(PersistentSessionStore):
+    """Session store backed by a local SQLite database, shared by all workers on a host."""
+
+    def __init__(self, path: str = "sessions.db", ttl: float = 3600.0, token_budget: int = 4000):
+        super().__init__(ttl, token_budget)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_records ("
+            "id TEXT PRIMARY KEY, agent TEXT NOT NULL, created_at REAL NOT NULL, "
+            "updated_at REAL NOT NULL, summary TEXT NOT NULL DEFAULT '')"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_turns ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, role TEXT NOT NULL, "
+            "content TEXT NOT NULL, timestamp REAL NOT NULL, tokens INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS session_turns_session ON session_turns (session_id, seq)")
+        self._conn.commit()
+
+    def _load(self, session_id: str) -> Optional[Tuple[Dict[str, Any], List[Turn]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT agent, created_at, updated_at, summary FROM session_records WHERE id = ? AND updated_at > ?",
+                (session_id, time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT seq, role, content, timestamp, tokens FROM session_turns WHERE session_id = ? ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+        record = dict(zip(("agent", "created_at", "updated_at", "summary"), row))
+        turns = [Turn(role=role, content=content, timestamp=timestamp, tokens=tokens, seq=seq) for seq, role, content, timestamp, tokens in rows]
+        return record, turns
+
+    def _append(self, session: Session, turns: List[Turn]) -> List[int]:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO session_records (id, agent, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET updated_at = MAX(updated_at, excluded.updated_at)",
+                (session.id, session.agent, session.created_at, session.updated_at),
+            )
+            seqs = [
+                self._conn.execute(
+                    "INSERT INTO session_turns (session_id, role, content, timestamp, tokens) VALUES (?, ?, ?, ?, ?)",
+                    (session.id, turn.role, turn.content, turn.timestamp, turn.tokens),
+                ).lastrowid
+                for turn in turns
+            ]
+            # Keep the newest turns that fit the budget, and always the newest one
+            self._conn.execute(
+                "DELETE FROM session_turns WHERE seq IN (SELECT seq FROM ("
+                "SELECT seq, SUM(tokens) OVER w AS total, ROW_NUMBER() OVER w AS n "
+                "FROM session_turns WHERE session_id = ? WINDOW w AS (ORDER BY seq DESC)"
+                ") WHERE total > ? AND n > 1)",
+                (session.id, self.token_budget),
+            )
+            cutoff = time.time() - self.ttl
+            self._conn.execute(
+                "DELETE FROM session_turns WHERE session_id IN (SELECT id FROM session_records WHERE updated_at <= ?)",
+                (cutoff,),
+            )
+            self._conn.execute("DELETE FROM session_records WHERE updated_at <= ?", (cutoff,))
+        return seqs
+
+    def _set_summary(self, session_id: str, summary: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE session_records SET summary = ? WHERE id = ?", (summary, session_id))
+            self._conn.commit()
+
+    def _delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM session_records WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM session_records").fetchone()
+        return {"backend": "sqlite", "path": self.path, "sessions": count}
+
+
+# Appends turns to a session's list and trims it to the token budget (the newest turn is
+# always kept), creating the session record if needed; both keys expire together.
+# KEYS: record hash, turn list. ARGV: ttl, token budget, agent, created_at, updated_at, turns...
+APPEND_SCRIPT = """
+redis.call('HSETNX', KEYS[1], 'agent', ARGV[3])
+redis.call('HSETNX', KEYS[1], 'created_at', ARGV[4])
+redis.call('HSETNX', KEYS[1], 'summary', '')
+if tonumber(ARGV[5]) > tonumber(redis.call('HGET', KEYS[1], 'updated_at') or '0') then
+    redis.call('HSET', KEYS[1], 'updated_at', ARGV[5])
+end
+local seqs = {}
+for i = 6, #ARGV do
+    local turn = cjson.decode(ARGV[i])
+    turn.seq = redis.call('HINCRBY', KEYS[1], 'seq', 1)
+    redis.call('RPUSH', KEYS[2], cjson.encode(turn))
+    seqs[#seqs + 1] = turn.seq
+end
+local turns = redis.call('LRANGE', KEYS[2], 0, -1)
+local total, keep = 0, 0
+for i = #turns, 1, -1 do
+    total = total + cjson.decode(turns[i]).tokens
+    if total > tonumber(ARGV[2]) and keep > 0 then
+        break
+    end
+    keep = keep + 1
+end
+if keep < #turns then
+    redis.call('LTRIM', KEYS[2], -keep, -1)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return seqs
+"""
+
+# Sets the summary of a session that still exists, so an expired one is not recreated
+SUMMARY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], 'summary', ARGV[1])
+end
+"""
+
+
+class RedisSessionStore(PersistentSessionStore):
+    """
+    Session store in Redis (or a compatible server), shared by all workers on all hosts.
+
+    Each session is a hash with its details and a list of its turns, which expire
+    `ttl` seconds after its last update.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl: float = 3600.0, token_budget: int = 4000, prefix: str = "agentium:sessions"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ValueError("SESSION_BACKEND=redis requires the redis package (pip install redis)") from e
+
+        super().__init__(ttl, token_budget)
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._append_turns = self._redis.register_script(APPEND_SCRIPT)
+        self._set_summary_script = self._redis.register_script(SUMMARY_SCRIPT)
+
+    def _keys(self, session_id: str) -> Tuple[str, str]:
+        return f"{self.prefix}:{session_id}:record", f"{self.prefix}:{session_id}:turns"
+
+    def _load(self, session_id: str) -> Optional[Tuple[Dict[str, Any], List[Turn]]]:
+        record_key, turns_key = self._keys(session_id)
+        pipe = self._redis.pipeline()
+        pipe.hgetall(record_key)
+        pipe.lrange(turns_key, 0, -1)
+        data, items = pipe.execute()
+        if not data:
+            return None
+        record = {
+            "agent": data["agent"],
+            "created_at": float(data["created_at"]),
+            "updated_at": float(data.get("updated_at", data["created_at"])),
+            "summary": data.get("summary", ""),
+        }
+        turns = [Turn(**json.loads(item)) for item in items]
+        return record, turns
+
+    def _append(self, session: Session, turns: List[Turn]) -> List[int]:
+        encoded = [
+            json.dumps({"role": t.role, "content": t.content, "timestamp": t.timestamp, "tokens": t.tokens})
+            for t in turns
+        ]
+        seqs = self._append_turns(
+            keys=list(self._keys(session.id)),
+            args=[max(1, int(self.ttl)), self.token_budget, session.agent, session.created_at, session.updated_at, *encoded],
+        )
+        return [int(seq) for seq in seqs]
+
+    def _set_summary(self, session_id: str, summary: str) -> None:
+        self._set_summary_script(keys=[self._keys(session_id)[0]], args=[summary])
+
+    def _delete(self, session_id: str) -> None:
+        self._redis.delete(*self._keys(session_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "prefix": self.prefix}
+
+
+class SessionManager:
+    """
+    Creates sessions, persists them in a store and summarizes the turns they drop.
+
+    `token_budget` is the default context budget per request (agents may set their own
+    `context_tokens`); `history_tokens` is how much history each session keeps. With a
+    conversation history, a session that has expired from the store (or was lost in a
+    restart) is rebuilt from its recorded turns when the client continues it.
+    """
+
+    def __init__(
+        self,
+        store,
+        token_budget: int = 1000,
+        history_tokens: int = 4000,
+        summarizer: Optional[Summarizer] = None,
+        history=None,
+    ):
+        self.store = store
+        self.token_budget = token_budget
+        self.history_tokens = history_tokens
+        self.summarizer = summarizer
+        self.history = history
+        self.restored = 0
+
+    @classmethod
+    def from_env(cls, history=None) -> "SessionManager":
+        backend = os.getenv("SESSION_BACKEND", "memory").lower()
+        ttl = float(os.getenv("SESSION_TTL", "3600"))
+        token_budget = int(os.getenv("SESSION_CONTEXT_TOKENS", "1000"))
+        history_tokens = max(token_budget, int(os.getenv("SESSION_HISTORY_TOKENS", "4000")))
+
+        if backend == "sqlite":
+            store = SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "sessions.db"), ttl=ttl, token_budget=history_tokens)
+        elif backend == "redis":
+            store = RedisSessionStore(redis_url("SESSION"), ttl=ttl, token_budget=history_tokens)
+        elif backend == "memory":
+            store = MemorySessionStore(max_sessions=int(os.getenv("SESSION_MAX", "10000")), ttl=ttl)
+        else:
+            raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
+        summarizer = Summarizer.from_env()
+        logger.info(
+            f"Session store: backend={backend}, ttl={ttl}s, context_tokens={token_budget}, "
+            f"history_tokens={history_tokens}, summaries={'on' if summarizer else 'off'}"
+        )
+        return cls(store, token_budget=token_budget, history_tokens=history_tokens, summarizer=summarizer, history=history)
+
+    def get_or_create(self, session_id: Optional[str], agent: str) -> Session:
+        session = self.store.get(session_id) if session_id else None
+        if session is None and session_id and self.history is not None:
+            session = self.restore(session_id)
+        if session is None:
+            session = Session(id=session_id or uuid.uuid4().hex, agent=agent, token_budget=self.history_tokens)
+        return session
+
+    def restore(self, session_id: str) -> Optional[Session]:
+        """Rebuild a session from the conversation history; older turns than the budget holds are skipped."""
+        loaded = self.history.load(session_id)
+        if loaded is None:
+            return None
+        agent, turns = loaded
+        session = Session(id=session_id, agent=agent, token_budget=self.history_tokens)
+        for turn in turns:
+            session.add_turn(turn["role"], turn["content"], turn["timestamp"])
+        session.evicted.clear()
+        self.restored += 1
+        logger.info(f"Restored session {session_id} from history with {len(session.turns)} turns")
+        return session
+
+    def record_exchange(self, session: Session, query: str, response: str) -> None:
+        # Both turns go in together, so no reader sees a question without its answer
+        with session.lock:
+            session.add_turn("user", query)
+            session.add_turn("assistant", response)
+            evicted, session.evicted = session.evicted, []
+        self.store.append(session)
+        if evicted and self.summarizer is not None:
+            self.summarizer.submit(lambda: self._summarize(session.id, evicted))
+
+    def _summarize(self, session_id: str, turns: List[Turn]) -> None:
+        """Fold dropped turns into the session summary; runs on the summarizer thread."""
+        try:
+            session = self.store.get(session_id)
+            if session is None:
+                return
+            summary = self.summarizer.summarize(session.summary, turns)
+            if summary:
+                self.store.set_summary(session_id, summary)
+        except Exception as e:
+            logger.error(f"Could not summarize session {session_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.store.stats()
+        if self.history is not None:
+            stats["restored"] = self.restored
+        if self.summarizer is not None:
+            stats["summarizer"] = self.summarizer.stats()
+        return stats
@@ -0,0 +1,74 @@
+import os
+import threading
+import uuid
+
+import pytest
+
+from sessions import RedisSessionStore, SessionManager, SQLiteSessionStore
+
+THREADS = 8
+EXCHANGES = 5
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_store(request, tmp_path):
+    """Builds stores of one backend that share their data, like the workers of one deployment."""
+    if request.param == "sqlite":
+        path = str(tmp_path / "sessions.db")
+        yield lambda token_budget=100000: SQLiteSessionStore(path, token_budget=token_budget)
+        return
+
+    pytest.importorskip("redis")
+    url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    prefix = f"agentium:test:{uuid.uuid4().hex}"
+    try:
+        probe = RedisSessionStore(url, prefix=prefix)
+        probe._redis.ping()
+    except Exception as e:
+        pytest.skip(f"Redis is not reachable at {url}: {e}")
+    yield lambda token_budget=100000: RedisSessionStore(url, token_budget=token_budget, prefix=prefix)
+    for key in probe._redis.scan_iter(f"{prefix}:*"):
+        probe._redis.delete(key)
+
+
+def test_concurrent_turns_are_all_kept(make_store):
+    # Two workers, each with several threads recording turns of the same session
+    managers = [SessionManager(make_store(), history_tokens=100000) for _ in range(2)]
+    session_id = uuid.uuid4().hex
+
+    def converse(manager, thread):
+        for exchange in range(EXCHANGES):
+            session = manager.get_or_create(session_id, "general")
+            manager.record_exchange(session, f"question {thread} {exchange}", f"answer {thread} {exchange}")
+
+    threads = [
+        threading.Thread(target=converse, args=(managers[i % 2], i))
+        for i in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    session = make_store().get(session_id)
+    contents = [turn.content for turn in session.turns]
+    assert len(contents) == 2 * THREADS * EXCHANGES
+    # Every question is stored once, directly followed by its answer
+    questions = contents[0::2]
+    assert sorted(questions) == sorted(f"question {t} {e}" for t in range(THREADS) for e in range(EXCHANGES))
+    assert contents[1::2] == [q.replace("question", "answer") for q in questions]
+
+
+def test_sessions_are_shared_and_trimmed(make_store):
+    store = make_store(token_budget=30)
+    manager = SessionManager(store, history_tokens=30)
+    session = manager.get_or_create(uuid.uuid4().hex, "general")
+    for i in range(20):
+        manager.record_exchange(session, f"question number {i}", f"answer number {i}")
+
+    # The same object serves every request of the session in a process
+    assert store.get(session.id) is session
+    # Another worker sees the turns that fit the budget, as this one does
+    other = make_store(token_budget=30).get(session.id)
+    assert [t.content for t in other.turns] == [t.content for t in session.turns]
+    assert other.history_tokens <= 30
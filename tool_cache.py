@@ -0,0 +1,163 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from cache import RedisCache, TTLCache, redis_url
+
+logger = logging.getLogger(__name__)
+
+# Default TTLs in seconds per tool function; anything not listed is not cached
+DEFAULT_TOOL_TTLS: Dict[str, float] = {
+    # DuckDuckGo
+    "duckduckgo_search": 900,
+    "duckduckgo_news": 300,
+    # YFinance
+    "get_current_stock_price": 60,
+    "get_company_news": 900,
+    "get_analyst_recommendations": 3600,
+    "get_stock_fundamentals": 3600,
+    "get_historical_stock_prices": 3600,
+    "get_company_info": 86400,
+    # YouTube
+    "get_youtube_video_data": 86400,
+    "get_youtube_video_captions": 604800,
+    "get_video_timestamps": 604800,
+    # Newspaper4k
+    "read_article": 86400,
+}
+
+# Toolkits report failures as strings rather than raising; results starting with one of
+# these (case-insensitive) are returned to the model but never cached
+FAILURE_PREFIXES: Dict[str, tuple] = {
+    # YFinance
+    "get_current_stock_price": ("could not fetch current price",),
+    "get_company_info": ("could not fetch company info",),
+    # YouTube
+    "get_youtube_video_data": ("no url provided",),
+    "get_youtube_video_captions": ("no url provided", "no captions found"),
+    "get_video_timestamps": ("no url provided",),
+}
+# Every toolkit's exception path starts with "Error"
+COMMON_FAILURE_PREFIXES = ("error",)
+# Empty results, e.g. a throttled DuckDuckGo search returning no hits
+EMPTY_RESULTS = ("", "[]", "{}", "null")
+
+
+class ToolResultCache:
+    """
+    Bounded cache of tool results shared by every agent in the process.
+
+    Results are keyed by tool name and arguments. Concurrent identical calls are
+    collapsed into one: the first caller runs the tool and the others wait for its result.
+    """
+
+    def __init__(self, max_entries: int = 512, ttls: Optional[Dict[str, float]] = None, backend=None):
+        self.ttls = dict(DEFAULT_TOOL_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self._cache = backend if backend is not None else TTLCache(max_entries=max_entries)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls) -> "ToolResultCache":
+        ttls = {}
+        for tool_name in DEFAULT_TOOL_TTLS:
+            value = os.getenv(f"TOOL_CACHE_TTL_{tool_name.upper()}")
+            if value is not None:
+                ttls[tool_name] = float(value)
+        backend_name = os.getenv("TOOL_CACHE_BACKEND", "memory").lower()
+        if backend_name == "redis":
+            # Shared by every worker; tool results are strings (or JSON), so they serialize as-is
+            backend = RedisCache(redis_url("TOOL_CACHE"), prefix="agentium:tools")
+        elif backend_name == "memory":
+            backend = None
+        else:
+            raise ValueError(f"Unknown TOOL_CACHE_BACKEND: {backend_name}")
+        return cls(max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "512")), ttls=ttls, backend=backend)
+
+    @staticmethod
+    def make_key(tool_name: str, args: tuple, kwargs: Dict[str, Any]) -> str:
+        payload = json.dumps([tool_name, args, kwargs], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _is_cacheable(tool_name: str, result: Any) -> bool:
+        if result is None:
+            return False
+        if isinstance(result, str):
+            text = result.strip().lower()
+            if text in EMPTY_RESULTS:
+                return False
+            if text.startswith(COMMON_FAILURE_PREFIXES + FAILURE_PREFIXES.get(tool_name, ())):
+                return False
+        return True
+
+    def call(self, tool_name: str, func: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]) -> Any:
+        ttl = self.ttls.get(tool_name, 0)
+        if ttl <= 0:
+            return func(*args, **kwargs)
+
+        key = self.make_key(tool_name, args, kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            logger.info(f"Tool cache hit: {tool_name}")
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            logger.info(f"Waiting for in-flight call: {tool_name}")
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            if self._is_cacheable(tool_name, result):
+                self._cache.set(key, result, ttl)
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def wrap(self, tool_name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Wrap a tool function; the signature and docstring are kept for the model schema."""
+
+        @functools.wraps(func)
+        def cached_tool(*args: Any, **kwargs: Any) -> Any:
+            return self.call(tool_name, func, args, kwargs)
+
+        return cached_tool
+
+    def wrap_toolkit(self, toolkit):
+        """Route every function of an Agno toolkit through the cache, in place."""
+        for name, function in toolkit.functions.items():
+            if function.entrypoint is not None and not getattr(function.entrypoint, "_tool_cached", False):
+                function.entrypoint = self.wrap(name, function.entrypoint)
+                function.entrypoint._tool_cached = True
+        return toolkit
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            inflight = len(self._inflight)
+        return {**self._cache.stats(), "coalesced": self.coalesced, "in_flight": inflight}
+
+
+tool_cache = ToolResultCache.from_env()
@@ -0,0 +1,124 @@
+import io
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from agno.media import Image as AgnoImage
+from PIL import Image
+
+from images import ProcessedImage
+
+logger = logging.getLogger(__name__)
+
+
+def run_with_images_param(agent, query: str, images: List[ProcessedImage]):
+    """Pass the re-encoded image bytes as Agno images to run()."""
+    return agent.run(query, images=[AgnoImage(content=img.data, format=img.format) for img in images])
+
+
+def run_with_multimodal_message(agent, query: str, images: List[ProcessedImage]):
+    """Send a single OpenAI-style multimodal user message."""
+    message = {
+        "role": "user",
+        "content": [{"type": "text", "text": query}]
+        + [{"type": "image_url", "image_url": {"url": img.data_url()}} for img in images],
+    }
+    return agent.run(message)
+
+
+# Invocation formats in order of preference
+VISION_STRATEGIES: Dict[str, Callable[..., Any]] = {
+    "images_param": run_with_images_param,
+    "multimodal_message": run_with_multimodal_message,
+}
+
+
+def is_format_error(error: Optional[BaseException]) -> bool:
+    """
+    True if an exception (or its cause) means the model rejected the request's format.
+
+    Only these move on to the next strategy; rate limits, timeouts, cancellations and
+    server errors say nothing about the format and are raised as they are.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if getattr(error, "status_code", None) in (400, 422):
+            return True
+        if isinstance(error, (TypeError, ValueError)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def probe_image() -> ProcessedImage:
+    """A tiny white JPEG used to probe a model's vision input format cheaply."""
+    out = io.BytesIO()
+    Image.new("RGB", (8, 8), (255, 255, 255)).save(out, format="JPEG")
+    data = out.getvalue()
+    return ProcessedImage(sha256="probe", data=data, mime_type="image/jpeg", width=8, height=8, original_bytes=len(data))
+
+
+class VisionStrategySelector:
+    """
+    Remembers which invocation format works for each vision model.
+
+    The first run for a model (or an explicit probe) tries the strategies in order and
+    records the first one that succeeds. A strategy is skipped only when the model
+    rejects its format; any other failure is raised and nothing is recorded, so a
+    transient error cannot settle the choice. Every later run for that model uses only
+    the recorded strategy, so the vision path costs one model call.
+    """
+
+    def __init__(self, pinned: Optional[str] = None):
+        if pinned is not None and pinned not in VISION_STRATEGIES:
+            raise ValueError(f"Unknown VISION_STRATEGY: {pinned}")
+        self.pinned = pinned
+        self._chosen: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def strategy_for(self, model_id: str) -> Optional[str]:
+        if self.pinned:
+            return self.pinned
+        with self._lock:
+            return self._chosen.get(model_id)
+
+    def run(self, agent, model_id: str, query: str, images: List[ProcessedImage]):
+        """Run a vision request, discovering the invocation format on first use."""
+        strategy = self.strategy_for(model_id)
+        if strategy is not None:
+            return VISION_STRATEGIES[strategy](agent, query, images)
+
+        errors = []
+        for name, run_strategy in VISION_STRATEGIES.items():
+            try:
+                run_response = run_strategy(agent, query, images)
+            except Exception as e:
+                if not is_format_error(e):
+                    raise
+                logger.warning(f"Vision strategy {name} rejected by {model_id}: {e}")
+                errors.append(f"{name}: {e}")
+                continue
+            with self._lock:
+                self._chosen[model_id] = name
+            logger.info(f"Vision strategy for {model_id}: {name}")
+            return run_response
+
+        raise RuntimeError(f"All vision strategies failed: {'; '.join(errors)}")
+
+    def probe(self, agent, model_id: str) -> Optional[str]:
+        """Decide the strategy for a model up front with a tiny image; returns the choice."""
+        if self.strategy_for(model_id) is None:
+            try:
+                self.run(agent, model_id, "Reply with the single word OK.", [probe_image()])
+            except Exception as e:
+                logger.warning(f"Vision probe failed for {model_id}, will retry on first request: {e}")
+        return self.strategy_for(model_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"pinned": self.pinned, "strategies": dict(self._chosen)}
+
+
+vision_selector = VisionStrategySelector(pinned=os.getenv("VISION_STRATEGY") or None)